@@ -0,0 +1,123 @@
+#!/usr/bin/python3
+##############################################################################
+# Author: Carlos Lacaci Moya
+# Name: import_time.py
+# Description: Startup budget of the entry points. Imports every module in
+#              a fresh interpreter with 'python -X importtime' and fails if
+#              it takes longer than its budget or opens the USB database
+# Date: dom 18 oct 2026 20:41:55 CEST
+# Version: 1.0
+# Dependencies: See requirements.txt
+##############################################################################
+"""
+Usage:
+    import_time.py [--runs=<n>] [--scale=<factor>]
+    import_time.py -h
+
+Options:
+    --runs=<n>          imports per module, the fastest counts [default: 5]
+    --scale=<factor>    multiply the budgets, for slow machines [default: 1]
+    -h                  show this help
+"""
+import os
+import re
+import subprocess
+import sys
+from pathlib import Path
+
+from docopt import docopt  # type:ignore
+
+# Repository root, where the entry points live
+ROOT: Path = Path(__file__).parent.parent.absolute()
+
+# Milliseconds allowed to import each entry point
+BUDGETS: dict[str, float] = {
+    "pyusb": 40.0,
+    "manage_usb": 150.0,
+    "folders_to_watch": 150.0,
+    # Imported by the entry points once an option needs it
+    "mount_usb": 300.0,
+}
+
+# Imported without opening any of these files
+UNTOUCHED: list[str] = ["usbs.sqlite", "usbs.dbm", "folders.json"]
+
+# import time: self [us] | cumulative | imported package
+IMPORTTIME: re.Pattern = re.compile(
+    r"^import time:\s+\d+ \|\s+(\d+) \| (\S+)$")
+
+# Run in the child before the import: every file and database opened, even
+# the ones closed again (e.g. a shelve opened at class definition), is
+# printed once the import is done
+AUDIT_OPENS: str = """
+import os, sys
+opened = []
+
+def audit(event, args):
+    if event in ("open", "sqlite3.connect") and \\
+            isinstance(args[0], (str, bytes, os.PathLike)):
+        opened.append(os.fsdecode(args[0]))
+
+sys.addaudithook(audit)
+"""
+PRINT_OPENS: str = "print('\\n'.join(opened))"
+
+
+def import_time(module: str) -> tuple:
+    """ Return the milliseconds spent importing module and the files of
+    UNTOUCHED it opened """
+
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c",
+         f"{AUDIT_OPENS}\nimport {module}\n{PRINT_OPENS}"],
+        cwd=ROOT,
+        capture_output=True,
+        text=True)
+
+    if output.returncode != 0:
+        raise RuntimeError(output.stderr.strip().splitlines()[-1])
+
+    cumulative: float = 0.0
+    for line in output.stderr.splitlines():
+        if (match := IMPORTTIME.match(line)) and match.group(2) == module:
+            cumulative = int(match.group(1)) / 1000
+
+    opened: list = [
+        name for name in UNTOUCHED
+        if any(os.path.basename(path).startswith(name)
+               for path in output.stdout.splitlines())
+    ]
+    return cumulative, opened
+
+
+def main() -> int:
+    args = docopt(__doc__)  # type: ignore
+    runs: int = max(1, int(args["--runs"]))
+    scale: float = float(args["--scale"])
+
+    failed: bool = False
+    for module, budget in BUDGETS.items():
+        try:
+            timings: list = [import_time(module) for _ in range(runs)]
+        except RuntimeError as error:
+            print(f"{module:<18} ERROR {error}")
+            failed = True
+            continue
+
+        best: float = min(elapsed for elapsed, _ in timings)
+        opened: set = {name for _, names in timings for name in names}
+        status: str = "ok"
+        if best > budget * scale:
+            status = "OVER BUDGET"
+        if opened:
+            status = f"opened {', '.join(sorted(opened))}"
+        failed = failed or status != "ok"
+
+        print(f"{module:<18} {best:8.1f} ms  (budget {budget * scale:.0f} ms)"
+              f"  {status}")
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,278 @@
+#!/usr/bin/python3
+##############################################################################
+# Author: Carlos Lacaci Moya
+# Name: mount_path.py
+# Description: Benchmark of the mount path without USB hardware. Stub sudo,
+#              blkid, lsblk, mount and umount executables are put first on
+#              PATH and simulate N plugged devices with a fixed latency per
+#              call. Reports the time and the processes run by mount_all,
+#              mounted_usbs and _plugged_usbs for 1, 10 and 100 favorites
+# Date: dom 18 oct 2026 23:02:17 CEST
+# Version: 1.0
+# Dependencies: See requirements.txt
+##############################################################################
+"""
+Usage:
+    mount_path.py [--runs=<n>] [--latency=<ms>] [--sizes=<list>]
+                  [--output=<file>] [--compare=<file>] [--tolerance=<ratio>]
+    mount_path.py -h
+
+Options:
+    --runs=<n>          runs per scenario, the fastest counts [default: 3]
+    --latency=<ms>      milliseconds each stub tool takes [default: 5]
+    --sizes=<list>      favorite USBs registered, comma separated
+                        [default: 1,10,100]
+    --output=<file>     results, as JSON
+                        [default: benchmarks/mount_path.json]
+    --compare=<file>    results of a previous version. Fails if a scenario
+                        runs more processes or is slower than allowed
+    --tolerance=<ratio>
+                        slowdown allowed by --compare [default: 0.5]
+    -h                  show this help
+"""
+import contextlib
+import io
+import json
+import os
+import sys
+import tempfile
+import time
+from collections import Counter
+from pathlib import Path
+from typing import Any, Callable
+
+from docopt import docopt  # type:ignore
+
+# Repository root, where the modules benchmarked live
+ROOT: Path = Path(__file__).parent.parent.absolute()
+sys.path.insert(0, str(ROOT))
+
+from mount_table import MountState  # noqa: E402
+from mount_usb import CheckUsb, MountUsb, mount_all  # noqa: E402
+from database import CreateDatabase  # noqa: E402
+from registry import DeviceRegistry  # noqa: E402
+
+# Body of each stub after logging the call and waiting the latency.
+# lsblk is not used today: a change that starts forking it shows up in the
+# counts. install is run through sudo when a mount point needs root
+STUBS: dict[str, str] = {
+    "sudo": 'exec "$@"',
+    "blkid": 'cat "$PYUSB_BENCH_DIR/blkid.out"',
+    "lsblk": 'exit 0',
+    "mount": 'exit 0',
+    "umount": 'exit 0',
+    "install": 'exit 0',
+}
+
+# Devices that are plugged in but are not favorites
+OTHER_DEVICES: int = 3
+
+
+def write_stubs(folder: Path) -> None:
+    """ Create the stub executables. Every call appends its name to
+    $PYUSB_BENCH_LOG, so the processes of all the shells are counted """
+
+    for name, body in STUBS.items():
+        stub: Path = folder.joinpath(name)
+        stub.write_text(
+            "#!/bin/sh\n"
+            f'echo {name} >> "$PYUSB_BENCH_LOG"\n'
+            '[ "$PYUSB_BENCH_LATENCY" = 0 ] || '
+            'sleep "$PYUSB_BENCH_LATENCY"\n'
+            f"{body}\n")
+        stub.chmod(0o755)
+
+
+class Fixture:
+    """ N favorite USBs in a temporary registry, plugged in and known to
+    blkid, the udev symlinks and a mount table of their own.
+
+    warm: the registry already knows their UUIDs, as after the first
+    mount. Otherwise every USB is found through blkid """
+
+    def __init__(self, folder: Path, count: int, warm: bool) -> None:
+
+        self.folder: Path = folder
+        self.labels: list = [f"BENCH{number:03d}" for number in range(count)]
+        self.dev_root: Path = folder.joinpath("dev")
+        self.mountinfo: Path = folder.joinpath("mountinfo")
+
+        db_path: Path = folder.joinpath("usbs.sqlite")
+        # Created first with no usbs.dbm: nothing is migrated into it
+        registry = DeviceRegistry(db_path, folder.joinpath("usbs.dbm"))
+        registry.add(self.labels)
+
+        blkid: list = []
+        mountinfo: list = []
+        for number in range(count + OTHER_DEVICES):
+            devname: str = f"/dev/sd{chr(ord('b') + number // 16)}" \
+                f"{number % 16 + 1}"
+            uuid: str = f"{number:04X}-BE4C"
+            label: str = self.labels[number] if number < count else \
+                f"OTHER{number:03d}"
+            blkid.append(f"DEVNAME={devname}\nLABEL={label}\nUUID={uuid}\n"
+                         "TYPE=vfat\n")
+
+            for kind, name in (("by-uuid", uuid), ("by-label", label)):
+                link: Path = self.dev_root.joinpath("disk", kind, name)
+                link.parent.mkdir(parents=True, exist_ok=True)
+                link.symlink_to(self.dev_root.joinpath(devname[5:]))
+
+            if number < count:
+                mount_point: Path = folder.joinpath("media", label)
+                registry.update(label, mount_point=str(mount_point))
+                if warm:
+                    registry.seen(label, uuid, "vfat")
+                # The source the udev symlinks resolve to, so mounted_usbs
+                # finds it through the label and not the mount point
+                mountinfo.append(
+                    f"{100 + number} 1 8:{number} / {mount_point} "
+                    f"rw,relatime - vfat {self.dev_root}/{devname[5:]} "
+                    "rw,uid=1000")
+
+        folder.joinpath("blkid.out").write_text("\n".join(blkid))
+        self.mountinfo.write_text("\n".join(mountinfo) + "\n")
+
+        self.database = CreateDatabase(interactive=False, db_path=db_path)
+
+    def checker(self) -> Any:
+        """ CheckUsb of the fixture, with the blkid backend """
+
+        return CheckUsb(database=self.database,
+                        backend="blkid",
+                        dev_root=str(self.dev_root))
+
+
+def _mount_all(fixture: Fixture) -> Any:
+    return mount_all(usb_checker=fixture.checker())
+
+
+def _mounted_usbs(fixture: Fixture) -> Any:
+    mounter = MountUsb(usb_checker=fixture.checker(),
+                       mount_table=MountState(str(fixture.mountinfo)))
+    return mounter.mounted_usbs()
+
+
+def _plugged_usbs(fixture: Fixture) -> Any:
+    return fixture.checker()._plugged_usbs()
+
+
+# Scenario -> (function, warm registry)
+SCENARIOS: dict[str, tuple] = {
+    "mount_all/cold": (_mount_all, False),
+    "mount_all/warm": (_mount_all, True),
+    "mounted_usbs": (_mounted_usbs, True),
+    "_plugged_usbs/cold": (_plugged_usbs, False),
+    "_plugged_usbs/warm": (_plugged_usbs, True),
+}
+
+
+def run_once(function: Callable, count: int, warm: bool) -> tuple:
+    """ Run one scenario on a new fixture. Returns the seconds taken and
+    the processes run, by name """
+
+    with tempfile.TemporaryDirectory(prefix="pyusb-bench-") as temporary:
+        folder: Path = Path(temporary)
+        fixture = Fixture(folder, count, warm)
+        log: Path = Path(os.environ["PYUSB_BENCH_LOG"])
+        log.write_text("")
+        os.environ["PYUSB_BENCH_DIR"] = str(folder)
+
+        # The rich output is not part of the benchmark
+        with contextlib.redirect_stdout(io.StringIO()):
+            start: float = time.perf_counter()
+            function(fixture)
+            elapsed: float = time.perf_counter() - start
+
+        calls: Counter = Counter(log.read_text().split())
+
+    return elapsed, dict(sorted(calls.items()))
+
+
+def benchmark(sizes: list, runs: int) -> dict:
+    """ Best time and processes of every scenario and size """
+
+    results: dict = {}
+    for scenario, (function, warm) in SCENARIOS.items():
+        results[scenario] = {}
+        for count in sizes:
+            timings: list = [
+                run_once(function, count, warm) for _ in range(runs)
+            ]
+            calls: dict = max((calls for _, calls in timings),
+                              key=lambda calls: sum(calls.values()))
+            results[scenario][str(count)] = {
+                "seconds": round(min(elapsed for elapsed, _ in timings), 6),
+                "processes": sum(calls.values()),
+                "calls": calls,
+            }
+
+    return results
+
+
+def compare(results: dict, baseline: dict, tolerance: float) -> list:
+    """ Regressions against the results of a previous version """
+
+    regressions: list = []
+    for scenario, sizes in results.items():
+        for count, result in sizes.items():
+            before: Any = baseline.get(scenario, {}).get(count)
+            if before is None:
+                continue
+            name: str = f"{scenario} [{count}]"
+            if result["processes"] > before["processes"]:
+                regressions.append(f"{name}: {before['processes']} -> "
+                                   f"{result['processes']} processes")
+            if result["seconds"] > before["seconds"] * (1 + tolerance):
+                regressions.append(f"{name}: {before['seconds']:.3f} -> "
+                                   f"{result['seconds']:.3f} s")
+
+    return regressions
+
+
+def main() -> int:
+    args = docopt(__doc__)  # type: ignore
+    runs: int = max(1, int(args["--runs"]))
+    latency: float = float(args["--latency"])
+    sizes: list = [int(size) for size in args["--sizes"].split(",")]
+
+    with tempfile.TemporaryDirectory(prefix="pyusb-stubs-") as stubs:
+        write_stubs(Path(stubs))
+        os.environ["PATH"] = f"{stubs}{os.pathsep}{os.environ['PATH']}"
+        os.environ["PYUSB_BENCH_LOG"] = os.path.join(stubs, "calls.log")
+        os.environ["PYUSB_BENCH_LATENCY"] = f"{latency / 1000:g}"
+
+        results: dict = benchmark(sizes, runs)
+
+    for scenario, by_size in results.items():
+        for count, result in by_size.items():
+            calls: str = ", ".join(f"{name} {number}"
+                                   for name, number in result["calls"].items())
+            print(f"{scenario:<20} {count:>4} USBs "
+                  f"{result['seconds'] * 1000:9.1f} ms "
+                  f"{result['processes']:5} processes  {calls}")
+
+    report: dict = {
+        "latency_ms": latency,
+        "runs": runs,
+        "results": results,
+    }
+    output: Path = Path(args["--output"])
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2) + "\n")
+
+    if not args["--compare"]:
+        return 0
+
+    with open(args["--compare"]) as baseline_file:
+        baseline: dict = json.load(baseline_file)
+    regressions: list = compare(results, baseline["results"],
+                                float(args["--tolerance"]))
+    for regression in regressions:
+        print(f"REGRESSION {regression}")
+
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
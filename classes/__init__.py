@@ -1,2 +1,3 @@
+from classes.coalescer import Coalescer
 from classes.folders import Folders
 from classes.handler import Handler
@@ -0,0 +1,114 @@
+#!/usr/bin/python3
+
+##############################################################################
+# Author: Carlos Lacaci Moya
+
+# Description: Debounce and coalesce bursts of filesystem events into a
+#              single call of an action
+
+# Date: dom 18 oct 2026 14:02:37 CEST
+# Dependencies: See requirements.txt
+##############################################################################
+import threading
+import time
+from typing import Any, Callable
+
+
+class Coalescer:
+    """ Run action once per burst of events.
+
+    The action runs when no event arrived for 'quiet' seconds, or at the
+    latest 'max_delay' seconds after the first event of the burst. Events
+    arriving while the action runs produce a single follow-up run """
+
+    def __init__(self,
+                 action: Callable[[set], Any],
+                 quiet: float = 1.0,
+                 max_delay: float = 10.0) -> None:
+
+        # Called with the set of items notified during the burst
+        self.action: Callable[[set], Any] = action
+        self.quiet: float = quiet
+        self.max_delay: float = max(quiet, max_delay)
+
+        # Counters
+        self.events_received: int = 0
+        self.runs: int = 0
+
+        self._items: set = set()
+        self._first_event: float = 0.0
+        self._last_event: float = 0.0
+        self._pending: bool = False
+        self._stopped: bool = False
+        self._condition = threading.Condition()
+        self._thread: Any = None
+
+    @property
+    def events_coalesced(self) -> int:
+        """ Events that did not trigger a run of their own """
+        return self.events_received - self.runs
+
+    def notify(self, item: Any = None) -> None:
+        """ Register one event """
+
+        with self._condition:
+            now: float = time.monotonic()
+            self.events_received += 1
+
+            if not self._pending:
+                self._pending = True
+                self._first_event = now
+            self._last_event = now
+            if item is not None:
+                self._items.add(item)
+
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop,
+                                                daemon=True)
+                self._thread.start()
+
+            self._condition.notify()
+
+    def flush(self) -> None:
+        """ Run the pending burst now, without waiting """
+
+        with self._condition:
+            if self._pending:
+                self._first_event = self._last_event = -self.max_delay
+                self._condition.notify()
+
+    def stop(self) -> None:
+        """ Stop the worker thread. Pending events are dropped """
+
+        with self._condition:
+            self._stopped = True
+            self._condition.notify()
+
+    def _loop(self) -> None:
+        while True:
+            with self._condition:
+                while not self._pending and not self._stopped:
+                    self._condition.wait()
+
+                # Wait for the burst to calm down
+                while not self._stopped:
+                    deadline: float = min(self._last_event + self.quiet,
+                                          self._first_event + self.max_delay)
+                    remaining: float = deadline - time.monotonic()
+                    if remaining <= 0:
+                        break
+                    self._condition.wait(remaining)
+
+                if self._stopped:
+                    return
+
+                items: set = self._items
+                self._items = set()
+                self._pending = False
+
+            # New events during the run are kept for the follow-up run
+            try:
+                self.action(items)
+            except Exception as error:
+                print(f"[!] {error}")
+            self.runs += 1
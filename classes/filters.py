@@ -0,0 +1,234 @@
+#!/usr/bin/python3
+
+##############################################################################
+# Author: Carlos Lacaci Moya
+
+# Description: Per folder include/exclude rules from folders.json. Used to
+#              drop events, to filter the transfers and to leave the
+#              excluded subtrees out of the watches
+
+# Date: dom 18 oct 2026 18:10:04 CEST
+# Dependencies: See requirements.txt
+##############################################################################
+import os
+import re
+import shlex
+from collections import deque, namedtuple
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Optional
+
+# Rules starting with this prefix are regular expressions
+REGEX_PREFIX: str = "re:"
+
+# Default limit of watches a tracked folder is split into
+MAX_WATCHES: int = 32
+
+# Folders below a tracked folder, excluded ones left out. children and
+# mtimes are keyed by the path relative to the tracked folder ("" is the
+# folder itself). dirty holds the folders with an excluded folder below
+FolderScan = namedtuple('FolderScan', 'children, mtimes, dirty')
+
+
+@dataclass
+class PathFilter:
+    """ Include/exclude rules of a tracked folder.
+
+    Glob rules follow rsync, so events, the native engine and rsync agree.
+    A rule starting with "/" is anchored to the tracked folder
+    ("/Downloads"), the others match the end of the path at any depth
+    (".git", "*.swp", "src/*.o"). "*" and "?" do not match "/", "**"
+    does. A trailing "/" is ignored. Rules starting with "re:" are regular
+    expressions searched in the relative path: rsync has no equivalent,
+    they are only accepted by the native engine. include rules win over
+    exclude rules """
+
+    exclude: list = field(default_factory=list)
+    include: list = field(default_factory=list)
+
+    def __post_init__(self) -> None:
+        self._exclude: list = [_compile(rule) for rule in self.exclude]
+        self._include: list = [_compile(rule) for rule in self.include]
+
+    def __bool__(self) -> bool:
+        return bool(self.exclude)
+
+    def excluded(self, relative: str) -> bool:
+        """ True if the path, or one of its parent folders, is excluded """
+
+        if not self._exclude or not relative:
+            return False
+
+        parts: list = relative.strip("/").split("/")
+        for depth in range(1, len(parts) + 1):
+            if self.excluded_name("/".join(parts[:depth])):
+                return True
+
+        return False
+
+    def excluded_name(self, relative: str) -> bool:
+        """ True if the path itself is excluded, its parents not checked.
+        Enough while walking down a tree that skips excluded folders """
+
+        if any(_matches(rule, relative) for rule in self._include):
+            return False
+        return any(_matches(rule, relative) for rule in self._exclude)
+
+    def regex_rules(self) -> list:
+        """ The rules rsync can not apply """
+
+        return [
+            rule for rule in self.exclude + self.include
+            if rule.startswith(REGEX_PREFIX)
+        ]
+
+    def rsync_args(self) -> str:
+        """ The glob rules as rsync filter arguments. Regular expressions
+        are left out, see regex_rules() """
+
+        args: list = [
+            f"--include={shlex.quote(rule)}" for rule in self.include
+            if not rule.startswith(REGEX_PREFIX)
+        ]
+        args += [
+            f"--exclude={shlex.quote(rule)}" for rule in self.exclude
+            if not rule.startswith(REGEX_PREFIX)
+        ]
+        return " ".join(args)
+
+
+def _compile(rule: str) -> Any:
+    if rule.startswith(REGEX_PREFIX):
+        return re.compile(rule[len(REGEX_PREFIX):])
+
+    pattern: str = rule.rstrip("/")
+    if pattern.startswith("/"):
+        return re.compile(f"^{_glob(pattern[1:])}$")
+    # Unanchored: the end of the path, starting at a component
+    return re.compile(f"(?:^|/){_glob(pattern)}$")
+
+
+def _glob(pattern: str) -> str:
+    """ Translate an rsync wildcard pattern into a regular expression """
+
+    translated: list = []
+    index: int = 0
+    while index < len(pattern):
+        char: str = pattern[index]
+        if pattern.startswith("**", index):
+            translated.append(".*")
+            index += 2
+            continue
+        if char == "*":
+            translated.append("[^/]*")
+        elif char == "?":
+            translated.append("[^/]")
+        elif char == "\\" and index + 1 < len(pattern):
+            index += 1
+            translated.append(re.escape(pattern[index]))
+        elif char == "[" and (end := pattern.find("]", index + 2)) != -1:
+            members: str = pattern[index + 1:end]
+            if members[0] in "!^":
+                members = "^" + members[1:]
+            translated.append(f"[{members.replace(chr(92), chr(92) * 2)}]")
+            index = end
+        else:
+            translated.append(re.escape(char))
+        index += 1
+
+    return "".join(translated)
+
+
+def _matches(rule: Any, relative: str) -> bool:
+    return rule.search(relative) is not None
+
+
+def scan_folders(root: Any, path_filter: PathFilter) -> FolderScan:
+    """ Walk the folders below root once, skipping the excluded ones. The
+    watch plan and the watch budget are computed from this scan """
+
+    children: dict = {"": []}
+    mtimes: dict = {}
+    dirty: set = set()
+    pending: list = [""]
+
+    try:
+        mtimes[""] = os.stat(root).st_mtime
+    except OSError:
+        mtimes[""] = 0.0
+
+    while pending:
+        relative: str = pending.pop()
+        try:
+            entries: Any = os.scandir(os.path.join(root, relative))
+        except OSError:
+            continue
+
+        with entries:
+            for entry in entries:
+                try:
+                    if not entry.is_dir(follow_symlinks=False):
+                        continue
+                except OSError:
+                    continue
+                name: str = os.path.join(relative, entry.name)
+                # The parents were not excluded, or we would not be here
+                if path_filter.excluded_name(name):
+                    # Mark all the parents up to the root
+                    parent: str = relative
+                    while parent not in dirty:
+                        dirty.add(parent)
+                        if not parent:
+                            break
+                        parent = os.path.dirname(parent)
+                    continue
+                try:
+                    # A folder mtime changes when files are added, removed
+                    # or renamed in it
+                    mtimes[name] = entry.stat(follow_symlinks=False).st_mtime
+                except OSError:
+                    mtimes[name] = 0.0
+                children[relative].append(name)
+                children[name] = []
+                pending.append(name)
+
+    return FolderScan(children, mtimes, dirty)
+
+
+def watch_plan(root: Any,
+               path_filter: PathFilter,
+               max_watches: int = MAX_WATCHES,
+               scan: Optional[FolderScan] = None) -> list:
+    """ Return the (folder, recursive) watches that cover root without the
+    excluded subtrees.
+
+    A folder with excluded folders below it is watched non recursively and
+    its other subfolders get their own watch. Every watch costs an inotify
+    instance and a thread, so the split stops at max_watches: the rest is
+    watched recursively and Handler drops the excluded events. scan is
+    the scan_folders() of root, taken when not given """
+
+    if not path_filter:
+        return [(Path(root), True)]
+
+    if scan is None:
+        scan = scan_folders(root, path_filter)
+    plan: list = []
+    candidates: deque = deque([""])
+
+    while candidates:
+        relative: str = candidates.popleft()
+        folder: Path = Path(root).joinpath(relative)
+
+        if relative not in scan.dirty:
+            plan.append((folder, True))
+            continue
+
+        children: list = scan.children.get(relative, [])
+        if len(plan) + len(candidates) + 1 + len(children) > max_watches:
+            plan.append((folder, True))
+        else:
+            plan.append((folder, False))
+            candidates.extend(children)
+
+    return plan
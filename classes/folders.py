@@ -14,6 +14,7 @@ from pathlib import Path
 from helpers import abspath, BeautiPanel
 from dataclasses import dataclass, field
 from mount_usb import MountUsb
+from classes.filters import PathFilter
 
 
 @dataclass
@@ -51,3 +52,15 @@ class Folders:
             self.folders_dict[ftt] = ftc
 
         return self.folders_dict
+
+    def return_filters(self) -> dict[str, PathFilter]:
+        """ Produce the dictionary with the include/exclude rules of every
+        folder to watch """
+
+        filters: dict = {}
+        for key in self.json_file["Folders"]:
+            ftt: Path = Path.home().joinpath(key['folder_to_track'])
+            filters[ftt] = PathFilter(exclude=key.get('exclude', []),
+                                      include=key.get('include', []))
+
+        return filters
@@ -10,17 +10,67 @@
 # Date: lun 17 oct 2022 22:35:03 CEST
 # Dependencies: See requirements.txt
 ##############################################################################
+import os
+import threading
+import time
 from watchdog.events import FileSystemEventHandler
 from pathlib import Path
-from helpers import Notification, RunCommand
+from typing import Any, Optional
+from classes.coalescer import Coalescer
+from classes.filters import PathFilter
+from classes.journal import SyncJournal
+from classes.manifest import SyncManifest, scan_tree
+from classes.sync_engine import DELETED, ENGINES, FAILED
+from helpers import Notification
+from metrics import REGISTRY
+from mount_table import media_mount_point, mount_state
 
 popup: Notification = Notification()
 
+# Marker asking the coalescer for a full reconcile of the tree
+FULL_SYNC: str = ""
+
+
+def collapse_paths(paths: Any) -> list[str]:
+    """ Drop the paths already covered by one of their parent folders """
+
+    collapsed: list[str] = []
+    # Sorting by components keeps every folder right before its content
+    for path in sorted(paths, key=lambda path: path.split("/")):
+        if collapsed and (path == collapsed[-1]
+                          or path.startswith(f"{collapsed[-1]}/")):
+            continue
+        collapsed.append(path)
+
+    return collapsed
+
+
+def overlaps_failed(path: str, failed: set) -> bool:
+    """ True if a failed path is path itself, inside it or one of its
+    parent folders: what was synced below path can not be trusted """
+
+    return any(
+        failure == path or failure.startswith(f"{path}/")
+        or path.startswith(f"{failure}/") or not path or not failure
+        for failure in failed)
+
 
 class Handler(FileSystemEventHandler):
     """ Manage modifications in the folder specified """
 
-    def __init__(self, folder_to_track, folder_to_copy) -> None:
+    def __init__(self,
+                 folder_to_track,
+                 folder_to_copy,
+                 quiet: float = 1.0,
+                 max_delay: float = 10.0,
+                 reconcile_interval: float = 0.0,
+                 backend: str = "rsync",
+                 manifest: Any = None,
+                 dispatcher: Any = None,
+                 path_filter: Any = None,
+                 journal: Any = None,
+                 metrics: Any = None,
+                 mount_points: Any = ()) -> None:
 
         # user home() directory
         self.path: Path = Path.home()
@@ -31,16 +81,100 @@ class Handler(FileSystemEventHandler):
         # folder to copy to
         self.destination: Path = self.path.joinpath(folder_to_copy)
 
-        # synchronized folders
-        self._refresh_dest_folder()
+        # include/exclude rules of the folder in folders.json
+        self.path_filter: PathFilter = path_filter if path_filter \
+            is not None else PathFilter()
+
+        # Folders watched non recursively (see classes.filters.watch_plan)
+        # and the callback that schedules a watch on a new subfolder
+        self.shallow_watches: set = set()
+        self.watch_folder: Any = None
+
+        # "rsync" or "native"
+        self.engine: Any = ENGINES[backend](path_filter=self.path_filter)
+
+        # Per file results of the last sync
+        self.last_results: list = []
+
+        # What was synced last time, survives restarts
+        self.manifest: Any = manifest if manifest is not None \
+            else SyncManifest()
+
+        # Mount point of the USB holding the destination, None if it is
+        # not on removable media. Nothing is synced while it is not mounted.
+        # mount_points: the preferred ones of the favorites (registry)
+        self.mount_point: Optional[Path] = media_mount_point(
+            self.destination, mount_points)
+
+        # Paths changed while the destination was offline
+        self.journal: Any = journal if journal is not None \
+            else SyncJournal()
+        self._journaled: bool = bool(
+            self.journal.pending(self.origin, self.destination))
+
+        # Sync counts, durations and volumes (see metrics.py)
+        self.metrics: Any = metrics if metrics is not None else REGISTRY
+
+        # One sync at a time: initial sync, events and reconcile
+        self._sync_lock = threading.Lock()
+
+        # Queues the syncs in the worker of the destination (see
+        # classes.workers.SyncSupervisor). Without it they run right away
+        self.dispatcher: Any = dispatcher
+
+        # One sync per burst of events, only for the paths changed
+        self.coalescer: Coalescer = Coalescer(self._dispatch, quiet,
+                                              max_delay)
+
+        # The initial sync is run by the caller with initial_sync(), once
+        # the folder is being watched
+
+        # Safety net: full sync every reconcile_interval seconds
+        if reconcile_interval > 0:
+            threading.Thread(target=self._reconcile_loop,
+                             args=(reconcile_interval, ),
+                             daemon=True).start()
 
         popup.send_message(
             "WATCHDOG ON", f"Start monitoring the files on: {folder_to_track}")
 
+    @property
+    def events_received(self) -> int:
+        """ Filesystem events received """
+        return self.coalescer.events_received
+
+    @property
+    def syncs_run(self) -> int:
+        """ Syncs run because of events """
+        return self.coalescer.runs
+
+    @property
+    def online(self) -> bool:
+        """ True if the USB of the destination is mounted """
+        return self.mount_point is None or \
+            mount_state().is_mounted(self.mount_point)
+
+    def on_created(self, event) -> None:
+        """ Update the folder to watch on created events """
+
+        self._changed(event.src_path)
+
+        # New folder where the watch is not recursive: watch it too
+        if event.is_directory and self.watch_folder is not None and \
+                Path(event.src_path).parent in self.shallow_watches and \
+                not self.path_filter.excluded(
+                    os.path.relpath(event.src_path, self.origin)):
+            self.watch_folder(Path(event.src_path))
+
     def on_modified(self, event) -> None:
         """ Update the folder to watch on modified events """
 
-        self._refresh_dest_folder()
+        # A folder is modified when its content changes. The content
+        # sends its own events
+        if event.is_directory:
+            return
+
+        self._changed(event.src_path)
 
         # UNCOMMENT IF YOU WANT POPUP MESSAGES
         # popup.send_message(f"{self.origin.name}", "Modified")
@@ -48,7 +182,8 @@ class Handler(FileSystemEventHandler):
     def on_moved(self, event) -> None:
         """ Update the folder to watch  on move events """
 
-        self._refresh_dest_folder()
+        self._changed(event.src_path)
+        self._changed(event.dest_path)
 
         # UNCOMMENT IF YOU WANT POPUP MESSAGES
         # popup.send_message(f"{self.origin.name}", "Moved")
@@ -56,13 +191,179 @@ class Handler(FileSystemEventHandler):
     def on_deleted(self, event) -> None:
         """ Update the folder to watch on delete events """
 
-        self._refresh_dest_folder()
+        self._changed(event.src_path)
 
         # UNCOMMENT IF YOU WANT POPUP MESSAGES
         # popup.send_message(f"{self.origin.name}", "Deleted")
 
-    def _refresh_dest_folder(self) -> None:
-        """ Update the destination folder """
+    def reconcile(self) -> None:
+        """ Ask for a full sync of the folder, after the pending changes """
+
+        self.coalescer.notify(FULL_SYNC)
+
+    def replay(self) -> None:
+        """ Sync the journaled paths if the destination is back. Called
+        periodically by the main loop """
+
+        if self._journaled and self.online:
+            self._dispatch(set())
+
+    def _reconcile_loop(self, interval: float) -> None:
+        while True:
+            time.sleep(interval)
+            self.reconcile()
+
+    def _changed(self, path: str) -> None:
+        """ Queue the path, relative to the folder to watch """
+
+        relative: str = os.path.relpath(path, self.origin)
+        if relative == ".":
+            self.coalescer.notify(FULL_SYNC)
+        elif relative == ".." or relative.startswith("../"):
+            return
+        elif not self.path_filter.excluded(relative):
+            # Excluded paths are dropped before doing any work
+            self.coalescer.notify(relative)
+
+    def initial_sync(self) -> list:
+        """ Sync what changed since the last run according to the manifest.
+        Full sync if the pair was never synced """
+
+        snapshot: dict = scan_tree(self.origin, path_filter=self.path_filter)
+        delta: Optional[list] = self.manifest.delta(self.origin,
+                                                    self.destination, snapshot)
+
+        if not self.online:
+            # Synced when the USB is mounted
+            self._journal({FULL_SYNC} if delta is None else set(delta))
+            return []
+
+        journaled: set = self._pending_journal()
+        if delta is None:
+            results: list = self._refresh_dest_folder()
+        elif delta:
+            results = self._refresh_dest_folder(collapse_paths(delta))
+        else:
+            # Nothing changed
+            self.manifest.update(self.origin, self.destination, [])
+            self._discard_journal(journaled)
+            return []
+
+        if not any(result.action == FAILED for result in results):
+            self.manifest.record(self.origin, self.destination, snapshot)
+            # The delta covers whatever was journaled in a previous run
+            self._discard_journal(journaled)
+
+        return results
+
+    def _dispatch(self, paths: set) -> None:
+        """ Hand the burst over to the destination worker """
+
+        if self.dispatcher is None:
+            self._sync_changes(paths)
+        else:
+            self.dispatcher.submit(self, paths)
+
+    def _sync_changes(self, paths: set) -> None:
+        """ Sync only the paths changed, or everything if asked to """
+
+        if not self.online:
+            self._journal(paths)
+            return
+
+        # Back online: the paths changed meanwhile go in the same sync
+        journaled: set = self._pending_journal()
+        paths = set(paths) | journaled
+        if not paths:
+            return
+
+        if FULL_SYNC in paths:
+            snapshot: dict = scan_tree(self.origin,
+                                       path_filter=self.path_filter)
+            results: list = self._refresh_dest_folder()
+            if not any(result.action == FAILED for result in results):
+                self.manifest.record(self.origin, self.destination, snapshot)
+                self._discard_journal(journaled)
+            return
+
+        synced: list = collapse_paths(paths)
+        results = self._refresh_dest_folder(synced)
+
+        # Keep the manifest up to date, except for what failed
+        failed: set = {result.path for result in results
+                       if result.action == FAILED}
+        if "" not in failed:
+            self.manifest.update(
+                self.origin, self.destination,
+                [path for path in synced
+                 if not overlaps_failed(path, failed)], self.path_filter)
+            # What failed, and the folders holding it, stay in the journal
+            # for the next try
+            self._discard_journal({
+                path for path in journaled
+                if not overlaps_failed(path, failed)
+            })
+
+    def _journal(self, paths: set) -> None:
+        """ Keep the paths until the destination is mounted again """
+
+        if paths:
+            self.journal.add(self.origin, self.destination, paths)
+            self._journaled = True
+
+    def _pending_journal(self) -> set:
+        if not self._journaled:
+            return set()
+        return self.journal.pending(self.origin, self.destination)
+
+    def _discard_journal(self, journaled: set) -> None:
+        if not journaled:
+            return
+        self.journal.discard(self.origin, self.destination, journaled)
+        self._journaled = bool(
+            self.journal.pending(self.origin, self.destination))
+
+    def _refresh_dest_folder(self, paths: Optional[list] = None) -> list:
+        """ Update the destination folder.
+
+        With paths, only those files and folders (relative to the folder to
+        watch) are synced. The ones missing in origin are deleted """
+
+        with self._sync_lock:
+            start: float = time.monotonic()
+            self.last_results = self.engine.sync(self.origin,
+                                                 self.destination, paths)
+            self._record(self.last_results, time.monotonic() - start)
+        return self.last_results
+
+    def _record(self, results: list, elapsed: float) -> None:
+        """ Metrics of one sync """
+
+        labels: dict = {"destination": str(self.destination)}
+        stats: dict = self.engine.stats
+
+        self.metrics.inc("pyusb_syncs_total", "Syncs run", **labels)
+        self.metrics.observe("pyusb_sync_duration_seconds",
+                             "Duration of the syncs", elapsed, **labels)
+        self.metrics.inc("pyusb_sync_bytes_total", "Bytes transferred",
+                         stats.get("bytes", 0), **labels)
+        self.metrics.inc("pyusb_sync_files_total",
+                         "Files transferred or deleted",
+                         stats.get("files", 0),
+                         action="copied",
+                         **labels)
+        self.metrics.inc("pyusb_sync_files_total",
+                         "Files transferred or deleted",
+                         sum(1 for result in results
+                             if result.action == DELETED),
+                         action="deleted",
+                         **labels)
 
-        cmd: str = f"rsync -rt {self.origin}/ {self.destination}/ --delete"
-        RunCommand.run(cmd)
+        if any(result.action == FAILED for result in results):
+            self.metrics.inc("pyusb_sync_failures_total",
+                             "Syncs with failed files", **labels)
+        else:
+            # Backup lag: time() - this
+            self.metrics.set("pyusb_last_sync_timestamp_seconds",
+                             "End of the last sync without failures",
+                             time.time(), **labels)
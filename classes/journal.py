@@ -0,0 +1,99 @@
+#!/usr/bin/python3
+
+##############################################################################
+# Author: Carlos Lacaci Moya
+
+# Description: Offline sync journal. While the USB of a destination is not
+#              mounted, the paths changed are written here instead of
+#              being synced. On the next mount they are synced in one go
+
+# Date: dom 18 oct 2026 19:48:12 CEST
+# Dependencies: See requirements.txt
+##############################################################################
+import sqlite3
+from contextlib import closing
+from pathlib import Path
+from typing import Any, Iterable
+
+from classes.manifest import MANIFEST_PATH
+
+# A journal with more paths than this is replaced by one full sync: the
+# sync engine compares the whole tree faster than it replays them
+JOURNAL_LIMIT: int = 50000
+
+# Journaled instead of the paths: sync everything, like the FULL_SYNC
+# marker of classes.handler
+FULL_SYNC: str = ""
+
+SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS journal (
+    origin TEXT NOT NULL,
+    destination TEXT NOT NULL,
+    path TEXT NOT NULL,
+    PRIMARY KEY (origin, destination, path)
+) WITHOUT ROWID;
+"""
+
+
+class SyncJournal:
+    """ Paths waiting for their destination to be mounted. Every path is
+    stored once, however many times it changed """
+
+    def __init__(self,
+                 db_path: Any = MANIFEST_PATH,
+                 limit: int = JOURNAL_LIMIT) -> None:
+
+        # Same database as the sync manifest
+        self.db_path: Path = Path(db_path)
+        self.limit: int = limit
+
+        with self._connect() as db:
+            db.executescript(SCHEMA)
+
+    def _connect(self) -> Any:
+        """ One short connection per operation: safe from any thread """
+
+        db: sqlite3.Connection = sqlite3.connect(self.db_path, timeout=30)
+        return closing(db)
+
+    def add(self, origin: Path, destination: Path,
+            paths: Iterable[str]) -> None:
+        """ Journal the paths changed while the destination is offline """
+
+        pair: tuple = (str(origin), str(destination))
+        with self._connect() as db, db:
+            db.executemany(
+                "INSERT OR IGNORE INTO journal (origin, destination, path) "
+                "VALUES (?, ?, ?)", ((*pair, path) for path in paths))
+
+            count: int = db.execute(
+                "SELECT COUNT(*) FROM journal "
+                "WHERE origin = ? AND destination = ?", pair).fetchone()[0]
+            if count > self.limit:
+                db.execute(
+                    "DELETE FROM journal WHERE origin = ? AND destination = ?",
+                    pair)
+                db.execute(
+                    "INSERT INTO journal (origin, destination, path) "
+                    "VALUES (?, ?, ?)", (*pair, FULL_SYNC))
+
+    def pending(self, origin: Path, destination: Path) -> set:
+        """ Paths journaled for the pair """
+
+        with self._connect() as db:
+            return {
+                path for path, in db.execute(
+                    "SELECT path FROM journal "
+                    "WHERE origin = ? AND destination = ?",
+                    (str(origin), str(destination)))
+            }
+
+    def discard(self, origin: Path, destination: Path,
+                paths: Iterable[str]) -> None:
+        """ Forget the paths once they are synced """
+
+        with self._connect() as db, db:
+            db.executemany(
+                "DELETE FROM journal "
+                "WHERE origin = ? AND destination = ? AND path = ?",
+                ((str(origin), str(destination), path) for path in paths))
@@ -0,0 +1,210 @@
+#!/usr/bin/python3
+
+##############################################################################
+# Author: Carlos Lacaci Moya
+
+# Description: Persistent sync manifest. Remembers, for every pair of
+#              folder_to_track and folder_to_copy_to, the files synced and
+#              when, so a restart only syncs what changed meanwhile
+
+# Date: dom 18 oct 2026 16:03:19 CEST
+# Dependencies: See requirements.txt
+##############################################################################
+import os
+import sqlite3
+import time
+import uuid
+from contextlib import closing
+from pathlib import Path
+from typing import Any, Iterable, Optional
+
+from classes.sync_engine import MANIFEST_MARKER
+
+# Next to the device registry (usbs.sqlite)
+MANIFEST_PATH: Path = Path(__file__).parent.parent.absolute().joinpath(
+    "sync_manifest.sqlite")
+
+# File written in the destination. If it is missing or has another token
+# the destination is not the one in the manifest (e.g. a new stick)
+MARKER_NAME: str = MANIFEST_MARKER
+
+# Folders are stored with this size, only their presence matters
+FOLDER: int = -1
+
+SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS pairs (
+    id INTEGER PRIMARY KEY,
+    origin TEXT NOT NULL,
+    destination TEXT NOT NULL,
+    token TEXT NOT NULL,
+    last_sync REAL,
+    UNIQUE (origin, destination)
+);
+CREATE TABLE IF NOT EXISTS files (
+    pair_id INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    mtime_ns INTEGER NOT NULL,
+    PRIMARY KEY (pair_id, path)
+) WITHOUT ROWID;
+"""
+
+
+def scan_tree(origin: Path,
+              relative: str = "",
+              path_filter: Any = None) -> dict[str, tuple]:
+    """ Return {relative path: (size, mtime_ns)} for the regular files and
+    folders below origin. Symlinks and the paths excluded by path_filter
+    are skipped like the sync engines do """
+
+    snapshot: dict[str, tuple] = {}
+    pending: list[str] = [relative]
+
+    while pending:
+        current: str = pending.pop()
+        try:
+            entries: Any = os.scandir(os.path.join(origin, current))
+        except OSError:
+            continue
+
+        with entries:
+            for entry in entries:
+                name: str = os.path.join(current, entry.name)
+                if path_filter and path_filter.excluded_name(name):
+                    continue
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        snapshot[name] = (FOLDER, 0)
+                        pending.append(name)
+                    elif entry.is_file(follow_symlinks=False):
+                        status: os.stat_result = entry.stat(
+                            follow_symlinks=False)
+                        snapshot[name] = (status.st_size, status.st_mtime_ns)
+                except OSError:
+                    continue
+
+    return snapshot
+
+
+class SyncManifest:
+    """ SQLite record of the last successful sync of every pair """
+
+    def __init__(self, db_path: Any = MANIFEST_PATH) -> None:
+
+        self.db_path: Path = Path(db_path)
+
+        with self._connect() as db:
+            db.executescript(SCHEMA)
+
+    def _connect(self) -> Any:
+        """ One short connection per operation: safe from any thread """
+
+        db: sqlite3.Connection = sqlite3.connect(self.db_path, timeout=30)
+        return closing(db)
+
+    def _pair(self, db: Any, origin: Path, destination: Path) -> Any:
+        return db.execute(
+            "SELECT id, token, last_sync FROM pairs "
+            "WHERE origin = ? AND destination = ?",
+            (str(origin), str(destination))).fetchone()
+
+    def delta(self, origin: Path, destination: Path,
+              snapshot: dict) -> Optional[list]:
+        """ Paths that changed since the last sync, relative to origin.
+
+        None means a full sync is needed: the pair was never synced or the
+        destination is not the one recorded """
+
+        with self._connect() as db:
+            pair: Any = self._pair(db, origin, destination)
+            if pair is None or _read_marker(destination) != pair[1]:
+                return None
+
+            recorded: dict = {
+                path: (size, mtime_ns)
+                for path, size, mtime_ns in db.execute(
+                    "SELECT path, size, mtime_ns FROM files WHERE pair_id = ?",
+                    (pair[0], ))
+            }
+
+        changed: list = [
+            path for path, metadata in snapshot.items()
+            if recorded.pop(path, None) != metadata
+        ]
+        # Left in the manifest: deleted from origin
+        return changed + list(recorded)
+
+    def record(self, origin: Path, destination: Path, snapshot: dict) -> None:
+        """ Store the snapshot of a fully synced pair """
+
+        with self._connect() as db, db:
+            pair: Any = self._pair(db, origin, destination)
+            token: str = pair[1] if pair is not None else ""
+
+            if token != _read_marker(destination) or not token:
+                token = uuid.uuid4().hex
+                _write_marker(destination, token)
+
+            db.execute(
+                "INSERT INTO pairs (origin, destination, token, last_sync) "
+                "VALUES (?, ?, ?, ?) ON CONFLICT (origin, destination) "
+                "DO UPDATE SET token = excluded.token, "
+                "last_sync = excluded.last_sync",
+                (str(origin), str(destination), token, time.time()))
+            pair_id: int = self._pair(db, origin, destination)[0]
+
+            db.execute("DELETE FROM files WHERE pair_id = ?", (pair_id, ))
+            db.executemany(
+                "INSERT INTO files (pair_id, path, size, mtime_ns) "
+                "VALUES (?, ?, ?, ?)",
+                ((pair_id, path, size, mtime_ns)
+                 for path, (size, mtime_ns) in snapshot.items()))
+
+    def update(self,
+               origin: Path,
+               destination: Path,
+               paths: Iterable[str],
+               path_filter: Any = None) -> None:
+        """ Refresh the entries of the paths synced incrementally """
+
+        with self._connect() as db, db:
+            pair: Any = self._pair(db, origin, destination)
+            if pair is None:
+                return
+
+            for path in paths:
+                # The path and everything below it
+                db.execute(
+                    "DELETE FROM files WHERE pair_id = ? "
+                    "AND (path = ? OR path >= ? AND path < ?)",
+                    (pair[0], path, f"{path}/", f"{path}0"))
+
+                full_path: Path = Path(origin).joinpath(path)
+                snapshot: dict = {}
+                if full_path.is_dir() and not full_path.is_symlink():
+                    snapshot = scan_tree(origin, path, path_filter)
+                    snapshot[path] = (FOLDER, 0)
+                elif full_path.is_file() and not full_path.is_symlink():
+                    status: os.stat_result = full_path.stat()
+                    snapshot[path] = (status.st_size, status.st_mtime_ns)
+
+                db.executemany(
+                    "INSERT OR REPLACE INTO files "
+                    "(pair_id, path, size, mtime_ns) VALUES (?, ?, ?, ?)",
+                    ((pair[0], name, size, mtime_ns)
+                     for name, (size, mtime_ns) in snapshot.items()))
+
+            db.execute("UPDATE pairs SET last_sync = ? WHERE id = ?",
+                       (time.time(), pair[0]))
+
+
+def _read_marker(destination: Path) -> str:
+    try:
+        return Path(destination).joinpath(MARKER_NAME).read_text().strip()
+    except OSError:
+        return ""
+
+
+def _write_marker(destination: Path, token: str) -> None:
+    Path(destination).mkdir(parents=True, exist_ok=True)
+    Path(destination).joinpath(MARKER_NAME).write_text(token)
@@ -0,0 +1,412 @@
+#!/usr/bin/python3
+
+##############################################################################
+# Author: Carlos Lacaci Moya
+
+# Description: Sync engines used by Handler. RsyncEngine runs rsync,
+#              NativeEngine compares the trees with os.scandir and copies
+#              with copy_file_range/sendfile. Both mirror origin into
+#              destination like 'rsync -rt --delete' and return one result
+#              per file
+
+# Date: dom 18 oct 2026 15:11:52 CEST
+# Dependencies: See requirements.txt
+##############################################################################
+import hashlib
+import os
+import re
+import shlex
+import shutil
+from collections import namedtuple
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Optional
+
+from helpers import RunCommand
+
+# What happened to one file. path is relative to the synced folders
+FileResult = namedtuple('FileResult', 'path, action, size, error',
+                        defaults=(0, ""))
+
+COPIED: str = "copied"
+DELETED: str = "deleted"
+FAILED: str = "failed"
+
+# Bytes copied per system call
+CHUNK_SIZE: int = 8 * 1024 * 1024
+
+# Written by the sync manifest in the root of the destination. Never
+# deleted even though it does not exist in origin
+MANIFEST_MARKER: str = ".pyusb-manifest"
+
+# Lines of 'rsync --stats'. Older versions say "Number of files transferred"
+RSYNC_FILES: Any = re.compile(
+    r"^Number of (?:regular )?files transferred: ([\d,.]+)", re.MULTILINE)
+RSYNC_BYTES: Any = re.compile(r"^Total transferred file size: ([\d,.]+)",
+                              re.MULTILINE)
+
+
+def _count(pattern: Any, output: str) -> int:
+    match: Any = pattern.search(output)
+    return int(re.sub(r"[,.]", "", match.group(1))) if match else 0
+
+
+@dataclass
+class RsyncEngine:
+    """ Mirror the folders with an external rsync """
+
+    # classes.filters.PathFilter of the tracked folder
+    path_filter: Any = field(default=None)
+    # Files and bytes transferred by the last sync, from 'rsync --stats'
+    stats: dict = field(default_factory=dict, init=False)
+
+    def __post_init__(self) -> None:
+        # Silently copying what the user excluded is worse than refusing
+        if self.path_filter is not None and \
+                (rules := self.path_filter.regex_rules()):
+            raise ValueError(
+                f"rsync can not apply the rules {', '.join(rules)}: use the "
+                "native backend or glob rules")
+
+    def sync(self,
+             origin: Path,
+             destination: Path,
+             paths: Optional[list] = None) -> list:
+        """ Mirror origin into destination. With paths, only those files
+        and folders (relative to origin) are synced """
+
+        # %o: send/del., %l: file length, %n: file name
+        out_format: str = (f"--out-format='%o %l %n' --stats "
+                           f"--filter='P /{MANIFEST_MARKER}'")
+        if self.path_filter:
+            out_format += f" {self.path_filter.rsync_args()}"
+
+        # Labels can have spaces: /media/MY STICK
+        source: str = shlex.quote(f"{origin}/")
+        target: str = shlex.quote(f"{destination}/")
+
+        if paths is None:
+            cmd: str = f"rsync -rt {out_format} {source} {target} --delete"
+            output: Any = RunCommand.run(cmd)
+        else:
+            cmd = (f"rsync -rt {out_format} --delete --delete-missing-args "
+                   f"--from0 --files-from=- {source} {target}")
+            output = RunCommand.run(cmd, input="\0".join(paths))
+
+        self.stats = {
+            "files": _count(RSYNC_FILES, output.stdout),
+            "bytes": _count(RSYNC_BYTES, output.stdout),
+        }
+        return self._results(output)
+
+    @staticmethod
+    def _results(output: Any) -> list:
+        results: list = []
+        for line in output.stdout.splitlines():
+            operation, _, rest = line.partition(" ")
+            length, _, name = rest.partition(" ")
+            if operation == "send" and not name.endswith("/"):
+                results.append(FileResult(name, COPIED, int(length or 0)))
+            elif operation == "del.":
+                results.append(FileResult(name.rstrip("/"), DELETED))
+
+        if output.returncode != 0:
+            results.append(FileResult("", FAILED, 0, output.stderr.strip()))
+
+        return results
+
+
+@dataclass
+class NativeEngine:
+    """ Mirror the folders in-process: compare size and mtime (or the
+    content with checksum=True) and copy with the zero-copy syscalls.
+
+    Like 'rsync -rt': only regular files and folders, mtimes preserved,
+    symlinks and special files skipped """
+
+    checksum: bool = field(default=False)
+    # Seconds of mtime difference considered equal (FAT stores 2s steps)
+    modify_window: float = field(default=0)
+    # classes.filters.PathFilter of the tracked folder. Excluded files are
+    # neither copied nor deleted, like rsync --exclude
+    path_filter: Any = field(default=None)
+    # Files and bytes transferred by the last sync, like RsyncEngine
+    stats: dict = field(default_factory=dict, init=False)
+
+    def sync(self,
+             origin: Path,
+             destination: Path,
+             paths: Optional[list] = None) -> list:
+        """ Mirror origin into destination. With paths, only those files
+        and folders (relative to origin) are synced """
+
+        results: list = []
+        origin, destination = Path(origin), Path(destination)
+
+        if paths is None:
+            self._sync_dir(origin, destination, "", results)
+            return self._stats(results)
+
+        for path in paths:
+            if self.path_filter and self.path_filter.excluded(path):
+                continue
+
+            source: Path = origin.joinpath(path)
+            target: Path = destination.joinpath(path)
+
+            # A failed path never stops the sync of the others
+            try:
+                if source.is_symlink() or not source.exists():
+                    self._delete(target, path, results)
+                elif source.is_dir():
+                    if target.is_symlink() or target.is_file():
+                        self._delete(target, path, results)
+                    self._sync_dir(source, target, path, results)
+                elif source.is_file():
+                    target.parent.mkdir(parents=True, exist_ok=True)
+                    self._sync_file(source, source.stat(), target, path,
+                                    results)
+            except FileNotFoundError:
+                # Vanished since the check: its delete event follows
+                continue
+            except OSError as error:
+                results.append(FileResult(path, FAILED, 0, str(error)))
+
+        return self._stats(results)
+
+    def _stats(self, results: list) -> list:
+        copied: list = [result for result in results if result.action == COPIED]
+        self.stats = {
+            "files": len(copied),
+            "bytes": sum(result.size for result in copied),
+        }
+        return results
+
+    def _sync_dir(self, source: Path, target: Path, relative: str,
+                  results: list) -> None:
+        """ Mirror the content of one folder, recursively. Like rsync,
+        what vanishes or can not be read during the walk is reported per
+        file and the rest of the folder is still synced """
+
+        try:
+            entries: Any = os.scandir(source)
+        except FileNotFoundError:
+            # Vanished since it was listed: its delete event follows
+            return
+        except OSError as error:
+            results.append(FileResult(relative, FAILED, 0, str(error)))
+            return
+
+        try:
+            with os.scandir(target) as dest_entries:
+                existing: dict = {entry.name: entry for entry in dest_entries}
+        except FileNotFoundError:
+            existing = {}
+            try:
+                target.mkdir(parents=True)
+            except OSError as error:
+                entries.close()
+                results.append(FileResult(relative, FAILED, 0, str(error)))
+                return
+        except OSError as error:
+            entries.close()
+            results.append(FileResult(relative, FAILED, 0, str(error)))
+            return
+
+        with entries:
+            for entry in entries:
+                name: str = os.path.join(relative, entry.name)
+                dest_entry: Any = existing.pop(entry.name, None)
+                dest_path: Path = target.joinpath(entry.name)
+
+                if self.path_filter and \
+                        self.path_filter.excluded_name(name):
+                    continue
+
+                try:
+                    self._sync_entry(entry, dest_entry, dest_path, name,
+                                     existing, results)
+                except FileNotFoundError:
+                    # Vanished during the walk: mirrored as deleted
+                    if dest_entry is not None:
+                        existing[entry.name] = dest_entry
+                except OSError as error:
+                    # Unreadable: the copy in the destination is kept
+                    results.append(FileResult(name, FAILED, 0, str(error)))
+
+        if not relative:
+            existing.pop(MANIFEST_MARKER, None)
+
+        # Excluded files only in the destination are kept as well
+        if self.path_filter:
+            existing = {
+                name: dest_entry
+                for name, dest_entry in existing.items()
+                if not self.path_filter.excluded_name(
+                    os.path.join(relative, name))
+            }
+
+        # Whatever is left only exists in the destination
+        for name, dest_entry in existing.items():
+            self._delete(Path(dest_entry.path), os.path.join(relative, name),
+                         results)
+
+        try:
+            status: os.stat_result = source.stat()
+            os.utime(target, ns=(status.st_atime_ns, status.st_mtime_ns))
+        except FileNotFoundError:
+            pass
+        except OSError as error:
+            results.append(FileResult(relative, FAILED, 0, str(error)))
+
+    def _sync_entry(self, entry: Any, dest_entry: Any, dest_path: Path,
+                    name: str, existing: dict, results: list) -> None:
+        """ Sync one entry of the folder being walked """
+
+        if entry.is_dir(follow_symlinks=False):
+            if dest_entry is not None and not dest_entry.is_dir(
+                    follow_symlinks=False):
+                self._delete(dest_path, name, results)
+            self._sync_dir(Path(entry.path), dest_path, name, results)
+        elif entry.is_file(follow_symlinks=False):
+            status: os.stat_result = entry.stat(follow_symlinks=False)
+            if dest_entry is not None and dest_entry.is_dir(
+                    follow_symlinks=False):
+                self._delete(dest_path, name, results)
+                dest_entry = None
+            self._sync_file(Path(entry.path), status, dest_path, name,
+                            results, dest_entry)
+        elif dest_entry is not None:
+            # Symlinks and special files are skipped, like rsync -rt
+            existing[entry.name] = dest_entry
+
+    def _sync_file(self,
+                   source: Path,
+                   status: os.stat_result,
+                   target: Path,
+                   relative: str,
+                   results: list,
+                   dest_entry: Any = None) -> None:
+        """ Copy the file if it changed """
+
+        try:
+            dest_status: Any = (dest_entry.stat(follow_symlinks=False)
+                                if dest_entry is not None else target.stat())
+        except OSError:
+            dest_status = None
+
+        try:
+            if dest_status is not None and self._unchanged(
+                    source, status, target, dest_status):
+                return
+        except OSError:
+            # Checksum not readable: copied again
+            pass
+
+        try:
+            copy_file(source, target, status)
+        except OSError as error:
+            results.append(FileResult(relative, FAILED, 0, str(error)))
+            return
+
+        results.append(FileResult(relative, COPIED, status.st_size))
+
+    def _unchanged(self, source: Path, status: os.stat_result, target: Path,
+                   dest_status: os.stat_result) -> bool:
+        if status.st_size != dest_status.st_size:
+            return False
+        if self.checksum:
+            return file_digest(source) == file_digest(target)
+
+        difference: float = abs(status.st_mtime_ns -
+                                dest_status.st_mtime_ns) / 1e9
+        return difference <= self.modify_window
+
+    @staticmethod
+    def _delete(target: Path, relative: str, results: list) -> None:
+        """ Delete a file or a whole folder from the destination """
+
+        try:
+            if target.is_dir() and not target.is_symlink():
+                shutil.rmtree(target)
+            elif target.exists() or target.is_symlink():
+                target.unlink()
+            else:
+                return
+        except OSError as error:
+            results.append(FileResult(relative, FAILED, 0, str(error)))
+            return
+
+        results.append(FileResult(relative, DELETED))
+
+
+def copy_file(source: Path, target: Path, status: os.stat_result) -> None:
+    """ Copy source over target through a temporary file, with
+    copy_file_range, sendfile or a buffered copy, and set its mtime """
+
+    temporary: Path = target.with_name(f".{target.name}.pyusb")
+
+    try:
+        with open(source, "rb") as src, \
+                open(os.open(temporary,
+                             os.O_WRONLY | os.O_CREAT | os.O_TRUNC,
+                             status.st_mode & 0o777), "wb") as dst:
+            for method in (_copy_file_range, _sendfile):
+                try:
+                    _copy_in_kernel(method, src.fileno(), dst.fileno(),
+                                    status.st_size)
+                    break
+                except OSError:
+                    # Not supported between these filesystems
+                    src.seek(0)
+                    dst.seek(0)
+                    dst.truncate()
+            else:
+                shutil.copyfileobj(src, dst, CHUNK_SIZE)
+
+        os.utime(temporary, ns=(status.st_atime_ns, status.st_mtime_ns))
+        os.replace(temporary, target)
+
+    except OSError:
+        temporary.unlink(missing_ok=True)
+        raise
+
+
+def _copy_file_range(source: int, target: int, count: int) -> int:
+    if not hasattr(os, "copy_file_range"):
+        raise OSError("copy_file_range not available")
+    return os.copy_file_range(source, target, count)
+
+
+def _sendfile(source: int, target: int, count: int) -> int:
+    return os.sendfile(target, source, None, count)
+
+
+def _copy_in_kernel(method: Any, source: int, target: int, size: int) -> None:
+    """ Copy size bytes without going through user space """
+
+    copied: int = 0
+    while copied < size:
+        sent: int = method(source, target, min(CHUNK_SIZE, size - copied))
+        # The file got shorter while copying
+        if sent == 0:
+            break
+        copied += sent
+
+
+def file_digest(path: Path) -> bytes:
+    """ Hash of the content of a file """
+
+    digest: Any = hashlib.blake2b()
+    with open(path, "rb") as content:
+        while chunk := content.read(CHUNK_SIZE):
+            digest.update(chunk)
+
+    return digest.digest()
+
+
+# Sync backends selectable by name
+ENGINES: dict[str, Any] = {
+    "rsync": RsyncEngine,
+    "native": NativeEngine,
+}
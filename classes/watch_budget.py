@@ -0,0 +1,239 @@
+#!/usr/bin/python3
+
+##############################################################################
+# Author: Carlos Lacaci Moya
+
+# Description: Keep the watches of observer_folder.py inside the inotify
+#              limits of the kernel. Every watched folder costs one inotify
+#              watch and every watchdog watch one inotify instance: the
+#              recently changed subtrees get them and the cold or oversized
+#              ones are polled instead
+
+# Date: dom 18 oct 2026 19:02:41 CEST
+# Dependencies: See requirements.txt
+##############################################################################
+import os
+import time
+from collections import deque, namedtuple
+from pathlib import Path
+from typing import Any, Optional
+
+from classes.filters import MAX_WATCHES, FolderScan
+
+# Part of a tracked folder watched as one unit. folders is the number of
+# inotify watches it needs, newest the last time one of its folders changed
+Subtree = namedtuple('Subtree', 'path, recursive, folders, newest')
+
+# Where a subtree is watched. interval is 0 for inotify, else the seconds
+# between two polls
+Assignment = namedtuple('Assignment', 'subtree, interval')
+
+MAX_USER_WATCHES: str = "/proc/sys/fs/inotify/max_user_watches"
+MAX_USER_INSTANCES: str = "/proc/sys/fs/inotify/max_user_instances"
+
+# Used when the limits can not be read: the kernel defaults
+DEFAULT_MAX_WATCHES: int = 8192
+DEFAULT_MAX_INSTANCES: int = 128
+
+# Part of the limit observer_folder.py takes. The rest is left to the
+# desktop, the editors and the other programs of the user
+WATCH_SHARE: float = 0.5
+
+# Poll intervals in seconds, the shortest for the most recent subtrees
+POLL_INTERVALS: tuple = (5.0, 30.0, 120.0)
+
+# A subtree that changed in the last day is hot, in the last month warm
+HOT_AGE: float = 24 * 60 * 60
+WARM_AGE: float = 30 * HOT_AGE
+
+# Folders one poll may stat per second of interval: polling a big tree too
+# often costs more than the changes it finds
+POLL_RATE: int = 2000
+
+# Times an oversized subtree is split into its subfolders
+SPLIT_DEPTH: int = 2
+
+
+def max_user_watches(path: str = MAX_USER_WATCHES,
+                     default: int = DEFAULT_MAX_WATCHES) -> int:
+    """ Limit of inotify watches of the user """
+
+    try:
+        with open(path) as limit:
+            return int(limit.read())
+    except (OSError, ValueError):
+        return default
+
+
+def watches_in_use(proc: str = "/proc") -> int:
+    """ inotify watches held by the processes we can inspect, i.e. the
+    ones of the user. Each watch is a 'inotify wd:' line in the fdinfo of
+    an inotify descriptor """
+
+    watches: int = 0
+    try:
+        pids: list = [name for name in os.listdir(proc) if name.isdigit()]
+    except OSError:
+        return 0
+
+    for pid in pids:
+        fdinfo: str = os.path.join(proc, pid, "fdinfo")
+        try:
+            descriptors: list = os.listdir(fdinfo)
+        except OSError:
+            continue
+        for descriptor in descriptors:
+            try:
+                with open(os.path.join(fdinfo, descriptor)) as info:
+                    watches += sum(1 for line in info
+                                   if line.startswith("inotify wd:"))
+            except OSError:
+                continue
+
+    return watches
+
+
+def instances_in_use(proc: str = "/proc") -> int:
+    """ inotify instances held by the processes we can inspect """
+
+    instances: int = 0
+    try:
+        pids: list = [name for name in os.listdir(proc) if name.isdigit()]
+    except OSError:
+        return 0
+
+    for pid in pids:
+        fds: str = os.path.join(proc, pid, "fd")
+        try:
+            descriptors: list = os.listdir(fds)
+        except OSError:
+            continue
+        for descriptor in descriptors:
+            try:
+                target: str = os.readlink(os.path.join(fds, descriptor))
+            except OSError:
+                continue
+            if target == "anon_inode:inotify":
+                instances += 1
+
+    return instances
+
+
+def watch_budget(share: float = WATCH_SHARE) -> tuple:
+    """ Return (watches available, limit, watches already in use) """
+
+    limit: int = max_user_watches()
+    in_use: int = watches_in_use()
+    return max(0, int(limit * share) - in_use), limit, in_use
+
+
+def instance_budget(share: float = WATCH_SHARE) -> tuple:
+    """ Return (inotify instances available, limit, instances already in
+    use). Each watchdog watch has its own instance and thread """
+
+    limit: int = max_user_watches(MAX_USER_INSTANCES, DEFAULT_MAX_INSTANCES)
+    in_use: int = instances_in_use()
+    return max(0, int(limit * share) - in_use), limit, in_use
+
+
+def measure(scan: FolderScan) -> dict:
+    """ {relative folder: (folders below it, itself included, newest mtime
+    among them)} for every folder of the scan, in one pass """
+
+    totals: dict = {}
+    # Children are listed after their parents: walk the list backwards
+    for relative in reversed(list(scan.children)):
+        count: int = 1
+        newest: float = scan.mtimes.get(relative, 0.0)
+        for child in scan.children[relative]:
+            child_count, child_newest = totals[child]
+            count += child_count
+            newest = max(newest, child_newest)
+        totals[relative] = (count, newest)
+
+    return totals
+
+
+def subtrees(origin: Any,
+             plan: list,
+             scan: FolderScan,
+             budget: int,
+             max_watches: int = MAX_WATCHES,
+             depth: int = SPLIT_DEPTH) -> list:
+    """ Measure the (folder, recursive) watches of classes.filters
+    .watch_plan with the scan_folders() of origin. A recursive watch bigger
+    than the whole budget is split into its subfolders, so its hot parts
+    can still use inotify. The split stops at max_watches watches """
+
+    totals: dict = measure(scan)
+    measured: list = []
+    pending: deque = deque(
+        (Path(folder), recursive, depth) for folder, recursive in plan)
+
+    while pending:
+        folder, recursive, left = pending.popleft()
+        relative: str = os.path.relpath(folder, origin)
+        relative = "" if relative == "." else relative
+
+        if not recursive:
+            measured.append(Subtree(folder, False, 1, 0.0))
+            continue
+
+        count, newest = totals.get(relative, (1, 0.0))
+        children: list = scan.children.get(relative, [])
+        if count <= budget or left <= 0 or \
+                len(measured) + len(pending) + 1 + len(children) > max_watches:
+            measured.append(Subtree(folder, True, count, newest))
+            continue
+
+        measured.append(Subtree(folder, False, 1, newest))
+        pending.extend((Path(origin).joinpath(child), True, left - 1)
+                       for child in children)
+
+    return measured
+
+
+def poll_interval(subtree: Subtree, now: float) -> float:
+    """ Seconds between two polls: longer for old and for big subtrees """
+
+    age: float = now - subtree.newest
+    tier: int = 0 if age < HOT_AGE else 1 if age < WARM_AGE else 2
+
+    # Not more than POLL_RATE folders per second of interval
+    while tier < len(POLL_INTERVALS) - 1 and \
+            subtree.folders > POLL_RATE * POLL_INTERVALS[tier]:
+        tier += 1
+
+    return POLL_INTERVALS[tier]
+
+
+def assign_watches(measured: list,
+                   budget: int,
+                   instances: Optional[int] = None) -> list:
+    """ Give the inotify watches to the most recently changed subtrees
+    first and poll the ones that do not fit in the budget of watches, or
+    in the instances left (one per subtree) """
+
+    now: float = time.time()
+    intervals: list = [0.0] * len(measured)
+    # Non recursive watches cost one watch and keep the new subfolders
+    # visible: always inotify
+    shallow: int = sum(1 for item in measured if not item.recursive)
+    remaining: int = budget - shallow
+    free: float = float("inf") if instances is None else instances - shallow
+
+    for index in sorted(
+        (index for index, item in enumerate(measured) if item.recursive),
+            key=lambda index: measured[index].newest,
+            reverse=True):
+        subtree: Subtree = measured[index]
+        if subtree.folders <= remaining and free > 0:
+            remaining -= subtree.folders
+            free -= 1
+        else:
+            intervals[index] = poll_interval(subtree, now)
+
+    return [
+        Assignment(subtree, interval)
+        for subtree, interval in zip(measured, intervals)
+    ]
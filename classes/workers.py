@@ -0,0 +1,163 @@
+#!/usr/bin/python3
+
+##############################################################################
+# Author: Carlos Lacaci Moya
+
+# Description: Per destination sync workers. Every destination device has
+#              its own bounded queue and thread, so a slow USB only delays
+#              its own backups. SyncSupervisor owns the workers and runs
+#              the main loop of observer_folder.py
+
+# Date: dom 18 oct 2026 17:22:45 CEST
+# Dependencies: See requirements.txt
+##############################################################################
+import os
+import signal
+import threading
+from pathlib import Path
+from typing import Any, Callable
+
+
+def destination_device(destination: Any) -> int:
+    """ Device holding the destination folder, or its nearest parent """
+
+    for folder in [Path(destination), *Path(destination).parents]:
+        try:
+            return os.stat(folder).st_dev
+        except OSError:
+            continue
+    return 0
+
+
+class DestinationWorker:
+    """ Run the sync jobs of one destination device, one at a time.
+
+    Jobs of the same handler waiting in the queue are merged into one. When
+    'maxsize' handlers are waiting, submit() blocks (backpressure) """
+
+    def __init__(self, name: str, maxsize: int = 16) -> None:
+
+        self.name: str = name
+        self.maxsize: int = max(1, maxsize)
+
+        # Counters
+        self.jobs_submitted: int = 0
+        self.jobs_merged: int = 0
+        self.jobs_run: int = 0
+
+        # handler -> set of paths, in arrival order
+        self._pending: dict = {}
+        self._stopped: bool = False
+        self._condition = threading.Condition()
+        self._thread = threading.Thread(target=self._loop,
+                                        name=f"sync-{name}",
+                                        daemon=True)
+        self._thread.start()
+
+    @property
+    def depth(self) -> int:
+        """ Jobs waiting in the queue """
+        return len(self._pending)
+
+    def submit(self, handler: Any, paths: set) -> None:
+        """ Queue a sync of paths for handler """
+
+        with self._condition:
+            self.jobs_submitted += 1
+
+            if handler in self._pending:
+                self._pending[handler] |= paths
+                self.jobs_merged += 1
+                return
+
+            while len(self._pending) >= self.maxsize and not self._stopped:
+                self._condition.wait()
+
+            self._pending[handler] = set(paths)
+            self._condition.notify_all()
+
+    def stop(self, timeout: float = 10.0) -> None:
+        """ Stop after the job running now. Queued jobs are dropped """
+
+        with self._condition:
+            self._stopped = True
+            self._condition.notify_all()
+        self._thread.join(timeout)
+
+    def _loop(self) -> None:
+        while True:
+            with self._condition:
+                while not self._pending and not self._stopped:
+                    self._condition.wait()
+                if self._stopped:
+                    return
+
+                handler: Any = next(iter(self._pending))
+                paths: set = self._pending.pop(handler)
+                # Room for a blocked submit()
+                self._condition.notify_all()
+
+            try:
+                handler._sync_changes(paths)
+            except Exception as error:
+                print(f"[!] {self.name}: {error}")
+            self.jobs_run += 1
+
+
+class SyncSupervisor:
+    """ Own the destination workers and run the main loop """
+
+    def __init__(self, maxsize: int = 16, tick: float = 5.0) -> None:
+
+        self.maxsize: int = maxsize
+        # Seconds between two runs of the periodic tasks
+        self.tick: float = tick
+        self.workers: dict[int, DestinationWorker] = {}
+
+        # Called every tick from the main loop
+        self.periodic: list[Callable[[], Any]] = []
+
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    def worker_for(self, destination: Any) -> DestinationWorker:
+        """ Worker of the device holding destination """
+
+        device: int = destination_device(destination)
+        with self._lock:
+            if device not in self.workers:
+                self.workers[device] = DestinationWorker(
+                    f"{device}:{Path(destination).name}", self.maxsize)
+            return self.workers[device]
+
+    def submit(self, handler: Any, paths: set) -> None:
+        """ Queue a sync job in the worker of the handler destination """
+
+        self.worker_for(handler.destination).submit(handler, paths)
+
+    def run(self) -> None:
+        """ Main loop: periodic tasks until stop(), Ctrl+C or SIGTERM """
+
+        signal.signal(signal.SIGTERM, lambda signum, frame: self.stop())
+        try:
+            while not self._stop.wait(self.tick):
+                for task in self.periodic:
+                    try:
+                        task()
+                    except Exception as error:
+                        print(f"[!] {error}")
+        except KeyboardInterrupt:
+            pass
+        finally:
+            self.shutdown()
+
+    def stop(self) -> None:
+        """ Ask the main loop to finish """
+        self._stop.set()
+
+    def shutdown(self) -> None:
+        """ Stop all the workers """
+
+        self._stop.set()
+        for worker in list(self.workers.values()):
+            worker.stop()
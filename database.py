@@ -9,100 +9,92 @@
 # Dependencies: See below
 ##############################################################################
 from pathlib import Path as path
-import shelve
 import sys
-from typing import Any
+from typing import Any, Iterable
 
 from rich.console import Console
 
 from helpers import RunCommand
+from registry import DeviceRegistry
 
 # rich module
 console = Console()
 
 
-class CreateDatabase:
-    """Create a Database for storing USB names using the shelve module"""
+def read_items(items: list, file: Any = None) -> list:
+    """Items for the bulk operations: the arguments, then one per line
+    of file ('-' is stdin). Blank lines and '#' comments are skipped"""
+
+    lines: list = list(items)
+    if file == "-":
+        if sys.stdin.isatty():
+            console.print("[bold cyan]Enter the usb names, one per line. "
+                          "Ctrl+D to finish[/bold cyan]")
+        lines += sys.stdin.read().splitlines()
+    elif file:
+        with open(file, "r") as items_file:
+            lines += items_file.read().splitlines()
+
+    return [
+        line.strip() for line in lines
+        if line.strip() and not line.strip().startswith("#")
+    ]
+
 
-    def __init__(self) -> None:
-        """Initalize the shelve object"""
-        # Stores a copy of the dictionary
+class CreateDatabase:
+    """Create a Database for storing USB names. The names live in the
+    SQLite registry (registry.py), usbs.dbm is migrated on first use"""
+
+    def __init__(self, interactive: bool = True, db_path: Any = None) -> None:
+        """Initalize the registry. interactive=False never prompts, e.g.
+        for the bulk operations. db_path defaults to usbs.sqlite"""
+        # Ask for items when the database is empty
+        self.interactive: bool = interactive
+        # Stores a copy of the favorites
         self.temp_favorites: list = []
-        # Flag to check if the database is opened
-        self._db_opened: bool = False
         # Script path
         self.script_path: path = path(__file__).parent.absolute()
         # Database path
-        self.db_path: path = self.script_path.joinpath("usbs.dbm")
+        self.db_path: path = path(
+            db_path) if db_path else self.script_path.joinpath("usbs.sqlite")
         # Create database
         self._create_database()
 
     def _create_database(self) -> None:
         """Check if database exist"""
 
-        # Database status
-        self._db_opened: bool = True
-
         # Creating/Opening database
-        self._shelve: Any = shelve.open(str(self.db_path), writeback=True)
+        self.registry: DeviceRegistry = DeviceRegistry(self.db_path)
 
         # Check for Data in the Database
-        if not self._shelve.items():
+        self.temp_favorites = self.registry.labels()
+        if not self.temp_favorites and self.interactive:
             console.print(
                 "[bold cyan]The database is empty!. Add some files ... [/bold cyan]"
             )
             self.add_item()
 
-        else:
-            self.temp_favorites: list = self._shelve["favorites"]
-            # FOR DEBUGGING
-            # print(self.temp_favorites)
-
-            self._shelve.close()
-            self._db_opened: bool = False
-
     def add_item(self) -> list:
         """Adding new item"""
 
         item = ""
         while item != "quit":
-            if self._db_opened:
-
-                # FOR DEBUGGING
-                # print("db Opened")
-                item: str = input("Enter the new item ('quit' to exit): ")
-
-            else:
-                # FOR DEBUGGING
-                # print("db Closed")
-                self._db_opened: bool = True
-
-                item: str = input("Enter the new item ('quit' to exit): ")
-                self._shelve: Any = shelve.open(str(self.db_path), writeback=True)
+            item: str = input("Enter the new item ('quit' to exit): ")
 
             if item == "quit":
                 break
 
-            # Inserting and swapping
-            self.temp_favorites.append(item)
-            self._shelve["favorites"] = self.temp_favorites
-            self.temp_favorites = self._shelve["favorites"]
+            # One row per item
+            self.registry.add([item])
 
-        self._shelve.close()
-        self._db_opened: bool = False
+        self.temp_favorites = self.registry.labels()
 
         return self.temp_favorites
 
     def delete_item(self) -> list:
         """Deleting item"""
 
-        if not self._db_opened:
-            # DEBUG
-            # console.print("[bold cyan]Database was not opened[/bold cyan]")
-            self._shelve: Any = shelve.open(str(self.db_path), writeback=True)
-            self._db_opened: bool = True
-
-        self.temp_favorites = self._shelve["favorites"]
+        self.temp_favorites = self.registry.labels()
         if len(self.temp_favorites) == 0:
             console.print("[bold red]No items to delete[/bold red]")
             sys.exit(0)
@@ -117,18 +109,49 @@ class CreateDatabase:
         return self.temp_favorites
 
     def _delete_item(self, item):
-        item_idx: int = self.temp_favorites.index(item)
-        del self.temp_favorites[item_idx]
+        self.registry.remove([item])
+        self.temp_favorites = self.registry.labels()
 
         console.print(f"[bold red]item {[item]} deleted[/bold red]")
 
-        self._shelve["favorites"] = self.temp_favorites
+    def add_items(self, items: Iterable[str]) -> list:
+        """Add many items in one transaction"""
+
+        added: int = self.registry.add(items)
+        console.print(f"[bold cyan]{added} items added[/bold cyan]")
 
-        self._shelve.close()
-        self._db_opened: bool = False
+        self.temp_favorites = self.registry.labels()
+        return self.temp_favorites
+
+    def delete_items(self, items: Iterable[str]) -> list:
+        """Delete many items in one transaction"""
+
+        deleted: int = self.registry.remove(items)
+        console.print(f"[bold red]{deleted} items deleted[/bold red]")
+
+        self.temp_favorites = self.registry.labels()
+        return self.temp_favorites
+
+    def replace_items(self,
+                      items: Iterable[str],
+                      allow_empty: bool = False) -> list:
+        """Replace all the items in one transaction. Replacing them with
+        nothing needs allow_empty"""
+
+        try:
+            added, deleted = self.registry.replace(items, allow_empty)
+        except ValueError as error:
+            console.print(f"[bold red][!] Nothing replaced, {error}. Use "
+                          f"--allow-empty to delete them all[/bold red]")
+            sys.exit(1)
+        console.print(f"[bold cyan]{added} items added, {deleted} items "
+                      f"deleted[/bold cyan]")
+
+        self.temp_favorites = self.registry.labels()
+        return self.temp_favorites
 
     def show_items(self) -> list:
-        """Show items in the shelve"""
+        """Show items in the registry"""
 
         if not self.db_path.exists():
             console.print(
@@ -136,27 +159,14 @@ class CreateDatabase:
             )
             sys.exit(0)
 
-        if not self._db_opened:
-            # FOR DEBUGGING
-            # print("db was closed")
-            self._shelve: Any = shelve.open(str(self.db_path), writeback=True)
-
-            # FOR DEBUGGING
-            # console.print("[bold cyan]Opening database ...[/bold cyan]")
-            # Check for Data in the Database
-            if not self._shelve.items():
-                console.print(
-                    "[bold red][!] The database is empty!. Add some files ... [/bold red]"
-                )
-                sys.exit(0)
-
-            self.temp_favorites: list = self._shelve["favorites"]
-        else:
-            self.temp_favorites = self._shelve["favorites"]
-        self._shelve.close()
-        self._db_opened: bool = True
+        self.temp_favorites = self.registry.labels()
 
-        self._db_opened: bool = False
+        # Check for Data in the Database
+        if not self.temp_favorites:
+            console.print(
+                "[bold red][!] The database is empty!. Add some files ... [/bold red]"
+            )
+            sys.exit(0)
 
         # FOR DEBUGGING
         # console.print(
@@ -171,11 +181,8 @@ class CreateDatabase:
             console.print("[bold red]The database does not exist![/bold red]")
             sys.exit(0)
 
-        if self._db_opened:
-            self._shelve.close()
-            self._db_opened: bool = False
-
-        delete: str = f"rm {self.db_path}"
+        # The WAL files go with it
+        delete: str = f"rm -f {self.db_path} {self.db_path}-wal {self.db_path}-shm"
 
         prompt = ""
         while prompt.lower() not in ["y", "n"]:
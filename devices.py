@@ -0,0 +1,306 @@
+#!/usr/bin/python3
+
+##############################################################################
+# Author: Carlos Lacaci Moya
+
+# Name: devices.py
+# Description: Block devices inventory. Runs 'blkid' once, or reads the udev
+#              symlinks and sysfs without privileges, and indexes the
+#              devices found by exact LABEL, UUID and device node
+# Date: dom 18 oct 2026 10:12:31 CEST
+# Dependencies: blkid (only for the blkid backend)
+# Version: 1.0
+##############################################################################
+
+import os
+import re
+from collections import namedtuple
+from dataclasses import dataclass, field
+from typing import Any, Iterator, Optional
+
+from helpers import RunCommand
+
+# Block device found by the inventory. The blkid backend does not fill the
+# sysfs attributes
+Device = namedtuple('Device',
+                    'devname, label, uuid, fstype, removable, size, vendor',
+                    defaults=(False, 0, ""))
+
+# blkid -o export escapes spaces and other special chars with a backslash
+BLKID_ESCAPE: Any = re.compile(r"\\(.)")
+
+# udev encodes unsafe chars of the /dev/disk/by-* names as \xNN
+UDEV_ESCAPE: Any = re.compile(r"\\x([0-9a-fA-F]{2})")
+
+# Size of a sector as reported by /sys/block/<disk>/size
+SECTOR_SIZE: int = 512
+
+
+def parse_blkid_export(output: str) -> Iterator[Device]:
+    """Parse the output of 'blkid -o export' into Device records.
+
+    Each device is a block of KEY=value lines separated by a blank line"""
+
+    block: dict[str, str] = {}
+    for line in output.splitlines() + [""]:
+        line = line.strip()
+
+        if not line:
+            if "DEVNAME" in block:
+                yield Device(block["DEVNAME"], block.get("LABEL", ""),
+                             block.get("UUID", ""), block.get("TYPE", ""))
+            block = {}
+            continue
+
+        key, _, value = line.partition("=")
+        block[key] = BLKID_ESCAPE.sub(r"\1", value)
+
+
+@dataclass
+class DeviceIndex:
+    """In-memory index of block devices by LABEL, UUID and device node"""
+
+    by_label: dict = field(default_factory=dict)
+    by_uuid: dict = field(default_factory=dict)
+    by_devname: dict = field(default_factory=dict)
+
+    def add(self, device: Device) -> None:
+        """Index the device under all its keys"""
+
+        if device.label:
+            self.by_label[device.label] = device
+        if device.uuid:
+            self.by_uuid[device.uuid] = device
+        self.by_devname[device.devname] = device
+
+    def __iter__(self) -> Iterator[Device]:
+        yield from self.by_devname.values()
+
+    def __len__(self) -> int:
+        return len(self.by_devname)
+
+
+@dataclass
+class Inventory:
+    """Lookups in the snapshot of a discovery backend. The backends
+    implement refresh()"""
+
+    _index: Optional[DeviceIndex] = field(default=None, init=False)
+
+    def refresh(self) -> DeviceIndex:
+        """Take a new snapshot of the block devices"""
+
+        raise NotImplementedError
+
+    @property
+    def index(self) -> DeviceIndex:
+        """Return the snapshot, taking it on first use"""
+
+        if self._index is None:
+            self.refresh()
+        return self._index  # type: ignore
+
+    def find_label(self, label: str) -> Optional[Device]:
+        """Return the device with exactly this LABEL"""
+
+        return self.index.by_label.get(label)
+
+    def find_uuid(self, uuid: str) -> Optional[Device]:
+        """Return the device with exactly this UUID"""
+
+        return self.index.by_uuid.get(uuid)
+
+    def find_devname(self, devname: str) -> Optional[Device]:
+        """Return the device with this device node, e.g. /dev/sdb1"""
+
+        return self.index.by_devname.get(devname)
+
+
+@dataclass
+class BlkidInventory(Inventory):
+    """Snapshot of the block devices taken with a single 'blkid' run"""
+
+    command: str = field(default="sudo blkid -o export")
+    process: Any = field(default=RunCommand(), init=False)
+
+    def refresh(self) -> DeviceIndex:
+        """Run blkid and rebuild the index"""
+
+        cmd: Any = self.process.run(self.command)
+        # FOR DEBUGGING
+        # print(cmd)
+
+        index = DeviceIndex()
+        # blkid returns 2 when no devices were found
+        if cmd.returncode == 0:
+            for device in parse_blkid_export(cmd.stdout):
+                index.add(device)
+
+        self._index = index
+        return index
+
+
+def _read_attribute(path: str) -> str:
+    """Return the stripped content of a sysfs/udev file or ''"""
+
+    try:
+        with open(path, "r") as attribute:
+            return attribute.read().strip()
+    except OSError:
+        return ""
+
+
+@dataclass
+class SysfsInventory(Inventory):
+    """Snapshot of the block devices read from the udev symlinks in
+    /dev/disk and the attributes in /sys/block. No subprocess, no sudo.
+
+    The root paths can point to a fake tree for testing"""
+
+    dev_root: str = field(default="/dev")
+    sys_root: str = field(default="/sys")
+    udev_root: str = field(default="/run/udev/data")
+
+    def _links(self, kind: str) -> dict[str, str]:
+        """Map the decoded names in /dev/disk/by-<kind> to device names"""
+
+        links: dict[str, str] = {}
+        directory: str = os.path.join(self.dev_root, "disk", f"by-{kind}")
+
+        try:
+            entries: Any = os.scandir(directory)
+        except OSError:
+            return links
+
+        with entries:
+            for entry in entries:
+                if not entry.is_symlink():
+                    continue
+                name: str = udev_decode(entry.name)
+                target: str = os.path.basename(os.readlink(entry.path))
+                links[name] = target
+
+        return links
+
+    def _parent_disks(self) -> dict[str, str]:
+        """Map every block device name to the disk that holds it"""
+
+        parents: dict[str, str] = {}
+        block: str = os.path.join(self.sys_root, "block")
+
+        try:
+            disks: list[str] = os.listdir(block)
+        except OSError:
+            return parents
+
+        for disk in disks:
+            parents[disk] = disk
+            try:
+                children: list[str] = os.listdir(os.path.join(block, disk))
+            except OSError:
+                continue
+            # Partitions show up as /sys/block/<disk>/<disk>N
+            for child in children:
+                if child.startswith(disk):
+                    parents[child] = disk
+
+        return parents
+
+    def _fstype(self, name: str) -> str:
+        """Read the fs type probed by udev, if the udev database is there"""
+
+        devno: str = _read_attribute(
+            os.path.join(self.sys_root, "class", "block", name, "dev"))
+        if not devno:
+            return ""
+
+        properties: str = _read_attribute(
+            os.path.join(self.udev_root, f"b{devno}"))
+        for line in properties.splitlines():
+            if line.startswith("E:ID_FS_TYPE="):
+                return line.partition("=")[2]
+
+        return ""
+
+    def refresh(self) -> DeviceIndex:
+        """Read the symlinks and sysfs and rebuild the index"""
+
+        labels: dict[str, str] = self._links("label")
+        uuids: dict[str, str] = self._links("uuid")
+        parents: dict[str, str] = self._parent_disks()
+
+        label_of: dict[str, str] = {name: label
+                                    for label, name in labels.items()}
+        uuid_of: dict[str, str] = {name: uuid for uuid, name in uuids.items()}
+
+        index = DeviceIndex()
+        for name in set(label_of) | set(uuid_of):
+            disk: str = os.path.join(self.sys_root, "block",
+                                     parents.get(name, name))
+            partition: str = os.path.join(disk, name)
+            size: str = _read_attribute(os.path.join(partition, "size")) \
+                or _read_attribute(os.path.join(disk, "size"))
+
+            index.add(
+                Device(devname=f"/dev/{name}",
+                       label=label_of.get(name, ""),
+                       uuid=uuid_of.get(name, ""),
+                       fstype=self._fstype(name),
+                       removable=_read_attribute(
+                           os.path.join(disk, "removable")) == "1",
+                       size=int(size or 0) * SECTOR_SIZE,
+                       vendor=_read_attribute(
+                           os.path.join(disk, "device", "vendor"))))
+
+        self._index = index
+        return index
+
+
+def udev_name(name: str) -> str:
+    """Encode a LABEL or UUID like udev does for the /dev/disk/by-* names,
+    e.g. a space is \\x20"""
+
+    return "".join(char if char.isalnum() or char in "#+-.:=@_" else
+                   f"\\x{ord(char):02x}" for char in name)
+
+
+def udev_decode(name: str) -> str:
+    """Decode a /dev/disk/by-* name or an ID_FS_*_ENC value, e.g. \\x20 is
+    a space"""
+
+    return UDEV_ESCAPE.sub(lambda match: chr(int(match.group(1), 16)), name)
+
+
+def cached_device(label: str,
+                  uuid: str,
+                  fstype: str = "",
+                  dev_root: str = "/dev") -> tuple:
+    """Validate a UUID remembered for a LABEL with the udev symlinks,
+    without probing the devices.
+
+    Returns (trusted, device). trusted is False when the cache can not be
+    used and the devices must be probed, device is then None"""
+
+    if not uuid:
+        return False, None
+
+    by_uuid: str = os.path.join(dev_root, "disk", "by-uuid", udev_name(uuid))
+    if not os.path.lexists(by_uuid):
+        # Not plugged in, udev not settled yet, no udev at all or
+        # reformatted: only the probe can tell
+        return False, None
+
+    by_label: str = os.path.join(dev_root, "disk", "by-label",
+                                 udev_name(label))
+    devname: str = os.path.realpath(by_uuid)
+    if os.path.lexists(by_label) and os.path.realpath(by_label) != devname:
+        return False, None
+
+    return True, Device(devname, label, uuid, fstype)
+
+
+# Discovery backends selectable by name
+INVENTORIES: dict[str, Any] = {
+    "blkid": BlkidInventory,
+    "sysfs": SysfsInventory,
+}
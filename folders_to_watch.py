@@ -24,11 +24,12 @@ Options:
 from docopt import docopt  # type:ignore
 from json_management import ManageJson
 
-MJ = ManageJson()
 if __name__ == "__main__":
     args = docopt(__doc__,
                   version="json_meny.py v.1.0 - 2022 @CLM")  # type: ignore
 
+    MJ = ManageJson()
+
     if args["-a"]:
         print("add data to json file")
         MJ.add_data()
@@ -18,20 +18,20 @@ from rich import print as pr
 from rich.panel import Panel
 from rich.console import Console
 from rich.rule import Rule as rule
-from rich.progress import Progress
-from rich.table import Table
-from PIL import Image  # type: ignore
 from typing import Any
-from notifypy import Notify
+
+# PIL, notifypy, rich.progress and rich.table are imported by the helpers
+# using them: every entry point imports this module
 
 
 class RunCommand:
     """Execute command as a subprocess"""
 
     @staticmethod
-    def run(command: Any) -> Any:
-        """Run the command"""
+    def run(command: Any, input: Any = None) -> Any:
+        """Run the command. input is sent to its stdin"""
         return subprocess.run(command,
+                              input=input,
                               capture_output=True,
                               text=True,
                               shell=True)
@@ -86,6 +86,8 @@ def is_host_oneline(ip_address: str, verbose: bool = False) -> bool:
 def show_image(name: str):
     """Show an image store in pictures folder"""
 
+    from PIL import Image  # type: ignore
+
     # read the image
     image = abspath(f"{name}.jpg")
     im = Image.open(image)
@@ -127,6 +129,8 @@ class Rule_(rule):
 def progress_bar():
     """Fake progress bar"""
 
+    from rich.progress import Progress
+
     with Progress() as progress:
         task = progress.add_task("[green]Syncing ...", total=10000)
 
@@ -134,16 +138,25 @@ def progress_bar():
             progress.update(task, advance=0.01)
 
 
-class Notification(Notify):
-    """ Create an information message """
+class Notification:
+    """ Create an information message. notifypy.Notify is created on the
+    first message """
+
+    def __init__(self, **kwargs: Any) -> None:
+        self._kwargs: dict = kwargs
+        self._notify: Any = None
 
     def send_message(self, title: str, message: str, audio: Any = "") -> None:
         """ Send the message """
-        self.title = title
-        self.message = message
+        if self._notify is None:
+            from notifypy import Notify
+            self._notify = Notify(**self._kwargs)
+
+        self._notify.title = title
+        self._notify.message = message
         if audio:
-            self.audio = audio
-        self.send()
+            self._notify.audio = audio
+        self._notify.send()
 
 
 class ShowTable:
@@ -151,6 +164,8 @@ class ShowTable:
 
     def __init__(self, json_file: dict, columns: list) -> None:
 
+        from rich.table import Table
+
         self.data = json_file
         self.columns = columns
 
@@ -174,10 +189,14 @@ class ShowTable:
         self.table.add_column("folder_to_copy_to",
                               min_width=10,
                               justify="left")
+        self.table.add_column("exclude", min_width=10, justify="left")
+        self.table.add_column("include", min_width=10, justify="left")
 
     def create_rows(self):
         """Create table rows"""
 
         for item in self.data["Folders"]:
             self.table.add_row(str(item['folder_id']), item['folder_to_track'],
-                               item['folder_to_copy_to'])
+                               item['folder_to_copy_to'],
+                               ", ".join(item.get('exclude', [])),
+                               ", ".join(item.get('include', [])))
@@ -0,0 +1,283 @@
+#!/usr/bin/python3
+
+##############################################################################
+# Author: Carlos Lacaci Moya
+
+# Name: hotplug.py
+# Description: Auto-mount daemon. Mounts the favorite USBs as soon as they
+#              are plugged in and cleans up their mount points on removal.
+#              Events come from the udev netlink socket, or from inotify on
+#              /dev/disk/by-label as a fallback
+# Date: dom 18 oct 2026 13:20:14 CEST
+# Dependencies: See requirements.txt
+# Version: 1.0
+##############################################################################
+
+import os
+import queue
+import socket
+import struct
+from collections import namedtuple
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator
+
+from rich.console import Console
+
+from devices import SysfsInventory, udev_decode
+from metrics import REGISTRY
+from mount_usb import FAILED, CheckUsb, MountUsb
+
+# From rich module
+console = Console()
+
+# Device arrival or removal. label and uuid can be empty (kernel events)
+HotplugEvent = namedtuple('HotplugEvent', 'action, devname, label, uuid',
+                          defaults=("", ""))
+
+ADD: str = "add"
+REMOVE: str = "remove"
+
+# linux/netlink.h
+NETLINK_KOBJECT_UEVENT: int = 15
+KERNEL_GROUP: int = 1
+UDEV_GROUP: int = 2
+
+# Header of the messages sent by udevd: "libudev\0", magic, header size,
+# offset and length of the properties
+UDEV_PREFIX: bytes = b"libudev\0"
+UDEV_MAGIC: int = 0xfeedcafe
+
+
+def parse_uevent(data: bytes) -> dict[str, str]:
+    """Return the properties of a kernel or udev netlink message"""
+
+    if data.startswith(UDEV_PREFIX):
+        magic: int = struct.unpack_from("!I", data, 8)[0]
+        if magic != UDEV_MAGIC:
+            return {}
+        offset, length = struct.unpack_from("=II", data, 16)
+        payload: bytes = data[offset:offset + length]
+    else:
+        # Kernel message: "ACTION@DEVPATH\0KEY=VALUE\0..."
+        payload = data.partition(b"\0")[2]
+
+    properties: dict[str, str] = {}
+    for item in payload.split(b"\0"):
+        key, sep, value = item.decode(errors="replace").partition("=")
+        if sep:
+            properties[key] = value
+
+    return properties
+
+
+@dataclass
+class NetlinkSource:
+    """Block device events from the netlink uevent socket. The udev group
+    is used by default: its events arrive once the label has been probed"""
+
+    group: int = field(default=UDEV_GROUP)
+
+    def __iter__(self) -> Iterator[HotplugEvent]:
+        with socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM,
+                           NETLINK_KOBJECT_UEVENT) as sock:
+            sock.bind((0, self.group))
+
+            while True:
+                properties: dict = parse_uevent(sock.recv(65536))
+                if properties.get("SUBSYSTEM") != "block":
+                    continue
+
+                action: str = properties.get("ACTION", "")
+                # "change": media inserted in a card reader
+                if action in {ADD, "change"}:
+                    action = ADD
+                elif action != REMOVE:
+                    continue
+
+                devname: str = properties.get("DEVNAME", "")
+                if devname and not devname.startswith("/"):
+                    devname = f"/dev/{devname}"
+
+                # ID_FS_LABEL has the spaces replaced with "_"
+                label: str = udev_decode(
+                    properties["ID_FS_LABEL_ENC"]
+                ) if "ID_FS_LABEL_ENC" in properties else properties.get(
+                    "ID_FS_LABEL", "")
+
+                yield HotplugEvent(action, devname, label,
+                                   properties.get("ID_FS_UUID", ""))
+
+
+@dataclass
+class InotifySource:
+    """Fallback: watch the udev symlinks in /dev/disk/by-label"""
+
+    dev_root: str = field(default="/dev")
+
+    def __iter__(self) -> Iterator[HotplugEvent]:
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+
+        events: queue.Queue = queue.Queue()
+        by_label: str = os.path.join(self.dev_root, "disk", "by-label")
+
+        class LabelHandler(FileSystemEventHandler):
+
+            def on_created(self, event) -> None:
+                self._put(ADD, event.src_path)
+
+            def on_deleted(self, event) -> None:
+                self._put(REMOVE, event.src_path)
+
+            def _put(self, action: str, link: str) -> None:
+                if os.path.dirname(link) != by_label:
+                    return
+                label: str = udev_decode(os.path.basename(link))
+                devname: str = os.path.realpath(link) if action == ADD else ""
+                events.put(HotplugEvent(action, devname, label))
+
+        observer = Observer()
+        # by-label can be missing while no labelled device is plugged in
+        observer.schedule(LabelHandler(),
+                          os.path.join(self.dev_root, "disk"),
+                          recursive=True)
+        observer.start()
+        try:
+            while True:
+                yield events.get()
+        finally:
+            observer.stop()
+            observer.join()
+
+
+def default_source() -> Any:
+    """Netlink if the kernel lets us bind it, inotify otherwise"""
+
+    try:
+        with socket.socket(socket.AF_NETLINK, socket.SOCK_DGRAM,
+                           NETLINK_KOBJECT_UEVENT) as sock:
+            sock.bind((0, UDEV_GROUP))
+    except OSError:
+        return InotifySource()
+
+    return NetlinkSource()
+
+
+@dataclass
+class AutoMounter:
+    """Mount the favorite USBs on arrival, clean up on removal.
+
+    source is any iterable of HotplugEvent, so synthetic events can be
+    replayed"""
+
+    source: Iterable = field(default_factory=default_source)
+    usb_checker: Any = field(default=None)
+    usb_mounter: Any = field(default=None)
+    # Called with the MountResult of every device mounted
+    on_mounted: Callable = field(default=lambda result: None)
+    # Mount points of the devices mounted by this daemon
+    mounted: dict = field(default_factory=dict)
+
+    def __post_init__(self) -> None:
+        if self.usb_checker is None:
+            # No sudo needed to find the devices
+            self.usb_checker = CheckUsb(inventory=SysfsInventory())
+        if self.usb_mounter is None:
+            self.usb_mounter = MountUsb(usb_checker=self.usb_checker)
+
+    def run(self) -> None:
+        """Handle the events until the source is exhausted"""
+
+        # Favorites plugged in before the daemon started
+        for device in list(self.usb_checker.inventory.refresh()):
+            self.handle(HotplugEvent(ADD, device.devname, device.label,
+                                     device.uuid))
+
+        console.print("[green][+] Waiting for favorite USB devices ...[/]")
+        for event in self.source:
+            self.handle(event)
+
+    def handle(self, event: HotplugEvent) -> Any:
+        """React to one event"""
+
+        if event.action == ADD:
+            return self._device_added(event)
+        if event.action == REMOVE:
+            return self._device_removed(event)
+
+        return None
+
+    def _device_added(self, event: HotplugEvent) -> Any:
+        # Kernel events and inotify do not carry the UUID
+        self.usb_checker.inventory.refresh()
+        device: Any = (self.usb_checker.inventory.find_label(event.label)
+                       if event.label else
+                       self.usb_checker.inventory.find_devname(event.devname))
+
+        label: str = event.label or (device.label if device else "")
+        uuid: str = event.uuid or (device.uuid if device else "")
+
+        if label not in self.usb_checker.devices or not uuid:
+            return None
+
+        devname: str = event.devname or (device.devname if device else "")
+        if self.usb_mounter.mount_table.read().mounts_of(devname):
+            return None
+
+        console.print(f"[green][+] USB [{label}] plugged in[/]")
+        # Not the device seen last time: it may have been reformatted
+        self.usb_checker.forget(label)
+        result: Any = self.usb_mounter.mount_usb(uuid, label)
+
+        if result.status != FAILED:
+            self.mounted[label] = result.mount_directory
+            self.on_mounted(result)
+
+        return result
+
+    def _device_removed(self, event: HotplugEvent) -> Any:
+        if event.label:
+            self.usb_checker.forget(event.label)
+        mounts: Any = self.usb_mounter.mount_table.read()
+
+        mount_points: list = [
+            entry.mount_point for entry in mounts.mounts_of(event.devname)
+        ] if event.devname else []
+
+        if event.label in self.mounted:
+            mount_points.append(self.mounted.pop(event.label))
+        elif event.label in self.usb_checker.devices:
+            mount_points.append(
+                self.usb_checker.mount_point(event.label))
+
+        # All as Paths, whoever returned them: each is cleaned up once
+        mount_points = list(
+            dict.fromkeys(Path(mount_point) for mount_point in mount_points))
+
+        for mount_point in mount_points:
+            if not mounts.mounted_on(mount_point) and \
+                    not os.path.isdir(mount_point):
+                continue
+            console.print(f"[yellow][+] USB removed, cleaning up "
+                          f"{mount_point}[/]")
+            if mounts.mounted_on(mount_point):
+                self.usb_checker.privileged.umount(mount_point)
+            self.usb_checker.privileged.remove_mountpoint(mount_point)
+
+        return mount_points
+
+
+def watch_usbs(metrics_file: Any = None, backend: str = "sysfs") -> None:
+    """Main function to auto-mount the USBs when plugged in. The mount
+    latencies are written to metrics_file after every mount. The sysfs
+    backend finds the devices without sudo"""
+
+    on_mounted: Callable = (lambda result: REGISTRY.write_textfile(
+        metrics_file)) if metrics_file else (lambda result: None)
+
+    try:
+        AutoMounter(usb_checker=CheckUsb(backend=backend),
+                    on_mounted=on_mounted).run()
+    except KeyboardInterrupt:
+        pass
@@ -14,9 +14,19 @@ from helpers import (abspath, Rule_, BeautiPanel, ShowTable, clear_screen,
 from collections import defaultdict
 from dataclasses import dataclass, field
 from rich.console import Console
+from typing import Any
 
 console = Console()
 
+# Fields holding a list, typed as comma separated values
+LIST_FIELDS: list = ["exclude", "include"]
+
+
+def parse_list(value: str) -> list:
+    """ Turn 'a, b, c' into ['a', 'b', 'c'] """
+
+    return [item.strip() for item in value.split(",") if item.strip()]
+
 
 @dataclass
 class ManageJson:
@@ -31,7 +41,7 @@ class ManageJson:
         """ Initialize init variables """
 
         self.json_structure: list = [
-            "folder_id", "folder_to_track", "folder_to_copy_to"
+            "folder_id", "folder_to_track", "folder_to_copy_to", *LIST_FIELDS
         ]
 
         self.json_file = self.load_json_file()
@@ -67,7 +77,8 @@ class ManageJson:
                         if value := console.input(
                                 f"Enter the new value for [green]{item}[/green] of [green]{id_number}[/green]): "
                         ):
-                            element[item] = value
+                            element[item] = parse_list(value) \
+                                if item in LIST_FIELDS else value
 
         if not found_record:  # Flag is False
             BeautiPanel.draw_panel(
@@ -85,7 +96,7 @@ class ManageJson:
 
         Rule_.draw_rule(message='Adding data')
 
-        self.new_entries: defaultdict[str, str] = defaultdict(str)
+        self.new_entries: defaultdict[str, Any] = defaultdict(str)
 
         # Show the next id to insert
         next_id: int = self.get_last_id()
@@ -96,6 +107,12 @@ class ManageJson:
                                borderstyle="red")
 
         for item in self.json_structure:
+            if item in LIST_FIELDS:
+                self.new_entries[item] = parse_list(
+                    console.input(f"Add [green]{item}[/green] "
+                                  f"(comma separated, optional): "))
+                continue
+
             if get_data := console.input(f"Add [green]{item}: [/green]"):
                 self.new_entries[item] = get_data
 
@@ -164,7 +181,7 @@ class ManageJson:
                 if id_number in element["folder_id"]:
 
                     for item in self.json_structure:
-                        del element[item]
+                        element.pop(item, None)
 
             self.dump_to_json_file()
 
@@ -11,17 +11,27 @@
 # -h          show this screen
 # -r          remove database
 # -s          show  usb names
+# --add       add the usb names given, from a file or stdin
+# --remove    remove the usb names given, from a file or stdin
+# --replace   make the usb names given the whole list
+# --allow-empty
+#             let --replace delete every usb name
 # --version   program version
 ##############################################################################
 """
 Usage:
     manage_usb.py [options]
+    manage_usb.py (--add | --remove) [--file=<path>] [<name>...]
+    manage_usb.py --replace [--allow-empty] [--file=<path>] [<name>...]
 
     manage_usb.py -a (add usb name)
     manage_usb.py -d (delete usb name)
     manage_usb.py -h (show this screen)
     manage_usb.py -r (REMOVE database)
     manage_usb.py -s (show usb names)
+    manage_usb.py --add KINGSTON SANDISK (add several usb names)
+    manage_usb.py --replace --file=fleet.txt (the usb names in fleet.txt)
+    manage_usb.py --remove < old.txt (usb names from stdin)
 
 Options:
     -a          add usb name
@@ -29,15 +39,39 @@ Options:
     -h          show this screen
     -r          REMOVE database
     -s          show usb names
+    --add       add the usb names, in one transaction
+    --remove    remove the usb names, in one transaction
+    --replace   make the usb names the whole list, in one transaction
+    --allow-empty
+                let --replace with no usb names delete them all
+    --file=<path>
+                one usb name per line, '-' for stdin. Without names nor
+                file they are read from stdin
     --version   program version
 """
+import sys
+
 from docopt import docopt
 
-from database import CreateDatabase
+from database import CreateDatabase, read_items
 
 if __name__ == "__main__":
     args = docopt(__doc__, version="manage_usb.py v.1.1 - 2022")  # type: ignore
 
+    if args["--add"] or args["--remove"] or args["--replace"]:
+        names: list = read_items(
+            args["<name>"], args["--file"] or
+            ("-" if not args["<name>"] else None))
+        bulk = CreateDatabase(interactive=False)
+
+        if args["--add"]:
+            bulk.add_items(names)
+        elif args["--remove"]:
+            bulk.delete_items(names)
+        else:
+            bulk.replace_items(names, args["--allow-empty"])
+        sys.exit(0)
+
     db = CreateDatabase()
 
     if args["-a"]:
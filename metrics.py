@@ -0,0 +1,210 @@
+#!/usr/bin/python3
+
+##############################################################################
+# Author: Carlos Lacaci Moya
+
+# Name: metrics.py
+# Description: Counters, gauges and histograms in the Prometheus text
+#              format. Written to a node-exporter textfile or served on an
+#              optional localhost HTTP endpoint
+# Date: dom 18 oct 2026 22:14:09 CEST
+# Dependencies:
+# Version: 1.0
+##############################################################################
+
+import math
+import os
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Iterable
+
+COUNTER: str = "counter"
+GAUGE: str = "gauge"
+HISTOGRAM: str = "histogram"
+
+# Upper bounds in seconds of the duration histograms
+DURATION_BUCKETS: tuple = (0.1, 0.5, 1.0, 5.0, 15.0, 60.0, 300.0, 900.0)
+
+
+def _labels(labels: dict) -> str:
+    """Render {"a": "x"} as {a="x"}, escaped as the format asks"""
+
+    if not labels:
+        return ""
+
+    escaped: list = [
+        f'{key}="' + str(value).replace("\\", "\\\\").replace(
+            '"', '\\"').replace("\n", "\\n") + '"'
+        for key, value in sorted(labels.items())
+    ]
+    return "{" + ",".join(escaped) + "}"
+
+
+def _value(value: float) -> str:
+    """Render a sample value without losing precision: integers exactly,
+    floats with repr(), like the Prometheus client"""
+
+    if isinstance(value, int):
+        return str(int(value))
+    if math.isnan(value):
+        return "NaN"
+    if math.isinf(value):
+        return "+Inf" if value > 0 else "-Inf"
+    return repr(float(value))
+
+
+class Metrics:
+    """Thread safe registry of metrics.
+
+    Collectors are called on every render() and return the samples of
+    values owned by other objects, e.g. the depth of a queue, as
+    (kind, name, help, value, labels) tuples"""
+
+    def __init__(self) -> None:
+
+        # name -> (kind, help)
+        self._meta: dict = {}
+        # name -> {labels tuple: value}
+        self._values: dict = {}
+        # name -> {labels tuple: [bucket counts..., sum, count]}
+        self._histograms: dict = {}
+        self._buckets: dict = {}
+        self._collectors: list[Callable[[], Iterable]] = []
+        self._lock = threading.Lock()
+
+    def _declare(self, kind: str, name: str, help: str) -> None:
+        known: Any = self._meta.setdefault(name, (kind, help))
+        if known[0] != kind:
+            raise ValueError(f"{name} is a {known[0]}, not a {kind}")
+
+    def inc(self, name: str, help: str, value: float = 1, **labels) -> None:
+        """Add value to a counter"""
+
+        with self._lock:
+            self._declare(COUNTER, name, help)
+            key: tuple = tuple(sorted(labels.items()))
+            values: dict = self._values.setdefault(name, {})
+            values[key] = values.get(key, 0) + value
+
+    def set(self, name: str, help: str, value: float, **labels) -> None:
+        """Set a gauge"""
+
+        with self._lock:
+            self._declare(GAUGE, name, help)
+            self._values.setdefault(name,
+                                    {})[tuple(sorted(labels.items()))] = value
+
+    def observe(self,
+                name: str,
+                help: str,
+                value: float,
+                buckets: tuple = DURATION_BUCKETS,
+                **labels) -> None:
+        """Add one observation to a histogram"""
+
+        with self._lock:
+            self._declare(HISTOGRAM, name, help)
+            bounds: tuple = self._buckets.setdefault(name, buckets)
+            key: tuple = tuple(sorted(labels.items()))
+            counts: list = self._histograms.setdefault(name, {}).setdefault(
+                key, [0] * len(bounds) + [0.0, 0])
+
+            for index, bound in enumerate(bounds):
+                if value <= bound:
+                    counts[index] += 1
+            counts[-2] += value
+            counts[-1] += 1
+
+    def collector(self, collect: Callable[[], Iterable]) -> None:
+        """Register a function returning samples at render time"""
+
+        self._collectors.append(collect)
+
+    def render(self) -> str:
+        """Return all the metrics in the Prometheus text format"""
+
+        collected: dict = {}
+        for collect in list(self._collectors):
+            try:
+                for kind, name, help, value, labels in collect():
+                    _, samples = collected.setdefault(name,
+                                                      ((kind, help), []))
+                    samples.append((tuple(sorted(labels.items())), value))
+            except Exception as error:
+                print(f"[!] {error}")
+
+        lines: list = []
+        with self._lock:
+            names: list = sorted({*self._meta, *collected})
+            for name in names:
+                kind, help = self._meta.get(name) or collected[name][0]
+                lines.append(f"# HELP {name} {help}")
+                lines.append(f"# TYPE {name} {kind}")
+
+                if kind == HISTOGRAM:
+                    lines += self._render_histogram(name)
+                    continue
+
+                samples: list = list(self._values.get(name, {}).items())
+                samples += collected.get(name, (None, []))[1]
+                for key, value in samples:
+                    lines.append(f"{name}{_labels(dict(key))} {_value(value)}")
+
+        return "\n".join(lines) + "\n"
+
+    def _render_histogram(self, name: str) -> list:
+        lines: list = []
+        bounds: tuple = self._buckets[name]
+        for key, counts in self._histograms.get(name, {}).items():
+            labels: dict = dict(key)
+            for bound, count in zip(bounds, counts):
+                bucket: dict = {**labels, "le": _value(float(bound))}
+                lines.append(f"{name}_bucket{_labels(bucket)} {count}")
+            lines.append(f"{name}_bucket{_labels({**labels, 'le': '+Inf'})} "
+                         f"{counts[-1]}")
+            lines.append(f"{name}_sum{_labels(labels)} {_value(counts[-2])}")
+            lines.append(f"{name}_count{_labels(labels)} {counts[-1]}")
+
+        return lines
+
+    def write_textfile(self, path: Any) -> None:
+        """Write the metrics for the node-exporter textfile collector.
+        Atomic: the collector never reads half a file"""
+
+        temporary: str = f"{path}.{os.getpid()}.tmp"
+        with open(temporary, "w") as textfile:
+            textfile.write(self.render())
+        os.replace(temporary, path)
+
+    def serve(self, port: int, host: str = "127.0.0.1") -> Any:
+        """Serve the metrics on http://host:port/metrics in a thread"""
+
+        metrics: Metrics = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+
+            def do_GET(self) -> None:
+                if self.path.split("?")[0] not in ("/", "/metrics"):
+                    self.send_error(404)
+                    return
+                body: bytes = metrics.render().encode()
+                self.send_response(200)
+                self.send_header("Content-Type",
+                                 "text/plain; version=0.0.4; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format: str, *args: Any) -> None:
+                # Scrapes are not worth a line each
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever,
+                         name="metrics",
+                         daemon=True).start()
+        return server
+
+
+# Registry shared by the process
+REGISTRY: Metrics = Metrics()
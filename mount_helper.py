@@ -0,0 +1,340 @@
+#!/usr/bin/python3
+##############################################################################
+# Author: Carlos Lacaci Moya
+# Name: mount_helper.py
+# Description: Long-lived privileged helper for mount_usb.py. Started once
+#              as root, it listens on a Unix socket and runs batches of
+#              validated operations: prepare mountpoint, mount by UUID,
+#              unmount and remove mountpoint
+# Date: dom 18 oct 2026 12:05:48 CEST
+# Version: 1.0
+# Dependencies: See requirements.txt
+##############################################################################
+"""
+Usage:
+    mount_helper.py [--socket=<path>] [--root=<dir>] [--record=<file>]
+    mount_helper.py -h
+
+Options:
+    --socket=<path>     Unix socket to listen on [default: /run/pyusb/helper.sock]
+    --root=<dir>        only mountpoints directly inside <dir> [default: /media]
+    --record=<file>     do not run anything, record the operations in <file>
+                        (stand-in mode, no root needed)
+    -h                  show this help
+"""
+import grp
+import json
+import os
+import re
+import shlex
+import signal
+import socket
+import socketserver
+import subprocess
+from collections import namedtuple
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any
+
+from docopt import docopt  # type:ignore
+
+from helpers import RunCommand
+
+# Default socket of the helper
+HELPER_SOCKET: str = "/run/pyusb/helper.sock"
+
+# Group allowed to talk to the helper and owning the mount points
+HELPER_GROUP: str = "users"
+
+# Result of one operation. Same attributes used from subprocess results
+OpResult = namedtuple('OpResult', 'op, returncode, stdout, stderr')
+
+# Operations and the arguments they take
+OPERATIONS: dict[str, tuple] = {
+    "prepare": ("path", ),
+    "mount": ("uuid", "path", "options"),
+    "umount": ("path", ),
+    "remove": ("path", ),
+}
+
+VALID_UUID: Any = re.compile(r"^[0-9A-Za-z-]{1,64}$")
+# One mount option: the ones mount_usb.py sets and the usual vfat/exfat
+# ones a favorite can have in the registry (mount_options)
+VALID_OPTION: str = (r"((uid|gid|umask|dmask|fmask|codepage)=\d+"
+                     r"|iocharset=[\w-]+|shortname=(lower|win95|winnt|mixed)"
+                     r"|utf8(=[01])?|flush|sync|ro|rw|noatime|relatime"
+                     r"|nosuid|nodev|noexec)")
+VALID_OPTIONS: Any = re.compile(rf"^{VALID_OPTION}(,{VALID_OPTION})*$")
+
+# Added to every mount, last so no option before them can turn them off:
+# the group of the socket must not get setuid binaries or device nodes
+FORCED_OPTIONS: tuple = ("nosuid", "nodev")
+
+
+class InvalidOperation(ValueError):
+    """The operation requested to the helper is not allowed"""
+
+
+def validate(operation: dict, root: str) -> dict:
+    """Check an operation before running it as root.
+
+    Mountpoints must be a direct child of root, UUIDs and mount options are
+    checked against a whitelist. Mounts always get FORCED_OPTIONS"""
+
+    if not isinstance(operation, dict):
+        raise InvalidOperation(f"bad operation: {operation}")
+
+    name: Any = operation.get("op")
+    if name not in OPERATIONS:
+        raise InvalidOperation(f"unknown operation: {name}")
+
+    arguments: dict = {"op": name}
+    for argument in OPERATIONS[name]:
+        arguments[argument] = str(operation.get(argument, ""))
+
+    path = Path(arguments["path"])
+    if path.parent != Path(root) or path.name in {"", ".", ".."}:
+        raise InvalidOperation(f"mountpoint not allowed: {path}")
+
+    if name == "mount":
+        if not VALID_UUID.match(arguments["uuid"]):
+            raise InvalidOperation(f"invalid UUID: {arguments['uuid']}")
+        if arguments["options"] and not VALID_OPTIONS.match(
+                arguments["options"]):
+            raise InvalidOperation(
+                f"mount options not allowed: {arguments['options']}")
+        options: list = [
+            option for option in arguments["options"].split(",")
+            if option and option not in FORCED_OPTIONS
+        ]
+        arguments["options"] = ",".join(options + list(FORCED_OPTIONS))
+
+    return arguments
+
+
+@dataclass
+class SystemExecutor:
+    """Run the operations directly. The helper must be root"""
+
+    group: str = field(default=HELPER_GROUP)
+
+    def run(self, op: dict) -> OpResult:
+        """Run one validated operation"""
+
+        path: str = op["path"]
+
+        if op["op"] == "mount":
+            command: list[str] = ["mount", "--uuid", op["uuid"], path]
+            if op["options"]:
+                command += ["-o", op["options"]]
+            return self._run(op["op"], command)
+
+        if op["op"] == "umount":
+            return self._run(op["op"], ["umount", path])
+
+        # Never follow a symlink planted in the mount root
+        if os.path.islink(path):
+            return OpResult(op["op"], 1, "", f"{path} is a symlink")
+
+        try:
+            if op["op"] == "prepare":
+                os.makedirs(path, exist_ok=True)
+                os.chmod(path, 0o777)
+                os.chown(path, -1, grp.getgrnam(self.group).gr_gid)
+            elif op["op"] == "remove":
+                # Only empty directories, never the content of a device
+                os.rmdir(path)
+        except (OSError, KeyError) as error:
+            return OpResult(op["op"], 1, "", str(error))
+
+        return OpResult(op["op"], 0, "", "")
+
+    @staticmethod
+    def _run(name: str, command: list) -> OpResult:
+        cmd: Any = subprocess.run(command, capture_output=True, text=True)
+        return OpResult(name, cmd.returncode, cmd.stdout, cmd.stderr)
+
+
+@dataclass
+class RecordingExecutor:
+    """Stand-in for SystemExecutor: records the operations, runs nothing"""
+
+    record_file: str = field(default="")
+    operations: list = field(default_factory=list)
+
+    def run(self, op: dict) -> OpResult:
+        """Record the operation and report success"""
+
+        self.operations.append(op)
+        if self.record_file:
+            with open(self.record_file, "a") as record:
+                record.write(json.dumps(op) + "\n")
+
+        return OpResult(op["op"], 0, "", "")
+
+
+class _RequestHandler(socketserver.StreamRequestHandler):
+    """One JSON request per line: {"ops": [...]}. The answer is one JSON
+    line: {"results": [...]}"""
+
+    def handle(self) -> None:
+        for line in self.rfile:
+            try:
+                request: Any = json.loads(line)
+                operations: list = request["ops"]
+            except (ValueError, KeyError, TypeError) as error:
+                self._reply({"error": f"bad request: {error}"})
+                continue
+
+            results: list = []
+            for operation in operations:
+                try:
+                    op: dict = validate(operation, self.server.root)
+                    result: OpResult = self.server.executor.run(op)
+                except InvalidOperation as error:
+                    result = OpResult(None, 2, "", str(error))
+                results.append(result._asdict())
+
+            self._reply({"results": results})
+
+    def _reply(self, message: dict) -> None:
+        self.wfile.write(json.dumps(message).encode() + b"\n")
+        self.wfile.flush()
+
+
+class HelperServer(socketserver.ThreadingUnixStreamServer):
+    """Unix socket server running the operations with the executor"""
+
+    daemon_threads = True
+
+    def __init__(self, socket_path: str, executor: Any,
+                 root: str = "/media") -> None:
+        self.executor: Any = executor
+        self.root: str = root
+
+        Path(socket_path).parent.mkdir(parents=True, exist_ok=True)
+        if os.path.exists(socket_path):
+            os.unlink(socket_path)
+
+        super().__init__(socket_path, _RequestHandler)
+
+        # Only root and the helper group can send operations
+        os.chmod(socket_path, 0o660)
+        try:
+            os.chown(socket_path, -1, grp.getgrnam(HELPER_GROUP).gr_gid)
+        except (OSError, KeyError):
+            pass
+
+
+@dataclass
+class HelperClient:
+    """Talk to a running mount_helper.py instead of forking sudo"""
+
+    socket_path: str = field(default=HELPER_SOCKET)
+
+    def run_batch(self, operations: list) -> list:
+        """Send several operations in one request and return their
+        results in the same order"""
+
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.connect(self.socket_path)
+            sock.sendall(json.dumps({"ops": operations}).encode() + b"\n")
+            with sock.makefile("rb") as answer:
+                reply: dict = json.loads(answer.readline())
+
+        if "error" in reply:
+            raise InvalidOperation(reply["error"])
+
+        return [OpResult(**result) for result in reply["results"]]
+
+    def prepare_mountpoint(self, path: Any) -> OpResult:
+        return self.run_batch([{"op": "prepare", "path": str(path)}])[0]
+
+    def mount(self, uuid: str, path: Any, options: str = "") -> OpResult:
+        return self.run_batch([{
+            "op": "mount",
+            "uuid": uuid,
+            "path": str(path),
+            "options": options
+        }])[0]
+
+    def umount(self, path: Any) -> OpResult:
+        return self.run_batch([{"op": "umount", "path": str(path)}])[0]
+
+    def remove_mountpoint(self, path: Any) -> OpResult:
+        return self.run_batch([{"op": "remove", "path": str(path)}])[0]
+
+
+@dataclass
+class SudoOperations:
+    """Same operations as HelperClient, one sudo call each"""
+
+    process: Any = field(default=RunCommand(), init=False)
+
+    def _run(self, name: str, command: str) -> OpResult:
+        cmd: Any = self.process.run(command)
+        return OpResult(name, cmd.returncode, cmd.stdout, cmd.stderr)
+
+    def prepare_mountpoint(self, path: Any) -> OpResult:
+        return self._run(
+            "prepare", f"sudo install -d -m 777 -g {HELPER_GROUP} "
+            f"{shlex.quote(str(path))}")
+
+    def mount(self, uuid: str, path: Any, options: str = "") -> OpResult:
+        options = f"-o {shlex.quote(options)}" if options else ""
+        return self._run(
+            "mount", f"sudo mount --uuid {shlex.quote(uuid)} "
+            f"{shlex.quote(str(path))} {options}")
+
+    def umount(self, path: Any) -> OpResult:
+        return self._run("umount", f"cd;sudo umount {shlex.quote(str(path))}")
+
+    def remove_mountpoint(self, path: Any) -> OpResult:
+        return self._run("remove", f"sudo rmdir {shlex.quote(str(path))}")
+
+
+def _terminate(signum: int, frame: Any) -> None:
+    raise SystemExit(0)
+
+
+def privileged_operations(socket_path: str = HELPER_SOCKET) -> Any:
+    """Use the helper if it is running, sudo otherwise. The socket file
+    alone is not enough: a killed helper can leave it behind"""
+
+    if not os.path.exists(socket_path):
+        return SudoOperations()
+
+    try:
+        with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+            sock.settimeout(1)
+            sock.connect(socket_path)
+    except OSError:
+        return SudoOperations()
+
+    return HelperClient(socket_path)
+
+
+if __name__ == "__main__":
+    args = docopt(__doc__, version="mount_helper.py v.1.0 - 2026")  # type: ignore
+
+    if args["--record"]:
+        executor: Any = RecordingExecutor(args["--record"])
+    else:
+        if os.geteuid() != 0:
+            raise SystemExit("mount_helper.py must run as root "
+                             "(or use --record=<file>)")
+        executor = SystemExecutor()
+
+    server = HelperServer(args["--socket"], executor, args["--root"])
+    print(f"mount_helper listening on: {args['--socket']}")
+
+    # Stopped by the service manager: leave through the finally below, the
+    # socket file must not outlive the helper
+    signal.signal(signal.SIGTERM, _terminate)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        os.unlink(args["--socket"])
@@ -0,0 +1,276 @@
+#!/usr/bin/python3
+
+##############################################################################
+# Author: Carlos Lacaci Moya
+
+# Name: mount_table.py
+# Description: Read the mount table from /proc/self/mountinfo. One file read,
+#              no subprocesses
+# Date: dom 18 oct 2026 10:41:07 CEST
+# Dependencies:
+# Version: 1.0
+##############################################################################
+
+import os
+import re
+import select
+import threading
+import time
+from collections import namedtuple
+from dataclasses import dataclass, field
+from pathlib import Path
+from typing import Any, Callable, Iterable, Iterator, Optional
+
+from devices import udev_name
+
+# One line of /proc/self/mountinfo
+MountEntry = namedtuple(
+    'MountEntry', 'source, mount_point, fstype, options, super_options, devno')
+
+# Paths in mountinfo escape space, tab, newline and backslash in octal
+MOUNTINFO_ESCAPE: Any = re.compile(r"\\([0-7]{3})")
+
+
+def _unescape(value: str) -> str:
+    """Decode the octal escapes used by the kernel, e.g. \\040 -> ' '"""
+
+    return MOUNTINFO_ESCAPE.sub(lambda match: chr(int(match.group(1), 8)),
+                                value)
+
+
+def parse_mountinfo(content: str) -> Iterator[MountEntry]:
+    """Parse the content of a mountinfo file into MountEntry records.
+
+    36 35 98:0 /mnt1 /mnt2 rw,noatime master:1 - ext3 /dev/root rw,errors=continue
+    (1)(2)(3)   (4)   (5)      (6)      (7)   (8) (9)   (10)         (11)
+    """
+
+    for line in content.splitlines():
+        fields: list[str] = line.split()
+
+        # The optional fields (7) end with a single "-"
+        try:
+            separator: int = fields.index("-", 6)
+        except ValueError:
+            continue
+
+        yield MountEntry(
+            source=_unescape(fields[separator + 2]),
+            mount_point=Path(_unescape(fields[4])),
+            fstype=fields[separator + 1],
+            options=fields[5].split(","),
+            super_options=fields[separator + 3].split(",")
+            if len(fields) > separator + 3 else [],
+            devno=fields[2],
+        )
+
+
+@dataclass
+class MountIndex:
+    """Mounted filesystems indexed by source device and mount point"""
+
+    by_source: dict = field(default_factory=dict)
+    by_mount_point: dict = field(default_factory=dict)
+
+    def add(self, entry: MountEntry) -> None:
+        """Index the entry. A device can be mounted in several places"""
+
+        self.by_source.setdefault(entry.source, []).append(entry)
+        # Later mounts on the same directory hide the previous ones
+        self.by_mount_point[entry.mount_point] = entry
+
+    def mounts_of(self, source: str) -> list:
+        """Return where the source device is mounted"""
+
+        return self.by_source.get(source, [])
+
+    def mounted_on(self, mount_point: Any) -> Optional[MountEntry]:
+        """Return what is mounted exactly on mount_point"""
+
+        return self.by_mount_point.get(Path(mount_point))
+
+    def __iter__(self) -> Iterator[MountEntry]:
+        yield from self.by_mount_point.values()
+
+
+@dataclass
+class MountTable:
+    """Reader of the kernel mount table"""
+
+    mountinfo: str = field(default="/proc/self/mountinfo")
+
+    def read(self) -> MountIndex:
+        """Read and index the mount table"""
+
+        index = MountIndex()
+        with open(self.mountinfo, "r") as mi:
+            for entry in parse_mountinfo(mi.read()):
+                index.add(entry)
+
+        return index
+
+
+# Seconds a cached mount table is trusted without a change notification
+MOUNT_STATE_TTL: float = 10.0
+
+
+class MountState:
+    """Cached mount table shared by the whole process.
+
+    The table is read again when the TTL expires or when the kernel flags a
+    change: /proc/self/mountinfo signals POLLPRI after every mount and
+    unmount. start() also runs a thread that calls the subscribers as soon
+    as the table changes"""
+
+    def __init__(self,
+                 mountinfo: str = "/proc/self/mountinfo",
+                 ttl: float = MOUNT_STATE_TTL) -> None:
+
+        self.mountinfo: str = mountinfo
+        self.ttl: float = ttl
+
+        # Times the table was really read
+        self.reads: int = 0
+
+        # Called without arguments after a change of the mount table
+        self.subscribers: list[Callable[[], Any]] = []
+
+        self._index: Optional[MountIndex] = None
+        self._read_at: float = 0.0
+        self._lock = threading.Lock()
+        self._file: Any = None
+        self._poller: Any = None
+        self._thread: Any = None
+
+    def _open(self) -> None:
+        self._file = open(self.mountinfo, "r")
+        self._poller = select.poll()
+        self._poller.register(self._file, select.POLLPRI | select.POLLERR)
+
+    def _changed(self, timeout: float = 0) -> bool:
+        """True if the mount table changed since the last poll. The event
+        is consumed by the poll itself"""
+
+        return bool(self._poller.poll(timeout * 1000))
+
+    def read(self) -> MountIndex:
+        """Return the mount table, from the cache when it is still valid"""
+
+        with self._lock:
+            if self._file is None:
+                self._open()
+
+            changed: bool = self._changed()
+            if changed or self._index is None or \
+                    time.monotonic() - self._read_at > self.ttl:
+                self._file.seek(0)
+                index = MountIndex()
+                for entry in parse_mountinfo(self._file.read()):
+                    index.add(entry)
+
+                self._index = index
+                self._read_at = time.monotonic()
+                self.reads += 1
+
+            return self._index
+
+    def invalidate(self) -> None:
+        """Forget the cached table, e.g. right after a mount"""
+
+        with self._lock:
+            self._index = None
+
+    def is_mounted(self, mount_point: Any) -> bool:
+        """True if something is mounted exactly on mount_point"""
+
+        return self.read().mounted_on(os.path.abspath(mount_point)) is not None
+
+    def subscribe(self, callback: Callable[[], Any]) -> None:
+        """Call callback after every change, once start() was called"""
+
+        self.subscribers.append(callback)
+
+    def start(self) -> None:
+        """Watch the mount table in a thread"""
+
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._watch,
+                                            name="mount-state",
+                                            daemon=True)
+            self._thread.start()
+
+    def _watch(self) -> None:
+        # Own descriptor: the events of read() must not be stolen
+        with open(self.mountinfo, "r") as mountinfo:
+            poller: Any = select.poll()
+            poller.register(mountinfo, select.POLLPRI | select.POLLERR)
+            while True:
+                if not poller.poll():
+                    continue
+                self.invalidate()
+                for callback in list(self.subscribers):
+                    try:
+                        callback()
+                    except Exception as error:
+                        print(f"[!] {error}")
+
+
+_shared_state: Optional[MountState] = None
+_shared_lock = threading.Lock()
+
+
+def mount_state() -> MountState:
+    """Return the MountState shared by the process"""
+
+    global _shared_state
+    with _shared_lock:
+        if _shared_state is None:
+            _shared_state = MountState()
+        return _shared_state
+
+
+def label_to_devname(label: str, by_label: str = "/dev/disk/by-label") -> str:
+    """Resolve a filesystem LABEL to its device node through the udev
+    symlinks. Returns an empty string if the label is not present"""
+
+    link: str = os.path.join(by_label, udev_name(label))
+
+    return os.path.realpath(link) if os.path.lexists(link) else ""
+
+
+# Folders where removable media are mounted and the depth of the mount
+# points below them: /media/LABEL, /mnt/LABEL and /run/media/USER/LABEL
+MEDIA_ROOTS: dict = {
+    Path("/media"): 1,
+    Path("/mnt"): 1,
+    Path("/run/media"): 2,
+}
+
+
+def media_mount_point(path: Any,
+                      mount_points: Iterable = ()) -> Optional[Path]:
+    """Return the mount point a path below the removable media folders
+    lives on, e.g. /media/KINGSTON for /media/KINGSTON/backup. mount_points
+    are checked first: the preferred mount points of the favorites, which
+    can be anywhere. None for the other paths"""
+
+    path = Path(os.path.abspath(path))
+
+    # The deepest one wins, e.g. /backup/usb over /backup
+    for mount_point in sorted((Path(os.path.abspath(mount_point))
+                               for mount_point in mount_points
+                               if mount_point),
+                              key=lambda mount_point: len(mount_point.parts),
+                              reverse=True):
+        if path == mount_point or mount_point in path.parents:
+            return mount_point
+
+    for root, depth in MEDIA_ROOTS.items():
+        try:
+            parts: tuple = path.relative_to(root).parts
+        except ValueError:
+            continue
+        if len(parts) >= depth:
+            return root.joinpath(*parts[:depth])
+
+    return None
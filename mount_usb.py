@@ -11,19 +11,90 @@
 # Version: 1.1
 ##############################################################################
 
+import ctypes
+import ctypes.util
+import grp
+import os
 import subprocess
-import re
+import time
 from pathlib import Path
 from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor
 from dataclasses import dataclass, field
 from typing import Any, Iterator
 from rich.console import Console
+from rich.markup import escape
 from database import CreateDatabase
+from devices import INVENTORIES, cached_device
 from helpers import BeautiPanel
+from metrics import REGISTRY
+from mount_helper import privileged_operations
+from mount_table import label_to_devname, mount_state
 
 # From rich module
 console = Console()
 
+# Outcome of mounting one device
+MountResult = namedtuple('MountResult',
+                         'name, status, mount_directory, elapsed, message')
+MOUNTED: str = "mounted"
+ALREADY_MOUNTED: str = "already mounted"
+UNMOUNTED: str = "unmounted"
+FAILED: str = "failed"
+
+# Devices mounted at the same time by mount_all()
+MOUNT_JOBS: int = 4
+
+# Group owning the mount points
+MOUNT_GROUP: str = "users"
+
+# Filesystems without unix permissions. Ownership and permissions of their
+# files are set with mount options
+NO_PERMISSIONS_FSTYPES: set[str] = {"vfat", "msdos", "exfat", "ntfs", "ntfs3"}
+
+
+def flush_filesystem(mount_point: Any) -> None:
+    """Write the dirty pages of the filesystem mounted on mount_point with
+    syncfs(2). Falls back to sync(2), which flushes every filesystem"""
+
+    libc: Any = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+    descriptor: int = os.open(mount_point, os.O_RDONLY | os.O_DIRECTORY)
+    try:
+        if getattr(libc, "syncfs", None) is None or \
+                libc.syncfs(descriptor) != 0:
+            os.sync()
+    finally:
+        os.close(descriptor)
+
+
+def writeback(meminfo: str = "/proc/meminfo") -> tuple:
+    """Return the kB waiting to be written (Dirty) and being written
+    (Writeback), for all the devices"""
+
+    values: dict = {}
+    with open(meminfo, "r") as info:
+        for line in info:
+            key, _, value = line.partition(":")
+            if key in ("Dirty", "Writeback"):
+                values[key] = int(value.split()[0])
+
+    return values.get("Dirty", 0), values.get("Writeback", 0)
+
+
+def in_flight(device: str, sys_root: str = "/sys") -> Any:
+    """Return the I/O requests the block device (e.g. /dev/sdb1) has in
+    flight, from /sys/class/block/<name>/stat. None if it is unknown"""
+
+    stat: str = os.path.join(sys_root, "class", "block",
+                             os.path.basename(os.path.realpath(device)),
+                             "stat")
+    try:
+        with open(stat, "r") as counters:
+            # Field 9: I/Os currently in flight
+            return int(counters.read().split()[8])
+    except (OSError, ValueError, IndexError):
+        return None
+
 
 class RunCommand:
     """Execute command as a subprocess"""
@@ -44,37 +115,139 @@ class CheckUsb:
     process: Any = field(default=RunCommand(), init=False)
     connected: Any = field(default=namedtuple('connected', 'status, name'))
     mount_directory: str = field(default="/media")
-    database: Any = field(default=CreateDatabase())
+    # Opened when a CheckUsb is created, not when the module is imported
+    database: Any = field(default_factory=CreateDatabase)
+    # Device discovery backend: "blkid" (sudo) or "sysfs" (no privileges)
+    backend: str = field(default="blkid")
+    inventory: Any = field(default=None)
+    # mount_helper.HelperClient if the helper is running, sudo otherwise
+    privileged: Any = field(default=None)
     devices: list = field(default_factory=list)
+    # Where the udev /dev/disk/by-* symlinks are looked for
+    dev_root: str = field(default="/dev")
+    # UUID cache of the registry: lookups answered without probing and
+    # lookups that needed the inventory
+    cache_hits: int = field(default=0, init=False)
+    cache_misses: int = field(default=0, init=False)
+    _found: dict = field(default_factory=dict, init=False)
 
     def __post_init__(self) -> None:
-        """ Get devices names from the usbs.dbm"""
+        """ Get devices names from the registry"""
 
         # FOR DEBUGGING
         # print("Calling from CheckUsb")
 
         self.devices: list = self.database.show_items()
 
+        if self.inventory is None:
+            if self.backend not in INVENTORIES:
+                raise ValueError(f"unknown backend {self.backend}, use one "
+                                 f"of: {', '.join(INVENTORIES)}")
+            self.inventory = INVENTORIES[self.backend]()
+
+        if self.privileged is None:
+            self.privileged = privileged_operations()
+
+    def _device(self, usb_name: str) -> Any:
+        """Return the plugged device with the label, None if it is not
+        plugged in.
+
+        The UUID remembered in the registry is checked with the udev
+        symlinks. The inventory (blkid) is only used for unknown USBs or
+        when the symlinks do not match the registry"""
+
+        if usb_name in self._found:
+            return self._found[usb_name]
+
+        favorite: Any = self.database.registry.get(usb_name)
+        trusted, device = cached_device(
+            usb_name, favorite.uuid, favorite.fstype,
+            self.dev_root) if favorite else (False, None)
+        if trusted:
+            self.cache_hits += 1
+        else:
+            self.cache_misses += 1
+            device = self.inventory.find_label(usb_name)
+
+        if favorite is not None and device is not None and device.uuid:
+            self.database.registry.seen(usb_name, device.uuid, device.fstype)
+
+        self._found[usb_name] = device
+        return device
+
+    def forget(self, usb_name: str) -> None:
+        """Drop what is known about the plugged device, e.g. after it was
+        unplugged: it may come back reformatted"""
+
+        self._found.pop(usb_name, None)
+
+    def mount_point(self, usb_name: str) -> Path:
+        """Return where the USB is mounted: its preferred mount point in the
+        registry or mount_directory/label"""
+
+        favorite: Any = self.database.registry.get(usb_name)
+        if favorite is not None and favorite.mount_point:
+            return Path(favorite.mount_point)
+
+        return Path().joinpath(self.mount_directory, usb_name)
+
     def _check_mount_directory(self, usb_name: str) -> Path:
-        """Check if mount_directory exists, if not create it"""
+        """Check if mount_directory exists, if not create it.
+
+        Only the empty mount point is touched: nothing is done if a device
+        is already mounted on it and its content is never walked"""
+
+        mnt_directory: Path = self.mount_point(usb_name)
+
+        if mount_state().is_mounted(mnt_directory):
+            return mnt_directory
 
-        mnt_directory: Path = Path().joinpath(self.mount_directory, usb_name)
+        try:
+            gid: int = grp.getgrnam(MOUNT_GROUP).gr_gid
+        except KeyError:
+            gid = -1
 
-        # Creating the mnt_directory
-        if not mnt_directory.is_dir():
-            make_dir: str = f"sudo mkdir -p {mnt_directory}"
-            self.process.run(make_dir)
+        try:
+            # Creating the mnt_directory
+            mnt_directory.mkdir(parents=True, exist_ok=True)
+            status: os.stat_result = mnt_directory.stat()
 
-        change_permissions: str = f"sudo chmod -R 777 {mnt_directory}"
-        self.process.run(change_permissions)
+            if status.st_mode & 0o777 != 0o777:
+                os.chmod(mnt_directory, 0o777)
+            if gid != -1 and status.st_gid != gid:
+                os.chown(mnt_directory, -1, gid)
 
-        change_group: str = f"sudo chgrp -R users {mnt_directory}"
-        self.process.run(change_group)
+        except PermissionError:
+            # mount_directory belongs to root: one non recursive call
+            self.privileged.prepare_mountpoint(mnt_directory)
 
         return mnt_directory
 
+    def _mount_options(self, usb_name: str) -> str:
+        """Return the mount options for the filesystem of the USB"""
+
+        device: Any = self._device(usb_name)
+        fstype: str = device.fstype if device is not None else ""
+
+        # Extra options of the device in the registry
+        favorite: Any = self.database.registry.get(usb_name)
+        extra: list = [favorite.mount_options
+                       ] if favorite is not None and favorite.mount_options \
+            else []
+
+        # ext4, btrfs, ... keep the ownership stored on the device
+        if fstype and fstype not in NO_PERMISSIONS_FSTYPES:
+            return ",".join(extra)
+
+        try:
+            gid: int = grp.getgrnam(MOUNT_GROUP).gr_gid
+        except KeyError:
+            gid = os.getgid()
+
+        return ",".join([f"uid={os.getuid()},gid={gid},umask=000", *extra])
+
     def _get_usbs_name(self) -> Iterator[str]:
-        """Read and return the favorite USBs from 'usbs.dbm'"""
+        """Read and return the favorite USBs from the registry"""
 
         yield from self.devices
 
@@ -84,14 +257,9 @@ class CheckUsb:
         usbs_connected: list[str] = []
         favorite_usbs_list: list[str] = list(self._get_usbs_name())
 
+        # Known USBs from the registry, one blkid snapshot for the rest
         for usb_name in favorite_usbs_list:
-            get_device_name: str = f"sudo blkid | grep {usb_name}"
-            cmd: Any = self.process.run(get_device_name)
-            # FOR DEBUGGING
-            # print(cmd)
-            get_cmd_output: int = cmd.returncode
-
-            if get_cmd_output == 0:
+            if self._device(usb_name) is not None:
                 output_code: bool = True
                 console.print(f"[green][+] USB [{usb_name}] connected[/]")
 
@@ -104,26 +272,17 @@ class CheckUsb:
     def _find_usb_uuid(self, usb: str) -> str:
         """Return the UUID of the USBs found"""
 
-        get_device_uuid: str = f"sudo blkid | grep {usb}"
-        cmd: Any = self.process.run(get_device_uuid)
-
-        # FOR DEBUGGING
-        # print(cmd)
-        get_cmd_output: int = cmd.returncode
+        usb_uuid: str = ""
+        device: Any = self._device(usb)
         # FOR DEBUGGING
-        # print(get_cmd_output)
-
-        if get_cmd_output == 0:
-            regex: Any = re.compile(r"\sUUID=(\S+)", re.M)
-            if match := regex.search(str(cmd)):
-                # FOR DEBUGGING
-                console.print(
-                    f"[green][+] Found: USB [{usb}] with id: {match.group(1)}[/]"
-                )
-                usb_uuid: Any = match.group(1).strip('"')
+        # print(device)
 
-            else:
-                console.print(f"[red][!] USB [{usb}] not connected[/]")
+        if device is not None and device.uuid:
+            console.print(
+                f"[green][+] Found: USB [{usb}] with id: {device.uuid}[/]")
+            usb_uuid = device.uuid
+        else:
+            console.print(f"[red][!] USB [{usb}] not connected[/]")
 
         return usb_uuid
 
@@ -132,56 +291,85 @@ class CheckUsb:
 class MountUsb:
     """Class for mounting USB drives"""
 
-    usb_checker: Any = field(default=CheckUsb())
+    usb_checker: Any = field(default_factory=CheckUsb)
     process: Any = field(default=RunCommand(), init=False)
+    # Shared with check_media, Handler and the hotplug watcher
+    mount_table: Any = field(default_factory=mount_state)
     mounted_usb: list = field(default_factory=list)
 
-    def mount_usb(self, usb_uuid: str, usb_name: str) -> None:
+    def mount_usb(self, usb_uuid: str, usb_name: str) -> MountResult:
         """Mount the device with the given _id"""
 
+        start: float = time.monotonic()
         mnt_directory: Path = self.usb_checker._check_mount_directory(usb_name)
 
-        mount: str = f"sudo mount --uuid {usb_uuid} {mnt_directory} -o umask=000"
-        cmd: Any = self.process.run(mount)
+        options: str = self.usb_checker._mount_options(usb_name)
+
+        cmd: Any = self.usb_checker.privileged.mount(usb_uuid, mnt_directory,
+                                                     options)
         # FOR DEBUGGING
         # print(cmd)
         returncode: int = cmd.returncode
         # print(returncode)
+        elapsed: float = time.monotonic() - start
 
         if returncode == 0:
             console.print(
                 f"[green][+] USB [{usb_name}] mounted on: {mnt_directory}[/]")
+            status: str = MOUNTED
         elif returncode in {32, 1}:
             # elif returncode == 32 or returncode == 1:
             console.print(f"[red][!] USB [{usb_name}] was already mounted[/]")
+            status = ALREADY_MOUNTED
         else:
             console.print("[red]! Unknown returncode[/]")
+            status = FAILED
 
             # FOR DEBUGGING
             # console.print(cmd)
 
+        REGISTRY.inc("pyusb_mounts_total", "Mount attempts", device=usb_name,
+                     status=status)
+        REGISTRY.set("pyusb_mount_duration_seconds",
+                     "Duration of the last mount", elapsed, device=usb_name)
+
+        return MountResult(usb_name, status, mnt_directory, elapsed,
+                           cmd.stderr.strip())
+
     def mounted_usbs(self, show_output: bool = True) -> list:
         """List already mounted USBs"""
 
-        # mounted_usb: list = []
-        usb_mount_point: Any = namedtuple('usb_mount_point',
-                                          'name, mount_directory')
+        usb_mount_point: Any = namedtuple(
+            'usb_mount_point', 'name, mount_directory, device, fstype, options')
         favorite_usb_list: Iterator[str] = self.usb_checker._get_usbs_name()
 
+        # One read of the mount table for all the favorites
+        mounts: Any = self.mount_table.read()
+        self.mounted_usb = []
+        by_label: str = os.path.join(self.usb_checker.dev_root, "disk",
+                                     "by-label")
+
         for usb in favorite_usb_list:
-            get_mounted_usb: str = f"lsblk | grep {usb}"
-            cmd: Any = self.process.run(get_mounted_usb)
-            get_cmd_output: int = cmd.returncode
-
-            if get_cmd_output == 0:
-                mnt_directory: Path = Path().joinpath(
-                    self.usb_checker.mount_directory, usb)
-                usb_mounted_on: Any = usb_mount_point(usb, mnt_directory)
+            entries: list = mounts.mounts_of(label_to_devname(usb, by_label))
+
+            # Fallback when udev has no symlink for the label
+            if not entries:
+                mnt_directory: Path = self.usb_checker.mount_point(usb)
+                if entry := mounts.mounted_on(mnt_directory):
+                    entries = [entry]
+
+            for entry in entries:
+                usb_mounted_on: Any = usb_mount_point(usb, entry.mount_point,
+                                                      entry.source,
+                                                      entry.fstype,
+                                                      entry.options)
                 self.mounted_usb.append(usb_mounted_on)
 
                 if show_output:
                     BeautiPanel.draw_panel(
-                        "green", f"USB [{usb}] mounted on: {mnt_directory}")
+                        "green",
+                        f"USB [{usb}] mounted on: {entry.mount_point} "
+                        f"({entry.fstype})")
 
         if not self.mounted_usb and show_output:
             BeautiPanel.draw_panel("yellow",
@@ -197,37 +385,186 @@ class MountUsb:
             umount: str = input(
                 f"Do you want to unmount {usb.name}? [Yes/No]: ")
             if umount.lower() in {'y', 'yes'}:
-                umount_cmd: str = f"cd;sudo umount {usb.mount_directory}"
-                self.process.run(umount_cmd)
-                console.print(f"[yellow][+] USB [{usb.name}] unmounted[/]")
+                result: MountResult = self.umount_one(usb)
+                if result.status == UNMOUNTED:
+                    console.print(f"[yellow][+] USB [{usb.name}] unmounted[/]")
+                else:
+                    console.print(f"[red][!] USB [{usb.name}] not unmounted: "
+                                  f"{escape(result.message)}[/]")
 
-                # Remove the mount point
-                remove_mount_point: str = f"sudo rm -rf {usb.mount_directory}"
-                self.process.run(remove_mount_point)
+    def umount_one(self, usb: Any, on_step: Any = None) -> MountResult:
+        """Flush and unmount one of the mounted_usbs(). The mount point is
+        removed only once the kernel no longer has it mounted.
 
+        on_step(usb, step) is called with "flushing" and "unmounting" """
 
-# Functions to handle the classes operations called from "pyusb_lnx.py"
-def mount_all() -> None:
-    """Main function to mount all the USBs"""
+        start: float = time.monotonic()
+        step: Any = on_step or (lambda usb, step: None)
 
-    usb_checker = CheckUsb()
-    usb_mounter = MountUsb()
+        step(usb, "flushing")
+        try:
+            flush_filesystem(usb.mount_directory)
+        except OSError as error:
+            return MountResult(usb.name, FAILED, usb.mount_directory,
+                               time.monotonic() - start, str(error))
+
+        step(usb, "unmounting")
+        cmd: Any = self.usb_checker.privileged.umount(usb.mount_directory)
+
+        self.mount_table.invalidate()
+        if cmd.returncode != 0 or self.mount_table.is_mounted(
+                usb.mount_directory):
+            return MountResult(usb.name, FAILED, usb.mount_directory,
+                               time.monotonic() - start,
+                               cmd.stderr.strip() or "still mounted")
+
+        # Remove the mount point: rmdir, never the content
+        self.usb_checker.privileged.remove_mountpoint(usb.mount_directory)
+
+        return MountResult(usb.name, UNMOUNTED, usb.mount_directory,
+                           time.monotonic() - start, "")
+
+
+# Functions to handle the classes operations called from "pyusb_lnx.py"
+def mount_all(backend: str = "blkid",
+              jobs: int = MOUNT_JOBS,
+              verbose: bool = False,
+              metrics_file: Any = None,
+              usb_checker: Any = None) -> list:
+    """Main function to mount all the USBs. The devices are mounted
+    concurrently, at most 'jobs' at a time. The mount latencies are
+    written to metrics_file, in the Prometheus text format. usb_checker
+    replaces the CheckUsb of the backend, e.g. in the benchmarks"""
+
+    # Both share the same devices snapshot
+    if usb_checker is None:
+        usb_checker = CheckUsb(backend=backend)
+    usb_mounter = MountUsb(usb_checker=usb_checker)
+    results: list[MountResult] = []
 
     if usbs_connected := usb_checker._plugged_usbs():
-        for usb in usbs_connected:
-            usb_uuid: Any = usb_checker._find_usb_uuid(usb.name)
-            if usb_uuid != 0:
-                usb_mounter.mount_usb(usb_uuid, usb.name)
+        with ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+            futures: dict = {}
+            for usb in usbs_connected:
+                usb_uuid: Any = usb_checker._find_usb_uuid(usb.name)
+                if usb_uuid:
+                    futures[usb.name] = pool.submit(usb_mounter.mount_usb,
+                                                    usb_uuid, usb.name)
+                else:
+                    results.append(
+                        MountResult(usb.name, FAILED, None, 0.0,
+                                    "UUID not found"))
+
+            for usb_name, future in futures.items():
+                try:
+                    results.append(future.result())
+                except Exception as error:
+                    results.append(
+                        MountResult(usb_name, FAILED, None, 0.0, str(error)))
+
+        for result in results:
+            color: str = "red" if result.status == FAILED else "green"
+            console.print(f"[{color}]    {result.name}: {result.status} "
+                          f"in {result.elapsed:.2f}s {escape(result.message)}[/]")
     else:
         console.print("[red][!] No favorite USB devices found![/]")
         console.print("[red][!] Plug it in or check 'database_menu.py'[/]")
 
+    if verbose:
+        console.print(f"[cyan]    UUID cache: {usb_checker.cache_hits} hits, "
+                      f"{usb_checker.cache_misses} misses[/]")
+
+    if metrics_file:
+        REGISTRY.write_textfile(metrics_file)
+
+    return results
+
+
+def umount_all(labels: Any = None,
+               jobs: int = MOUNT_JOBS,
+               all_usbs: bool = False) -> list:
+    """Main function to unmount all the USBs.
 
-def umount_all() -> None:
-    """Main function to unmount all the USBs"""
+    Without labels nor all_usbs every mounted USB is asked for. Otherwise
+    they are flushed and unmounted concurrently, at most 'jobs' at a
+    time, while the I/O in flight of every device is shown"""
 
     usb_mounter = MountUsb()
-    usb_mounter.umount_usb()
+    if not labels and not all_usbs:
+        usb_mounter.umount_usb()
+        return []
+
+    from rich.progress import Progress
+
+    usbs: list = [
+        usb for usb in usb_mounter.mounted_usbs(show_output=False)
+        if all_usbs or usb.name in labels
+    ]
+    if not usbs:
+        console.print("[red][!] No favorite USB devices mounted![/]")
+        return []
+
+    results: list[MountResult] = []
+    with Progress() as progress, \
+            ThreadPoolExecutor(max_workers=max(1, jobs)) as pool:
+        # One entry per mount: a USB can be mounted more than once
+        tasks: dict = {
+            usb.mount_directory: progress.add_task(
+                f"[yellow]{usb.name}: waiting", total=2)
+            for usb in usbs
+        }
+        steps: dict = {}
+        flushed: int = progress.add_task("[cyan]writeback (system-wide)",
+                                         total=None)
+
+        def on_step(usb: Any, step: str) -> None:
+            steps[usb.mount_directory] = step
+            progress.update(tasks[usb.mount_directory],
+                            description=f"[yellow]{usb.name}: {step}",
+                            completed=0 if step == "flushing" else 1)
+
+        futures: dict = {
+            usb.mount_directory: pool.submit(usb_mounter.umount_one, usb,
+                                             on_step)
+            for usb in usbs
+        }
+
+        # Report the I/O in flight of every device being flushed, and the
+        # writeback of the whole system, until the slowest flush is done
+        while not all(future.done() for future in futures.values()):
+            for usb in usbs:
+                if steps.get(usb.mount_directory) != "flushing":
+                    continue
+                requests: Any = in_flight(usb.device)
+                if requests is not None:
+                    progress.update(tasks[usb.mount_directory],
+                                    description=f"[yellow]{usb.name}: "
+                                    f"flushing, {requests} I/O in flight")
+            dirty, writing = writeback()
+            progress.update(flushed,
+                            description=f"[cyan]system-wide: dirty "
+                            f"{dirty // 1024} MB, writeback "
+                            f"{writing // 1024} MB")
+            time.sleep(0.2)
+        progress.update(flushed,
+                        description="[cyan]writeback (system-wide) done",
+                        total=1, completed=1)
+
+        for usb in usbs:
+            try:
+                result: MountResult = futures[usb.mount_directory].result()
+            except Exception as error:
+                result = MountResult(usb.name, FAILED, usb.mount_directory,
+                                     0.0, str(error))
+            color: str = "red" if result.status == FAILED else "green"
+            progress.update(tasks[usb.mount_directory],
+                            completed=2,
+                            description=f"[{color}]{usb.name}: "
+                            f"{result.status} in {result.elapsed:.2f}s "
+                            f"{escape(result.message)}")
+            results.append(result)
+
+    return results
 
 
 def mounted_usbs() -> None:
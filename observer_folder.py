@@ -10,56 +10,450 @@
 # Date: lun 17 oct 2022 22:35:03 CEST
 # Dependencies: See requirements.txt
 ##############################################################################
-import time
+"""
+Usage:
+    observer_folder.py [--backend=<name>] [--per-device=<n>]
+                       [--watch-share=<ratio>] [--metrics-file=<path>]
+                       [--metrics-port=<port>]
+    observer_folder.py -h
 
+Options:
+    --backend=<name>    sync engine: rsync or native [default: rsync]
+    --per-device=<n>    initial syncs at the same time on one destination
+                        device [default: 1]
+    --watch-share=<ratio>
+                        part of fs.inotify.max_user_watches and
+                        max_user_instances to use, the rest of the folders
+                        is polled [default: 0.5]
+    --metrics-file=<path>
+                        write the sync metrics every few seconds for the
+                        node-exporter textfile collector (*.prom)
+    --metrics-port=<port>
+                        serve the sync metrics on
+                        http://127.0.0.1:<port>/metrics
+    -h                  show this help
+"""
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import Any
+
+from docopt import docopt  # type:ignore
+from rich.progress import Progress
+from watchdog.events import FileSystemEventHandler
 from watchdog.observers import Observer
+from watchdog.observers.polling import PollingObserverVFS
 
+from classes.coalescer import Coalescer
+from classes.filters import scan_folders, watch_plan
 from classes.folders import Folders
 from classes.handler import Handler
+from classes.watch_budget import (assign_watches, instance_budget, subtrees,
+                                  watch_budget)
+from classes.workers import SyncSupervisor, destination_device
 from helpers import BeautiPanel
-from mount_usb import MountUsb
+from metrics import COUNTER, GAUGE, REGISTRY
+from mount_table import media_mount_point, mount_state
+from registry import REGISTRY_PATH, DeviceRegistry
 
 
-def check_media(ftc) -> None:
+def check_media(ftc, mount_points: Any = ()) -> None:
     """ Check that the folder to backup has the media plugged in """
 
     IGNORE = "MINIS_SDA"
-    plugged_usbs = MountUsb().mounted_usbs(show_output=False)
-    device = str(ftc).split("/")
+    destination = Path(ftc)
 
-    # Get the list of the usbs already mounted
-    mounted_devices = [usb.name for usb in plugged_usbs]
+    # Same check as Handler.online: a lookup in the shared mount table.
+    # Destinations outside the removable media folders and the preferred
+    # mount points of the favorites are always there
+    mount_point = media_mount_point(destination, mount_points)
+    mounted = mount_point is None or mount_state().is_mounted(mount_point)
 
-    if device[-1] == IGNORE:
+    if destination.name == IGNORE:
         pass
-    elif device[-1] not in mounted_devices:
+    elif not mounted:
         BeautiPanel.draw_panel(
             fontcolor="green",
             borderstyle="blue",
             message=f"Backing up data to: {ftc} but the USB is not plugged.")
         BeautiPanel.draw_panel(
             fontcolor="yellow",
-            message=
-            "Insert the USB first before running the 'observer_folder.py'!")
+            message="The changes are journaled and synced when the USB is "
+            "mounted")
+
+
+def initial_sync_all(handlers: list, per_device: int = 1) -> None:
+    """ Run the initial sync of every handler concurrently. At most
+    per_device syncs write to the same destination device """
+
+    devices: dict = {}
+    limits: dict = {}
+    for handler in handlers:
+        device: int = destination_device(handler.destination)
+        if device not in devices:
+            devices[device] = threading.Semaphore(max(1, per_device))
+        limits[handler] = devices[device]
+
+    with Progress() as progress:
+
+        def sync(handler) -> None:
+            task = progress.add_task(f"[yellow]waiting {handler.origin}",
+                                     total=1)
+            with limits[handler]:
+                progress.update(task,
+                                description=f"[green]syncing {handler.origin}")
+                results: list = handler.initial_sync()
+            progress.update(task,
+                            advance=1,
+                            description=f"[blue]{handler.origin}: "
+                            f"{len(results)} files updated")
+
+        with ThreadPoolExecutor(max_workers=max(1, len(handlers))) as pool:
+            futures: dict = {pool.submit(sync, handler): handler
+                              for handler in handlers}
+            for future, handler in futures.items():
+                try:
+                    future.result()
+                except Exception as error:
+                    # The folder is still watched, the next events retry
+                    print(f"[!] {handler.origin}: {error}")
+
+
+def plan_watches(handlers: list, share: float) -> list:
+    """ Split the tracked folders into subtrees and decide which ones get
+    inotify watches and which ones are polled. Every tracked folder is
+    walked once. Returns (handler, Assignment) pairs """
+
+    budget, limit, in_use = watch_budget(share)
+    instances, instance_limit, instances_used = instance_budget(share)
+
+    pairs: list = []
+    for handler in handlers:
+        scan = scan_folders(handler.origin, handler.path_filter)
+        plan: list = watch_plan(handler.origin, handler.path_filter,
+                                scan=scan)
+        pairs += [(handler, subtree)
+                  for subtree in subtrees(handler.origin, plan, scan, budget)]
+    assignments: list = assign_watches([subtree for _, subtree in pairs],
+                                       budget, instances)
+
+    # Startup report
+    native: list = [item for item in assignments if not item.interval]
+    print(f"inotify watches: {sum(item.subtree.folders for item in native)} "
+          f"of {limit} ({in_use} already in use, budget {budget})")
+    print(f"inotify instances: {len(native)} of {instance_limit} "
+          f"({instances_used} already in use, budget {instances})")
+    for interval in sorted({item.interval for item in assignments} - {0}):
+        polled: list = [item for item in assignments
+                        if item.interval == interval]
+        print(f"\t -> polling every {interval:g}s: {len(polled)} subtrees, "
+              f"{sum(item.subtree.folders for item in polled)} folders")
+    print()
+
+    return [(handler, assignment)
+            for (handler, _), assignment in zip(pairs, assignments)]
+
+
+class FilteredListdir:
+    """ os.scandir for the pollers, without the excluded folders of the
+    tracked folders: a poll walks what the budget counted, nothing more """
+
+    def __init__(self) -> None:
+        # folder_to_track -> PathFilter
+        self.filters: dict = {}
+
+    def __call__(self, path) -> Any:
+        origin: Any = max((origin for origin in self.filters
+                           if path == origin
+                           or path.startswith(f"{origin}{os.sep}")),
+                          key=len,
+                          default=None)
+        with os.scandir(path) as entries:
+            for entry in entries:
+                if origin is None or not self.filters[origin].excluded_name(
+                        os.path.relpath(entry.path, origin)):
+                    yield entry
+
+
+# Shared by all the pollers
+poll_listdir: FilteredListdir = FilteredListdir()
+
+
+def schedule_watches(observer, pollers: dict, handler, assignment,
+                     watches: list) -> None:
+    """ Watch one subtree of the tracked folder of handler, with inotify
+    or with the poller of its interval. The (observer, watch) pairs
+    scheduled are added to watches """
+
+    subtree = assignment.subtree
+    if assignment.interval:
+        if assignment.interval not in pollers:
+            pollers[assignment.interval] = PollingObserverVFS(
+                os.stat, poll_listdir, polling_interval=assignment.interval)
+        poller = pollers[assignment.interval]
+        poll_listdir.filters[str(handler.origin)] = handler.path_filter
+        watches.append((poller,
+                        poller.schedule(handler,
+                                        str(subtree.path),
+                                        recursive=True)))
+        return
+
+    watches.append((observer,
+                    observer.schedule(handler,
+                                      str(subtree.path),
+                                      recursive=subtree.recursive)))
+    if not subtree.recursive:
+        handler.shallow_watches.add(subtree.path)
+
+    # Subfolders created later below a non recursive watch
+    handler.watch_folder = lambda folder: watches.append(
+        (observer, observer.schedule(handler, str(folder), recursive=True)))
+
+
+class TrackedFolders:
+    """ The handlers and the watches of the folders in folders.json.
+
+    update() applies a new version of the file: only the folders added,
+    removed, retargeted or with new filters are touched """
+
+    def __init__(self, observer, pollers: dict, supervisor, backend: str,
+                 share: float) -> None:
+
+        self.observer = observer
+        self.pollers: dict = pollers
+        self.supervisor = supervisor
+        self.backend: str = backend
+        self.share: float = share
+
+        # folder_to_track -> Handler
+        self.handlers: dict = {}
+        # folder_to_track -> [(observer, ObservedWatch)]
+        self.watches: dict = {}
+
+        self.started: bool = False
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def load() -> dict:
+        """ Read folders.json: {folder_to_track: (folder_to_copy_to,
+        path_filter)} """
+
+        folders = Folders()
+        filters: dict = folders.return_filters()
+        return {
+            ftt: (ftc, filters.get(ftt))
+            for ftt, ftc in folders.return_paths().items()
+        }
+
+    @staticmethod
+    def mount_points() -> list:
+        """ Preferred mount points of the favorite USBs, read again on
+        every reload. A destination below one is offline while nothing is
+        mounted there """
+
+        if not REGISTRY_PATH.exists():
+            return []
+        return DeviceRegistry().mount_points()
+
+    def update(self, wanted: dict) -> list:
+        """ Schedule and unschedule what changed. Returns the handlers
+        that need an initial sync: the new and the retargeted ones """
+
+        with self._lock:
+            destinations: dict = {
+                ftt: handler.destination
+                for ftt, handler in self.handlers.items()
+            }
+
+            for ftt, handler in list(self.handlers.items()):
+                if ftt not in wanted or wanted[ftt] != (handler.destination,
+                                                        handler.path_filter):
+                    print(f"not watching folder: {ftt}")
+                    self._remove(ftt)
+
+            added: list = []
+            mount_points: list = self.mount_points()
+            for ftt, (ftc, path_filter) in wanted.items():
+                if ftt in self.handlers:
+                    continue
+
+                try:
+                    handler = Handler(ftt,
+                                      ftc,
+                                      backend=self.backend,
+                                      dispatcher=self.supervisor,
+                                      path_filter=path_filter,
+                                      mount_points=mount_points)
+                except ValueError as error:
+                    # e.g. rules the backend can not apply
+                    print(f"[!] not watching folder: {ftt}: {error}")
+                    continue
+
+                print(f"watching folder: {ftt}")
+                print(f"\t -> backing up to: {ftc}\n")
+                self.handlers[ftt] = handler
+                self.watches[ftt] = []
+                added.append(handler)
+
+                check_media(handler.destination, mount_points)
+
+            if added:
+                for handler, assignment in plan_watches(added, self.share):
+                    schedule_watches(self.observer, self.pollers, handler,
+                                     assignment,
+                                     self.watches[handler.origin])
+
+            # Pollers created for the new folders
+            if self.started:
+                for poller in self.pollers.values():
+                    if not poller.is_alive():
+                        poller.start()
+
+            # Only the filters changed: the destination is up to date
+            return [
+                handler for handler in added
+                if destinations.get(handler.origin) != handler.destination
+            ]
+
+    def _remove(self, ftt) -> None:
+        handler = self.handlers.pop(ftt)
+        handler.coalescer.stop()
+        poll_listdir.filters.pop(str(handler.origin), None)
+
+        # Watches on the same folder are shared with the other handlers
+        in_use: set = {
+            (id(runner), watch)
+            for watches in self.watches.values() if watches is not
+            self.watches[ftt] for runner, watch in watches
+        }
+        for runner, watch in self.watches.pop(ftt):
+            runner.remove_handler_for_watch(handler, watch)
+            if (id(runner), watch) not in in_use:
+                try:
+                    runner.unschedule(watch)
+                except KeyError:
+                    # Already unscheduled
+                    pass
+
+    def start(self) -> None:
+        """ Start the observers """
+
+        self.observer.start()
+        for poller in self.pollers.values():
+            poller.start()
+        self.started = True
+
+    def stop(self) -> None:
+        """ Stop the observers """
+
+        for running in [self.observer, *self.pollers.values()]:
+            if running.is_alive():
+                running.stop()
+                running.join()
+
+    def samples(self) -> list:
+        """ Metrics of the handlers and of the destination workers """
+
+        samples: list = []
+        for handler in list(self.handlers.values()):
+            labels: dict = {"folder": str(handler.origin)}
+            samples.append((COUNTER, "pyusb_events_received_total",
+                            "Filesystem events received",
+                            handler.events_received, labels))
+            samples.append((COUNTER, "pyusb_events_coalesced_total",
+                            "Events merged into another sync",
+                            handler.coalescer.events_coalesced, labels))
+
+        for worker in list(self.supervisor.workers.values()):
+            labels = {"worker": worker.name}
+            samples.append((GAUGE, "pyusb_queue_depth",
+                            "Sync jobs waiting", worker.depth, labels))
+            samples.append((COUNTER, "pyusb_jobs_merged_total",
+                            "Sync jobs merged into a queued one",
+                            worker.jobs_merged, labels))
+
+        return samples
+
+    def replay(self) -> None:
+        """ Replay the offline journals, see Handler.replay """
+
+        for handler in list(self.handlers.values()):
+            handler.replay()
+
+
+class ConfigHandler(FileSystemEventHandler):
+    """ Call action once folders.json was changed and saved """
+
+    # Reading the file must not trigger a reload
+    EVENTS: set = {"created", "modified", "moved", "deleted"}
+
+    def __init__(self, file_path: str, action) -> None:
+        self.file_path: str = os.path.abspath(file_path)
+        # Editors write the file in several steps
+        self.coalescer: Coalescer = Coalescer(lambda items: action(),
+                                              quiet=1.0)
+
+    def on_any_event(self, event) -> None:
+        if event.event_type in self.EVENTS and self.file_path in {
+                event.src_path, getattr(event, "dest_path", "")
+        }:
+            self.coalescer.notify()
+
+
+args = docopt(__doc__)  # type: ignore
+
+# Poll interval -> PollingObserver, for the folders without inotify watches
+pollers: dict = {}
+
+# Per destination sync queues, owned by the main loop
+supervisor = SyncSupervisor()
+
+tracked = TrackedFolders(Observer(), pollers, supervisor, args["--backend"],
+                         float(args["--watch-share"]))
+
+# Watch everything first, then sync: no change is missed meanwhile
+handlers: list = tracked.update(tracked.load())
+tracked.start()
+initial_sync_all(handlers, int(args["--per-device"]))
+
+
+def reload_folders() -> None:
+    """ Apply the changes of folders.json, sync the new pairs """
+
+    try:
+        wanted: dict = tracked.load()
+    except (OSError, ValueError, KeyError) as error:
+        print(f"[!] folders.json not reloaded: {error}")
+        return
 
+    if synced := tracked.update(wanted):
+        initial_sync_all(synced, int(args["--per-device"]))
 
-folders = Folders().return_paths()
 
-observer = Observer()
+# Changes made with folders_to_watch.py apply without a restart
+config_file: str = Folders.file_path
+tracked.observer.schedule(ConfigHandler(config_file, reload_folders),
+                          os.path.dirname(os.path.abspath(config_file)),
+                          recursive=False)
 
-for ftt, ftc in folders.items():
-    print(f"watching folder: {ftt}")
-    print(f"\t -> backing up to: {ftc}\n")
-    event_handler = Handler(ftt, ftc)
-    observer.schedule(event_handler, ftt, recursive=True)
+# Catch up with a USB as soon as it is mounted. The periodic replay is
+# the fallback when the mount table can not be watched
+mount_state().subscribe(tracked.replay)
+mount_state().start()
+supervisor.periodic.append(tracked.replay)
 
-    check_media(ftc)
+# Sync metrics for alerts on backup lag and slow sticks
+REGISTRY.collector(tracked.samples)
+if args["--metrics-port"]:
+    REGISTRY.serve(int(args["--metrics-port"]))
+if args["--metrics-file"]:
+    supervisor.periodic.append(
+        lambda: REGISTRY.write_textfile(args["--metrics-file"]))
 
-observer.start()
-try:
-    while True:
-        time.sleep(5)
-except KeyboardInterrupt:
-    observer.stop()
+# Until Ctrl+C or SIGTERM
+supervisor.run()
 
-observer.join()
+tracked.stop()
+if args["--metrics-file"]:
+    REGISTRY.write_textfile(args["--metrics-file"])
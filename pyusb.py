@@ -9,37 +9,67 @@
 ##############################################################################
 """
 Usage:
-    pyusb.py (-l | -m | -u | -h)
+    pyusb.py (-l | -m | -u | -w | -h) [--backend=<name>] [--jobs=<n>] [-v]
+                                      [--metrics-file=<path>]
+    pyusb.py -u (--all | <label>...) [--jobs=<n>]
 
     pyusb.py -l (list connected USBs)
     pyusb.py -m (mount connected USBs)
     pyusb.py -u (umount connected USBs)
+    pyusb.py -u --all (umount all the USBs at once, no questions)
+    pyusb.py -w (auto-mount USBs when plugged in)
     pyusb.py -h (show this help)
 
 Options:
-    -l          list connected USBs
-    -m          mount connected USBs
-    -u          umount connected USBs
-    -h          show this help
-    --version   program version
+    -l                  list connected USBs
+    -m                  mount connected USBs
+    -u                  umount connected USBs
+    --all               with -u: all the mounted favorite USBs
+    -w                  auto-mount favorite USBs when plugged in
+    -h                  show this help
+    --backend=<name>    device discovery: blkid (sudo) or sysfs. Default:
+                        blkid with -m, sysfs with -w
+    --jobs=<n>          devices mounted at the same time [default: 4]
+    -v, --verbose       show the UUID cache hits and misses
+    --metrics-file=<path>
+                        with -m and -w: write the mount latencies for the
+                        node-exporter textfile collector (*.prom)
+    --version           program version
 """
+import sys
+
 from docopt import docopt  # type:ignore
-from mount_usb import umount_all, mount_all, mounted_usbs
 
 if __name__ == "__main__":
     args = docopt(__doc__, version="pyusb.py v.1.2 - 2022")  # type: ignore
 
+    if args["--backend"]:
+        from devices import INVENTORIES
+        if args["--backend"] not in INVENTORIES:
+            sys.exit(f"Unknown backend: {args['--backend']}. Use one of: "
+                     f"{', '.join(INVENTORIES)}")
+
+    # Imported by the option using them: -h does not pay for them
     if args["-l"]:
+        from mount_usb import mounted_usbs
         print("list connected USBs")
         mounted_usbs()
 
-    if args["-m"]:
+    elif args["-m"]:
+        from mount_usb import mount_all
         print("mount connected USBs")
-        mount_all()
+        mount_all(args["--backend"] or "blkid", int(args["--jobs"]),
+                  args["--verbose"], args["--metrics-file"])
 
-    if args["-u"]:
+    elif args["-u"]:
+        from mount_usb import umount_all
         print("umount connected USBs")
-        umount_all()
+        umount_all(args["<label>"], int(args["--jobs"]), args["--all"])
+
+    elif args["-w"]:
+        from hotplug import watch_usbs
+        print("auto-mount USBs when plugged in")
+        watch_usbs(args["--metrics-file"], args["--backend"] or "sysfs")
 
     else:
         print("Type pyusb.py -h for help")
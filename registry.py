@@ -0,0 +1,229 @@
+#!/usr/bin/python3
+""" Registry of the favorite USB devices """
+
+##############################################################################
+# Author: Carlos Lacaci Moya
+# Description: SQLite registry of the favorite USBs, one row per device.
+#              WAL mode: the CLI and the running observer can use it at the
+#              same time and readers never block the writer
+# Date: dom 18 oct 2026 21:05:37 CEST
+# CAUTION: DO NOT USE IT DIRECTLY. USE manage_usb.py INSTEAD.
+# Dependencies: See below
+##############################################################################
+import sqlite3
+import time
+from collections import namedtuple
+from contextlib import closing
+from pathlib import Path as path
+from typing import Any, Iterable, Optional
+
+from rich.console import Console
+
+# rich module
+console = Console()
+
+# Next to the old usbs.dbm
+REGISTRY_PATH: path = path(__file__).parent.absolute().joinpath(
+    "usbs.sqlite")
+SHELVE_PATH: path = path(__file__).parent.absolute().joinpath("usbs.dbm")
+
+# One favorite USB. Only label is required, the rest is learnt when the
+# device is seen or set by hand
+Favorite = namedtuple(
+    'Favorite', 'label, uuid, fstype, mount_point, last_seen, mount_options')
+
+SCHEMA: str = """
+CREATE TABLE IF NOT EXISTS devices (
+    label TEXT PRIMARY KEY,
+    uuid TEXT NOT NULL DEFAULT '',
+    fstype TEXT NOT NULL DEFAULT '',
+    mount_point TEXT NOT NULL DEFAULT '',
+    last_seen REAL,
+    mount_options TEXT NOT NULL DEFAULT ''
+);
+CREATE TABLE IF NOT EXISTS meta (
+    key TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# Key in meta once usbs.dbm was imported
+MIGRATED: str = "migrated_from_shelve"
+
+# Added to the files of usbs.dbm once imported. Deleting the registry must
+# not bring back the favorites removed since
+MIGRATED_SUFFIX: str = ".migrated"
+
+# Files a shelve can be made of, depending on the dbm module that wrote it
+SHELVE_SUFFIXES: tuple = ("", ".db", ".dat", ".dir", ".bak", ".pag")
+
+
+class DeviceRegistry:
+    """ Favorite USBs stored in SQLite, kept in insertion order """
+
+    def __init__(self,
+                 db_path: Any = REGISTRY_PATH,
+                 shelve_path: Any = SHELVE_PATH) -> None:
+
+        self.db_path: path = path(db_path)
+        self.shelve_path: path = path(shelve_path)
+
+        with self._connect() as db:
+            # Persistent: set once for the database file
+            db.execute("PRAGMA journal_mode=WAL")
+            db.executescript(SCHEMA)
+
+        self._migrate()
+
+    def _connect(self) -> Any:
+        """ One short connection per operation: safe from any thread and
+        from the other processes """
+
+        db: sqlite3.Connection = sqlite3.connect(self.db_path, timeout=30)
+        return closing(db)
+
+    def _migrate(self) -> None:
+        """ Import the favorites of usbs.dbm, once """
+
+        with self._connect() as db:
+            if db.execute("SELECT 1 FROM meta WHERE key = ?",
+                          (MIGRATED, )).fetchone():
+                return
+
+        import dbm
+        import shelve
+
+        labels: list = []
+        # None: there is no usbs.dbm in any of the dbm formats
+        found: bool = dbm.whichdb(str(self.shelve_path)) is not None
+        if found:
+            try:
+                with shelve.open(str(self.shelve_path), flag="r") as old:
+                    labels = list(old.get("favorites", []))
+            except dbm.error as error:
+                # e.g. a gdbm file and no gdbm module: try again next time
+                console.print(
+                    f"[bold red][!] {self.shelve_path} not migrated: {error}"
+                    "[/bold red]")
+                return
+
+        with self._connect() as db, db:
+            db.executemany("INSERT OR IGNORE INTO devices (label) VALUES (?)",
+                           ((label, ) for label in labels))
+            db.execute("INSERT INTO meta (key, value) VALUES (?, ?)",
+                       (MIGRATED, str(time.time())))
+
+        if labels:
+            console.print(f"[bold cyan]{len(labels)} USBs migrated from "
+                          f"{self.shelve_path.name}[/bold cyan]")
+        if found:
+            self._retire_shelve()
+
+    def _retire_shelve(self) -> None:
+        """ Rename usbs.dbm to usbs.dbm.migrated: kept as a backup, never
+        imported again """
+
+        for suffix in SHELVE_SUFFIXES:
+            old: path = self.shelve_path.with_name(self.shelve_path.name +
+                                                   suffix)
+            if not old.exists():
+                continue
+            try:
+                old.rename(old.with_name(old.name + MIGRATED_SUFFIX))
+            except OSError as error:
+                console.print(f"[bold red][!] {old} not renamed: {error}. "
+                              f"Delete it before deleting the registry"
+                              "[/bold red]")
+
+    def labels(self) -> list:
+        """ Labels of the favorite USBs """
+
+        with self._connect() as db:
+            return [
+                label for label, in db.execute(
+                    "SELECT label FROM devices ORDER BY rowid")
+            ]
+
+    def mount_points(self) -> list:
+        """ Preferred mount points set for the favorite USBs """
+
+        with self._connect() as db:
+            return [
+                mount_point for mount_point, in db.execute(
+                    "SELECT mount_point FROM devices WHERE mount_point != '' "
+                    "ORDER BY rowid")
+            ]
+
+    def get(self, label: str) -> Optional[Favorite]:
+        """ The row of a favorite USB, None if it is not a favorite """
+
+        with self._connect() as db:
+            row: Any = db.execute(
+                "SELECT label, uuid, fstype, mount_point, last_seen, "
+                "mount_options FROM devices WHERE label = ?",
+                (label, )).fetchone()
+
+        return Favorite(*row) if row else None
+
+    def add(self, labels: Iterable[str]) -> int:
+        """ Add the labels in one transaction. Returns how many were new """
+
+        with self._connect() as db, db:
+            return db.executemany(
+                "INSERT OR IGNORE INTO devices (label) VALUES (?)",
+                ((label, ) for label in labels)).rowcount
+
+    def remove(self, labels: Iterable[str]) -> int:
+        """ Remove the labels in one transaction. Returns how many were
+        removed """
+
+        with self._connect() as db, db:
+            return db.executemany("DELETE FROM devices WHERE label = ?",
+                                  ((label, ) for label in labels)).rowcount
+
+    def replace(self,
+                labels: Iterable[str],
+                allow_empty: bool = False) -> tuple:
+        """ Make labels the whole set of favorites, in one transaction. The
+        USBs kept keep what was learnt about them. Returns (added,
+        removed). An empty set, e.g. an empty file, would delete every
+        favorite: it needs allow_empty """
+
+        wanted: list = list(dict.fromkeys(labels))
+        if not wanted and not allow_empty:
+            raise ValueError("empty replacement: every favorite would be "
+                             "deleted")
+        with self._connect() as db, db:
+            current: set = {
+                label for label, in db.execute("SELECT label FROM devices")
+            }
+            removed: list = [label for label in current if label not in wanted]
+            db.executemany("DELETE FROM devices WHERE label = ?",
+                           ((label, ) for label in removed))
+            added: int = db.executemany(
+                "INSERT OR IGNORE INTO devices (label) VALUES (?)",
+                ((label, ) for label in wanted)).rowcount
+
+        return added, len(removed)
+
+    def seen(self, label: str, uuid: str, fstype: str) -> None:
+        """ Remember the UUID and filesystem of a favorite found plugged in """
+
+        with self._connect() as db, db:
+            db.execute(
+                "UPDATE devices SET uuid = ?, fstype = ?, last_seen = ? "
+                "WHERE label = ?", (uuid, fstype, time.time(), label))
+
+    def update(self, label: str, **values: Any) -> None:
+        """ Set some columns of a favorite, e.g. mount_point="/mnt/x" """
+
+        columns: set = set(Favorite._fields) - {"label"}
+        if unknown := set(values) - columns:
+            raise ValueError(f"Unknown columns: {', '.join(sorted(unknown))}")
+        if not values:
+            return
+
+        assignments: str = ", ".join(f"{column} = ?" for column in values)
+        with self._connect() as db, db:
+            db.execute(f"UPDATE devices SET {assignments} WHERE label = ?",
+                       (*values.values(), label))
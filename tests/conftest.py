@@ -0,0 +1,30 @@
+##############################################################################
+# Author: Carlos Lacaci Moya
+
+# Description: The modules of pyusb import each other from the repository
+#              root, like when pyusb.py is run
+
+# Date: dom 18 oct 2026 23:41:06 CEST
+# Dependencies: See requirements.txt
+##############################################################################
+import sys
+from pathlib import Path
+
+import pytest
+
+sys.path.insert(0, str(Path(__file__).parent.parent.absolute()))
+
+
+class Silent:
+    """ Notification that shows nothing """
+
+    def send_message(self, *args, **kwargs) -> None:
+        pass
+
+
+@pytest.fixture
+def silent_popup(monkeypatch):
+    """ No desktop notifications from the handlers """
+
+    from classes import handler
+    monkeypatch.setattr(handler, "popup", Silent())
@@ -0,0 +1,78 @@
+##############################################################################
+# Author: Carlos Lacaci Moya
+
+# Description: Bursts of filesystem events coalesced into one action
+
+# Date: dom 18 oct 2026 23:41:06 CEST
+# Dependencies: See requirements.txt
+##############################################################################
+import queue
+import time
+
+from classes.coalescer import Coalescer
+
+
+def runs_of(coalescer: Coalescer) -> queue.Queue:
+    """ Queue receiving the items of every run """
+
+    runs: queue.Queue = queue.Queue()
+    coalescer.action = runs.put
+    return runs
+
+
+def test_burst_runs_once():
+    coalescer = Coalescer(None, quiet=0.05)
+    runs: queue.Queue = runs_of(coalescer)
+
+    for item in ("a", "b", "a", None):
+        coalescer.notify(item)
+
+    assert runs.get(timeout=5) == {"a", "b"}
+    time.sleep(0.2)
+    assert runs.empty()
+    assert coalescer.events_received == 4
+    assert coalescer.events_coalesced == 3
+    coalescer.stop()
+
+
+def test_max_delay_bounds_a_long_burst():
+    coalescer = Coalescer(None, quiet=0.2, max_delay=0.3)
+    runs: queue.Queue = runs_of(coalescer)
+
+    start: float = time.monotonic()
+    while runs.empty() and time.monotonic() - start < 5:
+        coalescer.notify("a")
+        time.sleep(0.02)
+
+    # Events every 20 ms never leave 200 ms of quiet
+    assert runs.get(timeout=5) == {"a"}
+    assert time.monotonic() - start < 2
+    coalescer.stop()
+
+
+def test_flush_runs_the_burst_now():
+    coalescer = Coalescer(None, quiet=60, max_delay=60)
+    runs: queue.Queue = runs_of(coalescer)
+
+    coalescer.notify("a")
+    coalescer.flush()
+
+    assert runs.get(timeout=5) == {"a"}
+    coalescer.stop()
+
+
+def test_failed_action_does_not_stop_the_loop():
+    runs: queue.Queue = queue.Queue()
+
+    def action(items: set) -> None:
+        runs.put(items)
+        if "boom" in items:
+            raise OSError("disk full")
+
+    coalescer = Coalescer(action, quiet=0.02)
+    coalescer.notify("boom")
+    assert runs.get(timeout=5) == {"boom"}
+
+    coalescer.notify("b")
+    assert runs.get(timeout=5) == {"b"}
+    coalescer.stop()
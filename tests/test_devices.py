@@ -0,0 +1,175 @@
+##############################################################################
+# Author: Carlos Lacaci Moya
+
+# Description: Device inventories and the UUID cache of the registry,
+#              without blkid nor sudo
+
+# Date: dom 18 oct 2026 23:41:06 CEST
+# Dependencies: See requirements.txt
+##############################################################################
+import os
+from pathlib import Path
+from types import SimpleNamespace
+
+import pytest
+
+from devices import (SECTOR_SIZE, Device, DeviceIndex, SysfsInventory,
+                     cached_device, parse_blkid_export, udev_decode)
+from mount_usb import CheckUsb
+from registry import DeviceRegistry
+
+BLKID: str = r"""DEVNAME=/dev/sda1
+UUID=0d1c-a3f9
+TYPE=ext4
+
+DEVNAME=/dev/sdb1
+LABEL=MY\ STICK
+UUID=4A2B-BE4C
+TYPE=vfat
+PARTUUID=1234-01
+
+LABEL=NO_DEVNAME
+"""
+
+
+def test_parse_blkid_export():
+    assert list(parse_blkid_export(BLKID)) == [
+        Device("/dev/sda1", "", "0d1c-a3f9", "ext4"),
+        Device("/dev/sdb1", "MY STICK", "4A2B-BE4C", "vfat"),
+    ]
+
+
+def test_device_index():
+    index = DeviceIndex()
+    for device in parse_blkid_export(BLKID):
+        index.add(device)
+
+    assert len(index) == 2
+    assert index.by_label["MY STICK"].devname == "/dev/sdb1"
+    assert index.by_uuid["0d1c-a3f9"].fstype == "ext4"
+    assert "" not in index.by_label
+
+
+def test_udev_decode():
+    assert udev_decode(r"MY\x20STICK") == "MY STICK"
+    assert udev_decode("PLAIN") == "PLAIN"
+
+
+def write(path: Path, content: str) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+
+
+@pytest.fixture
+def fake_tree(tmp_path) -> Path:
+    """ /dev, /sys and the udev database of a machine with a USB stick
+    (sdb1, labelled with a space) and an unlabelled internal disk """
+
+    links: Path = tmp_path / "dev" / "disk"
+    for kind, name, target in (("label", r"MY\x20STICK", "sdb1"),
+                               ("uuid", "4A2B-BE4C", "sdb1"),
+                               ("uuid", "0d1c-a3f9", "sda1")):
+        links.joinpath(f"by-{kind}").mkdir(parents=True, exist_ok=True)
+        os.symlink(f"../../{target}", links / f"by-{kind}" / name)
+
+    block: Path = tmp_path / "sys" / "block"
+    write(block / "sdb" / "removable", "1\n")
+    write(block / "sdb" / "device" / "vendor", "Kingston\n")
+    write(block / "sdb" / "sdb1" / "size", "2048\n")
+    write(block / "sda" / "removable", "0\n")
+    write(block / "sda" / "size", "4096\n")
+    write(block / "sda" / "sda1" / "size", "")
+    write(tmp_path / "sys" / "class" / "block" / "sdb1" / "dev", "8:17\n")
+    write(tmp_path / "udev" / "b8:17", "S:disk/by-label/MY\\x20STICK\n"
+          "E:ID_FS_TYPE=vfat\n")
+    return tmp_path
+
+
+def test_sysfs_inventory(fake_tree):
+    inventory = SysfsInventory(dev_root=str(fake_tree / "dev"),
+                               sys_root=str(fake_tree / "sys"),
+                               udev_root=str(fake_tree / "udev"))
+
+    stick: Device = inventory.find_label("MY STICK")
+    assert stick == Device("/dev/sdb1", "MY STICK", "4A2B-BE4C", "vfat",
+                           True, 2048 * SECTOR_SIZE, "Kingston")
+    assert inventory.find_uuid("4A2B-BE4C") is stick
+
+    disk: Device = inventory.find_devname("/dev/sda1")
+    assert (disk.label, disk.fstype, disk.removable) == ("", "", False)
+    # No size for the partition: the one of its disk
+    assert disk.size == 4096 * SECTOR_SIZE
+    assert len(inventory.index) == 2
+
+
+def test_unknown_backend_refused():
+    with pytest.raises(ValueError, match="blkid, sysfs"):
+        CheckUsb(database=SimpleNamespace(show_items=lambda: []),
+                 backend="foo")
+
+
+@pytest.fixture
+def links(tmp_path) -> Path:
+    """ /dev with the udev symlinks of one plugged stick """
+
+    dev: Path = tmp_path / "dev"
+    for kind, name in (("uuid", "4A2B-BE4C"), ("label", "KINGSTON")):
+        dev.joinpath("disk", f"by-{kind}").mkdir(parents=True)
+        os.symlink(dev / "sdb1", dev / "disk" / f"by-{kind}" / name)
+    return dev
+
+
+def test_cached_device(links):
+    trusted, device = cached_device("KINGSTON", "4A2B-BE4C", "vfat",
+                                    str(links))
+    assert trusted
+    assert device == Device(str(links / "sdb1"), "KINGSTON", "4A2B-BE4C",
+                            "vfat")
+
+    # Never seen, not plugged in or reformatted: probed
+    assert cached_device("KINGSTON", "", "", str(links)) == (False, None)
+    assert cached_device("KINGSTON", "0000-0000", "", str(links)) == \
+        (False, None)
+    # The label now points to another device
+    os.symlink(links / "sdc1", links / "disk" / "by-label" / "OTHER")
+    assert cached_device("OTHER", "4A2B-BE4C", "", str(links)) == \
+        (False, None)
+
+
+def test_check_usb_probes_only_on_a_miss(tmp_path, links):
+    registry = DeviceRegistry(tmp_path / "usbs.sqlite",
+                              tmp_path / "usbs.dbm")
+    registry.add(["KINGSTON"])
+    probed = Device("/dev/sdb1", "KINGSTON", "4A2B-BE4C", "vfat")
+
+    class Inventory:
+        probes: int = 0
+
+        def find_label(self, label: str) -> Device:
+            self.probes += 1
+            return probed
+
+    def checker() -> CheckUsb:
+        return CheckUsb(database=SimpleNamespace(registry=registry,
+                                                 show_items=registry.labels),
+                        inventory=Inventory(),
+                        privileged=object(),
+                        dev_root=str(links))
+
+    # First time: probed and remembered
+    first: CheckUsb = checker()
+    assert first._device("KINGSTON") == probed
+    assert (first.cache_hits, first.cache_misses) == (0, 1)
+    assert registry.get("KINGSTON").uuid == "4A2B-BE4C"
+
+    # Next run: answered by the udev symlinks, once per run
+    second: CheckUsb = checker()
+    second._device("KINGSTON")
+    second._device("KINGSTON")
+    assert (second.cache_hits, second.cache_misses) == (1, 0)
+    assert second.inventory.probes == 0
+
+    # Re-plugged: looked up again
+    second.forget("KINGSTON")
+    second._device("KINGSTON")
+    assert second.cache_hits == 2
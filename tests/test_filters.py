@@ -0,0 +1,68 @@
+##############################################################################
+# Author: Carlos Lacaci Moya
+
+# Description: PathFilter rules follow the rsync filter semantics
+
+# Date: dom 18 oct 2026 23:41:06 CEST
+# Dependencies: See requirements.txt
+##############################################################################
+import pytest
+
+from classes.filters import PathFilter
+from classes.sync_engine import RsyncEngine
+
+
+def test_unanchored_rule_matches_at_any_depth():
+    path_filter = PathFilter(exclude=[".git"])
+
+    assert path_filter.excluded(".git")
+    assert path_filter.excluded("project/.git")
+    assert path_filter.excluded("project/.git/config")
+    assert not path_filter.excluded("project/.github")
+
+
+def test_anchored_rule_only_matches_the_top():
+    path_filter = PathFilter(exclude=["/Downloads/"])
+
+    assert path_filter.excluded("Downloads")
+    assert path_filter.excluded("Downloads/file.iso")
+    assert not path_filter.excluded("backup/Downloads")
+
+
+def test_star_does_not_cross_folders():
+    path_filter = PathFilter(exclude=["src/*.o"])
+
+    assert path_filter.excluded("src/main.o")
+    assert path_filter.excluded("project/src/main.o")
+    assert not path_filter.excluded("src/lib/main.o")
+
+
+def test_double_star_crosses_folders():
+    path_filter = PathFilter(exclude=["/build/**.log"])
+
+    assert path_filter.excluded("build/out.log")
+    assert path_filter.excluded("build/a/b/out.log")
+    assert not path_filter.excluded("src/out.log")
+
+
+def test_include_wins():
+    path_filter = PathFilter(exclude=["*.log"], include=["keep.log"])
+
+    assert path_filter.excluded("debug.log")
+    assert not path_filter.excluded("keep.log")
+
+
+def test_regex_rules():
+    path_filter = PathFilter(exclude=[r"re:\.tmp\d+$", "*.swp"])
+
+    assert path_filter.excluded("a/file.tmp12")
+    assert not path_filter.excluded("a/file.tmp")
+    assert path_filter.regex_rules() == [r"re:\.tmp\d+$"]
+    assert path_filter.rsync_args() == "--exclude='*.swp'"
+
+
+def test_rsync_refuses_regex_rules():
+    with pytest.raises(ValueError):
+        RsyncEngine(path_filter=PathFilter(exclude=["re:^cache/"]))
+
+    RsyncEngine(path_filter=PathFilter(exclude=["cache/"]))
@@ -0,0 +1,68 @@
+##############################################################################
+# Author: Carlos Lacaci Moya
+
+# Description: The sync manifest only records what reached the destination
+
+# Date: dom 18 oct 2026 23:41:06 CEST
+# Dependencies: See requirements.txt
+##############################################################################
+import errno
+from pathlib import Path
+
+import pytest
+
+from classes import sync_engine
+from classes.handler import Handler
+from classes.journal import SyncJournal
+from classes.manifest import SyncManifest, scan_tree
+
+
+@pytest.fixture
+def handler(tmp_path, silent_popup):
+    origin: Path = tmp_path / "origin"
+    for name in ("a/x.txt", "b/y.txt"):
+        origin.joinpath(name).parent.mkdir(parents=True, exist_ok=True)
+        origin.joinpath(name).write_text("1")
+
+    db_path: Path = tmp_path / "manifest.sqlite"
+    # Absolute paths are not joined to the home folder
+    handler = Handler(origin, tmp_path / "destination",
+                      backend="native",
+                      manifest=SyncManifest(db_path),
+                      journal=SyncJournal(db_path))
+    handler.initial_sync()
+    return handler
+
+
+def delta(handler: Handler) -> list:
+    return handler.manifest.delta(handler.origin, handler.destination,
+                                  scan_tree(handler.origin))
+
+
+def test_initial_sync_recorded(handler):
+    assert handler.destination.joinpath("b", "y.txt").read_text() == "1"
+    assert delta(handler) == []
+
+
+def test_failed_paths_stay_in_the_delta(handler, monkeypatch):
+    copy_file = sync_engine.copy_file
+
+    def disk_full(source, target, status):
+        if source.name == "y.txt":
+            raise OSError(errno.ENOSPC, "No space left on device")
+        copy_file(source, target, status)
+
+    monkeypatch.setattr(sync_engine, "copy_file", disk_full)
+    handler.origin.joinpath("a", "x.txt").write_text("22")
+    handler.origin.joinpath("b", "y.txt").write_text("22")
+
+    handler._sync_changes({"a", "b/y.txt"})
+
+    assert handler.destination.joinpath("a", "x.txt").read_text() == "22"
+    assert handler.destination.joinpath("b", "y.txt").read_text() == "1"
+    assert delta(handler) == ["b/y.txt"]
+
+    # Synced on the next try
+    monkeypatch.setattr(sync_engine, "copy_file", copy_file)
+    handler._sync_changes({"b/y.txt"})
+    assert delta(handler) == []
@@ -0,0 +1,165 @@
+##############################################################################
+# Author: Carlos Lacaci Moya
+
+# Description: AutoMounter replaying synthetic hotplug events, without USB
+#              hardware nor sudo
+
+# Date: dom 18 oct 2026 23:41:06 CEST
+# Dependencies: See requirements.txt
+##############################################################################
+from pathlib import Path
+from typing import Any
+
+import pytest
+
+import hotplug
+from devices import Device, DeviceIndex
+from hotplug import ADD, REMOVE, AutoMounter, HotplugEvent
+from mount_table import MountState
+from mount_usb import FAILED, MOUNTED, MountResult
+
+FAVORITE: Device = Device("/dev/sdb1", "KINGSTON", "4A2B-BE4C", "vfat")
+OTHER: Device = Device("/dev/sdc1", "OTHER", "77E1-0A3C", "vfat")
+
+
+class Inventory:
+    """ The devices plugged in """
+
+    def __init__(self, *devices: Device) -> None:
+        self.devices: list = list(devices)
+        self.index: DeviceIndex = DeviceIndex()
+
+    def refresh(self) -> DeviceIndex:
+        self.index = DeviceIndex()
+        for device in self.devices:
+            self.index.add(device)
+        return self.index
+
+    def find_label(self, label: str) -> Any:
+        return self.index.by_label.get(label)
+
+    def find_devname(self, devname: str) -> Any:
+        return self.index.by_devname.get(devname)
+
+
+class Privileged:
+    """ Records the operations instead of running them """
+
+    def __init__(self) -> None:
+        self.calls: list = []
+
+    def umount(self, mount_point: Any) -> None:
+        self.calls.append(("umount", str(mount_point)))
+
+    def remove_mountpoint(self, mount_point: Any) -> None:
+        self.calls.append(("remove_mountpoint", str(mount_point)))
+
+
+class Checker:
+    """ CheckUsb with KINGSTON as the only favorite """
+
+    def __init__(self, inventory: Inventory, media: Path) -> None:
+        self.inventory: Inventory = inventory
+        self.devices: list = [FAVORITE.label]
+        self.media: Path = media
+        self.privileged: Privileged = Privileged()
+        self.forgotten: list = []
+
+    def forget(self, usb_name: str) -> None:
+        self.forgotten.append(usb_name)
+
+    def mount_point(self, usb_name: str) -> Path:
+        return self.media.joinpath(usb_name)
+
+
+class Mounter:
+    """ MountUsb writing to a mountinfo file of its own """
+
+    def __init__(self, checker: Checker, mountinfo: Path) -> None:
+        self.checker: Checker = checker
+        self.mountinfo: Path = mountinfo
+        self.mount_table: MountState = MountState(str(mountinfo), ttl=0)
+        self.mounts: list = []
+
+    def mount_usb(self, usb_uuid: str, usb_name: str) -> MountResult:
+        device: Device = self.checker.inventory.find_label(usb_name)
+        mount_point: Path = self.checker.mount_point(usb_name)
+        self.mounts.append(usb_uuid)
+        with self.mountinfo.open("a") as mountinfo:
+            mountinfo.write(f"98 22 8:17 / {mount_point} rw - "
+                            f"{device.fstype} {device.devname} rw\n")
+        return MountResult(usb_name, MOUNTED, mount_point, 0.1, "")
+
+
+@pytest.fixture
+def mounter(tmp_path, monkeypatch):
+    monkeypatch.setattr(hotplug.console, "print", lambda *args: None)
+    mountinfo: Path = tmp_path / "mountinfo"
+    mountinfo.write_text("22 1 8:1 / / rw - ext4 /dev/sda1 rw\n")
+    checker = Checker(Inventory(FAVORITE, OTHER), tmp_path / "media")
+    return Mounter(checker, mountinfo)
+
+
+def replay(mounter: Mounter, events: Any) -> tuple:
+    """ Run the events. Returns the AutoMounter and the results passed to
+    on_mounted """
+
+    results: list = []
+    auto = AutoMounter(source=events,
+                       usb_checker=mounter.checker,
+                       usb_mounter=mounter,
+                       on_mounted=results.append)
+    auto.run()
+    return auto, results
+
+
+def test_favorite_plugged_in_before_start_is_mounted(mounter):
+    auto, results = replay(mounter, [])
+
+    assert mounter.mounts == [FAVORITE.uuid]
+    assert auto.mounted == {
+        "KINGSTON": mounter.checker.mount_point("KINGSTON")
+    }
+    assert [result.status for result in results] == [MOUNTED]
+
+
+def test_kernel_events_without_label(mounter):
+    mounter.checker.inventory.devices = []
+    mounter.checker.inventory.refresh()
+
+    def plug() -> Any:
+        # The device shows up before its event
+        mounter.checker.inventory.devices = [FAVORITE, OTHER]
+        yield HotplugEvent(ADD, OTHER.devname)
+        yield HotplugEvent(ADD, FAVORITE.devname)
+        # udev repeats it with the label: already mounted
+        yield HotplugEvent(ADD, FAVORITE.devname, FAVORITE.label,
+                           FAVORITE.uuid)
+
+    auto, _ = replay(mounter, plug())
+
+    assert mounter.mounts == [FAVORITE.uuid]
+    assert mounter.checker.forgotten == ["KINGSTON"]
+    assert list(auto.mounted) == ["KINGSTON"]
+
+
+def test_removal_cleans_up_the_mount_point(mounter):
+    mount_point: str = str(mounter.checker.mount_point("KINGSTON"))
+
+    replay(mounter, [HotplugEvent(REMOVE, FAVORITE.devname, "KINGSTON")])
+
+    assert mounter.checker.privileged.calls == [
+        ("umount", mount_point),
+        ("remove_mountpoint", mount_point),
+    ]
+    assert mounter.checker.forgotten == ["KINGSTON", "KINGSTON"]
+
+
+def test_failed_mount_is_not_remembered(mounter):
+    mounter.mount_usb = lambda usb_uuid, usb_name: MountResult(
+        usb_name, FAILED, "", 0.1, "mount: wrong fs type")
+
+    auto, results = replay(mounter, [])
+
+    assert auto.mounted == {}
+    assert results == []
@@ -0,0 +1,86 @@
+##############################################################################
+# Author: Carlos Lacaci Moya
+
+# Description: Changes journaled while the USB of a destination is not
+#              mounted and replayed once it is
+
+# Date: dom 18 oct 2026 23:41:06 CEST
+# Dependencies: See requirements.txt
+##############################################################################
+from pathlib import Path
+
+import pytest
+
+from classes import handler as handler_module
+from classes.handler import FULL_SYNC, Handler
+from classes.journal import SyncJournal
+from classes.manifest import SyncManifest
+from mount_table import MountState
+
+ORIGIN: Path = Path("/home/user/docs")
+DESTINATION: Path = Path("/backup/usb/docs")
+
+
+def test_paths_journaled_once(tmp_path):
+    journal = SyncJournal(tmp_path / "manifest.sqlite")
+
+    journal.add(ORIGIN, DESTINATION, ["a.txt", "b/c.txt"])
+    journal.add(ORIGIN, DESTINATION, ["a.txt"])
+    assert journal.pending(ORIGIN, DESTINATION) == {"a.txt", "b/c.txt"}
+    assert journal.pending(ORIGIN, Path("/other")) == set()
+
+    journal.discard(ORIGIN, DESTINATION, ["a.txt"])
+    assert journal.pending(ORIGIN, DESTINATION) == {"b/c.txt"}
+
+
+def test_too_many_paths_become_a_full_sync(tmp_path):
+    journal = SyncJournal(tmp_path / "manifest.sqlite", limit=3)
+
+    journal.add(ORIGIN, DESTINATION, ["a", "b", "c", "d"])
+    assert journal.pending(ORIGIN, DESTINATION) == {FULL_SYNC}
+
+
+@pytest.fixture
+def stick(tmp_path, monkeypatch, silent_popup):
+    """ Handler backing up to a USB with a preferred mount point outside
+    /media, not mounted yet. Returns the handler and the mountinfo file """
+
+    mountinfo: Path = tmp_path / "mountinfo"
+    mountinfo.write_text("22 1 8:1 / / rw - ext4 /dev/sda1 rw\n")
+    monkeypatch.setattr(handler_module, "mount_state",
+                        lambda: MountState(str(mountinfo), ttl=0))
+
+    origin: Path = tmp_path / "origin"
+    origin.mkdir()
+    origin.joinpath("a.txt").write_text("a")
+
+    mount_point: Path = tmp_path / "stick"
+    db_path: Path = tmp_path / "manifest.sqlite"
+    handler = Handler(origin, mount_point / "backup",
+                      backend="native",
+                      manifest=SyncManifest(db_path),
+                      journal=SyncJournal(db_path),
+                      mount_points=[str(mount_point)])
+    return handler, mountinfo
+
+
+def test_offline_changes_replayed_on_mount(stick):
+    handler, mountinfo = stick
+
+    assert handler.mount_point == mountinfo.parent / "stick"
+    assert not handler.online
+    handler._sync_changes({"a.txt"})
+
+    # Nothing written on the root filesystem while the USB is absent
+    assert not handler.mount_point.exists()
+    assert handler.journal.pending(handler.origin,
+                                   handler.destination) == {"a.txt"}
+
+    with mountinfo.open("a") as table:
+        table.write(f"98 22 8:17 / {handler.mount_point} rw - vfat "
+                    "/dev/sdb1 rw\n")
+    handler.replay()
+
+    assert handler.destination.joinpath("a.txt").read_text() == "a"
+    assert handler.journal.pending(handler.origin,
+                                   handler.destination) == set()
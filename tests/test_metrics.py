@@ -0,0 +1,70 @@
+##############################################################################
+# Author: Carlos Lacaci Moya
+
+# Description: Metrics rendered in the Prometheus text format
+
+# Date: dom 18 oct 2026 23:41:06 CEST
+# Dependencies: See requirements.txt
+##############################################################################
+import pytest
+
+from metrics import COUNTER, GAUGE, Metrics
+
+
+def test_counters_and_gauges():
+    metrics = Metrics()
+    metrics.inc("pyusb_mounts_total", "Mount attempts", device="KINGSTON",
+                status="mounted")
+    metrics.inc("pyusb_mounts_total", "Mount attempts", device="KINGSTON",
+                status="mounted")
+    metrics.set("pyusb_sync_bytes", "Bytes copied", 123456789012,
+                destination='/media/A "B"')
+    metrics.set("pyusb_mount_duration_seconds", "Duration", 0.123456789)
+
+    assert metrics.render() == (
+        "# HELP pyusb_mount_duration_seconds Duration\n"
+        "# TYPE pyusb_mount_duration_seconds gauge\n"
+        "pyusb_mount_duration_seconds 0.123456789\n"
+        "# HELP pyusb_mounts_total Mount attempts\n"
+        "# TYPE pyusb_mounts_total counter\n"
+        'pyusb_mounts_total{device="KINGSTON",status="mounted"} 2\n'
+        "# HELP pyusb_sync_bytes Bytes copied\n"
+        "# TYPE pyusb_sync_bytes gauge\n"
+        'pyusb_sync_bytes{destination="/media/A \\"B\\""} 123456789012\n')
+
+
+def test_histogram():
+    metrics = Metrics()
+    for value in (0.05, 0.7, 100.0):
+        metrics.observe("pyusb_sync_seconds", "Sync duration", value,
+                        buckets=(0.1, 1.0), destination="/media/K")
+
+    assert metrics.render().splitlines()[2:] == [
+        'pyusb_sync_seconds_bucket{destination="/media/K",le="0.1"} 1',
+        'pyusb_sync_seconds_bucket{destination="/media/K",le="1.0"} 2',
+        'pyusb_sync_seconds_bucket{destination="/media/K",le="+Inf"} 3',
+        'pyusb_sync_seconds_sum{destination="/media/K"} 100.75',
+        'pyusb_sync_seconds_count{destination="/media/K"} 3',
+    ]
+
+
+def test_collectors_and_special_values():
+    metrics = Metrics()
+    metrics.collector(lambda: [
+        (GAUGE, "pyusb_queue_depth", "Jobs waiting", 3, {"worker": "a"}),
+        (GAUGE, "pyusb_free_ratio", "Free space", float("nan"), {}),
+    ])
+    metrics.collector(lambda: 1 / 0)
+
+    lines: list = metrics.render().splitlines()
+    assert 'pyusb_queue_depth{worker="a"} 3' in lines
+    assert "pyusb_free_ratio NaN" in lines
+
+
+def test_kind_of_a_metric_is_fixed():
+    metrics = Metrics()
+    metrics.inc("pyusb_events_total", "Events")
+
+    with pytest.raises(ValueError):
+        metrics.set("pyusb_events_total", "Events", 1)
+    assert f"# TYPE pyusb_events_total {COUNTER}" in metrics.render()
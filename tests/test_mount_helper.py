@@ -0,0 +1,98 @@
+##############################################################################
+# Author: Carlos Lacaci Moya
+
+# Description: Protocol of the privileged mount helper, run with the
+#              RecordingExecutor stand-in: no root needed
+
+# Date: dom 18 oct 2026 23:41:06 CEST
+# Dependencies: See requirements.txt
+##############################################################################
+import json
+import socket
+import threading
+from pathlib import Path
+
+import pytest
+
+from mount_helper import (HelperClient, HelperServer, InvalidOperation,
+                          RecordingExecutor, privileged_operations,
+                          SudoOperations, validate)
+
+
+@pytest.fixture
+def helper(tmp_path):
+    """ Running helper and a client connected to it """
+
+    socket_path: str = str(tmp_path / "helper.sock")
+    executor = RecordingExecutor(str(tmp_path / "record.jsonl"))
+    server = HelperServer(socket_path, executor, str(tmp_path / "media"))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+
+    yield HelperClient(socket_path), executor, tmp_path / "media"
+
+    server.shutdown()
+    server.server_close()
+
+
+def test_batch_runs_in_order(helper):
+    client, executor, media = helper
+
+    results: list = client.run_batch([
+        {"op": "prepare", "path": str(media / "KINGSTON")},
+        {"op": "umount", "path": "/etc"},
+        {"op": "remove", "path": str(media / "KINGSTON")},
+    ])
+
+    assert [result.returncode for result in results] == [0, 2, 0]
+    assert "mountpoint not allowed" in results[1].stderr
+    assert [op["op"] for op in executor.operations] == ["prepare", "remove"]
+    record: list = Path(executor.record_file).read_text().splitlines()
+    assert [json.loads(line)["op"] for line in record] == \
+        ["prepare", "remove"]
+
+
+def test_mounts_are_nosuid_nodev(helper):
+    client, executor, media = helper
+
+    assert client.mount("4A2B-BE4C", media / "KINGSTON").returncode == 0
+    assert client.mount("4A2B-BE4C", media / "KINGSTON",
+                        "uid=1000,nodev,utf8").returncode == 0
+
+    assert [op["options"] for op in executor.operations] == [
+        "nosuid,nodev",
+        "uid=1000,utf8,nosuid,nodev",
+    ]
+
+
+def test_options_outside_the_whitelist_are_refused():
+    for options in ("suid", "dev", "uid=1000,exec", "loop=/dev/loop0"):
+        with pytest.raises(InvalidOperation):
+            validate({"op": "mount", "uuid": "4A2B-BE4C",
+                      "path": "/media/KINGSTON", "options": options},
+                     "/media")
+
+
+def test_bad_request(helper):
+    client, executor, media = helper
+
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(client.socket_path)
+        sock.sendall(b'{"operations": []}\n')
+        with sock.makefile("rb") as answer:
+            reply: dict = json.loads(answer.readline())
+
+    assert reply["error"].startswith("bad request")
+    assert executor.operations == []
+
+
+def test_stale_socket_falls_back_to_sudo(tmp_path):
+    socket_path: Path = tmp_path / "helper.sock"
+    assert isinstance(privileged_operations(str(socket_path)),
+                      SudoOperations)
+
+    # Left behind by a killed helper: nobody listening
+    server = HelperServer(str(socket_path), RecordingExecutor())
+    server.server_close()
+    assert socket_path.exists()
+    assert isinstance(privileged_operations(str(socket_path)),
+                      SudoOperations)
@@ -0,0 +1,72 @@
+##############################################################################
+# Author: Carlos Lacaci Moya
+
+# Description: Mount table read from a mountinfo file
+
+# Date: dom 18 oct 2026 23:41:06 CEST
+# Dependencies: See requirements.txt
+##############################################################################
+from pathlib import Path
+
+from mount_table import (MountIndex, MountState, media_mount_point,
+                         parse_mountinfo)
+
+MOUNTINFO: str = (
+    "22 1 8:1 / / rw,relatime shared:1 - ext4 /dev/sda1 rw\n"
+    "98 22 8:17 / /media/MY\\040STICK rw,nosuid master:7 shared:9 - vfat "
+    "/dev/sdb1 rw,uid=1000,utf8\n"
+    "99 22 0:5 / /media/MY\\040STICK rw - tmpfs tmpfs rw\n"
+    "not a mount line\n")
+
+
+def test_parse_mountinfo():
+    entries: list = list(parse_mountinfo(MOUNTINFO))
+
+    assert len(entries) == 3
+    stick = entries[1]
+    assert stick.source == "/dev/sdb1"
+    assert stick.mount_point == Path("/media/MY STICK")
+    assert stick.fstype == "vfat"
+    assert stick.options == ["rw", "nosuid"]
+    assert stick.super_options == ["rw", "uid=1000", "utf8"]
+    assert stick.devno == "8:17"
+
+
+def test_later_mounts_hide_the_previous_ones():
+    index = MountIndex()
+    for entry in parse_mountinfo(MOUNTINFO):
+        index.add(entry)
+
+    assert index.mounted_on("/media/MY STICK").fstype == "tmpfs"
+    assert [entry.mount_point for entry in index.mounts_of("/dev/sdb1")] \
+        == [Path("/media/MY STICK")]
+
+
+def test_mount_state_cached_until_invalidated(tmp_path):
+    mountinfo: Path = tmp_path / "mountinfo"
+    mountinfo.write_text(MOUNTINFO)
+    state = MountState(str(mountinfo), ttl=3600)
+
+    assert state.is_mounted("/media/MY STICK")
+    mountinfo.write_text(MOUNTINFO.splitlines()[0] + "\n")
+    assert state.is_mounted("/media/MY STICK")
+    assert state.reads == 1
+
+    state.invalidate()
+    assert not state.is_mounted("/media/MY STICK")
+    assert state.reads == 2
+
+
+def test_media_mount_point():
+    assert media_mount_point("/media/KINGSTON/backup") == \
+        Path("/media/KINGSTON")
+    assert media_mount_point("/run/media/user/KINGSTON/backup") == \
+        Path("/run/media/user/KINGSTON")
+    assert media_mount_point("/home/user/backup") is None
+
+    # Preferred mount points of the favorites, the deepest first
+    mount_points: list = ["/backup", "/backup/usb", ""]
+    assert media_mount_point("/backup/usb/docs", mount_points) == \
+        Path("/backup/usb")
+    assert media_mount_point("/backup/docs", mount_points) == Path("/backup")
+    assert media_mount_point("/backups", mount_points) is None
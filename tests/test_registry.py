@@ -0,0 +1,82 @@
+##############################################################################
+# Author: Carlos Lacaci Moya
+
+# Description: SQLite registry of the favorite USBs and the migration of
+#              the old usbs.dbm shelve
+
+# Date: dom 18 oct 2026 23:41:06 CEST
+# Dependencies: See requirements.txt
+##############################################################################
+import shelve
+from pathlib import Path
+
+import pytest
+
+from registry import DeviceRegistry
+
+
+@pytest.fixture
+def shelve_path(tmp_path) -> Path:
+    """ usbs.dbm of a previous version with two favorites """
+
+    old_path: Path = tmp_path / "usbs.dbm"
+    with shelve.open(str(old_path)) as old:
+        old["favorites"] = ["OLD1", "OLD2"]
+    return old_path
+
+
+def files(folder: Path) -> set:
+    return {path.name for path in folder.iterdir()}
+
+
+def test_shelve_migrated_once(tmp_path, shelve_path):
+    db_path: Path = tmp_path / "usbs.sqlite"
+
+    registry = DeviceRegistry(db_path, shelve_path)
+    assert registry.labels() == ["OLD1", "OLD2"]
+    assert not any(name.startswith("usbs.dbm") and
+                   not name.endswith(".migrated")
+                   for name in files(tmp_path))
+
+    registry.replace(["NEW"])
+    for name in ("usbs.sqlite", "usbs.sqlite-wal", "usbs.sqlite-shm"):
+        tmp_path.joinpath(name).unlink(missing_ok=True)
+
+    # The deleted favorites do not come back
+    assert DeviceRegistry(db_path, shelve_path).labels() == []
+
+
+def test_replace_keeps_what_was_learnt(tmp_path):
+    registry = DeviceRegistry(tmp_path / "usbs.sqlite",
+                              tmp_path / "usbs.dbm")
+    registry.add(["KEEP", "DROP"])
+    registry.seen("KEEP", "4A2B-BE4C", "vfat")
+
+    assert registry.replace(["KEEP", "NEW", "NEW"]) == (1, 1)
+    assert registry.labels() == ["KEEP", "NEW"]
+    assert registry.get("KEEP").uuid == "4A2B-BE4C"
+    assert registry.get("DROP") is None
+
+
+def test_empty_replace_needs_allow_empty(tmp_path):
+    registry = DeviceRegistry(tmp_path / "usbs.sqlite",
+                              tmp_path / "usbs.dbm")
+    registry.add(["KEEP"])
+
+    with pytest.raises(ValueError):
+        registry.replace([])
+    assert registry.labels() == ["KEEP"]
+
+    assert registry.replace([], allow_empty=True) == (0, 1)
+    assert registry.labels() == []
+
+
+def test_update_refuses_unknown_columns(tmp_path):
+    registry = DeviceRegistry(tmp_path / "usbs.sqlite",
+                              tmp_path / "usbs.dbm")
+    registry.add(["KINGSTON"])
+
+    registry.update("KINGSTON", mount_point="/mnt/backup")
+    assert registry.get("KINGSTON").mount_point == "/mnt/backup"
+    with pytest.raises(ValueError):
+        registry.update("KINGSTON", owner="root")
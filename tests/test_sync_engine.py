@@ -0,0 +1,136 @@
+##############################################################################
+# Author: Carlos Lacaci Moya
+
+# Description: NativeEngine mirrors origin like 'rsync -rt --delete', and
+#              the command run by RsyncEngine
+
+# Date: dom 18 oct 2026 23:41:06 CEST
+# Dependencies: See requirements.txt
+##############################################################################
+import os
+import shlex
+import subprocess
+from pathlib import Path
+
+from classes import sync_engine
+from classes.filters import PathFilter
+from classes.sync_engine import (COPIED, DELETED, MANIFEST_MARKER,
+                                 NativeEngine, RsyncEngine)
+
+
+def tree(root: Path) -> dict:
+    """ {relative path: content} of the files below root """
+
+    return {
+        str(path.relative_to(root)): path.read_text()
+        for path in sorted(root.rglob("*")) if path.is_file()
+    }
+
+
+def write(path: Path, content: str, mtime: int = 1_600_000_000) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_text(content)
+    os.utime(path, (mtime, mtime))
+
+
+def test_full_sync_copies_and_deletes(tmp_path):
+    origin, destination = tmp_path / "origin", tmp_path / "destination"
+    write(origin / "a.txt", "a")
+    write(origin / "docs" / "b.txt", "b")
+    write(destination / "stale.txt", "old")
+    write(destination / "gone" / "c.txt", "c")
+    write(destination / MANIFEST_MARKER, "token")
+
+    results: list = NativeEngine().sync(origin, destination)
+
+    assert tree(destination) == {
+        "a.txt": "a",
+        "docs/b.txt": "b",
+        MANIFEST_MARKER: "token",
+    }
+    assert {(result.path, result.action) for result in results} == {
+        ("a.txt", COPIED),
+        ("docs/b.txt", COPIED),
+        ("stale.txt", DELETED),
+        ("gone", DELETED),
+    }
+
+
+def test_mtimes_preserved_and_unchanged_files_skipped(tmp_path):
+    origin, destination = tmp_path / "origin", tmp_path / "destination"
+    write(origin / "a.txt", "a", mtime=1_500_000_000)
+    engine = NativeEngine()
+
+    engine.sync(origin, destination)
+    assert destination.joinpath("a.txt").stat().st_mtime == 1_500_000_000
+
+    assert engine.sync(origin, destination) == []
+    assert engine.stats == {"files": 0, "bytes": 0}
+
+    # Same size, newer mtime: copied again
+    write(origin / "a.txt", "b", mtime=1_500_000_100)
+    assert [result.path for result in engine.sync(origin, destination)] \
+        == ["a.txt"]
+    assert tree(destination) == {"a.txt": "b"}
+
+
+def test_modify_window(tmp_path):
+    origin, destination = tmp_path / "origin", tmp_path / "destination"
+    write(origin / "a.txt", "a", mtime=1_500_000_000)
+    write(destination / "a.txt", "z", mtime=1_500_000_001)
+
+    assert NativeEngine(modify_window=2).sync(origin, destination) == []
+    assert NativeEngine(checksum=True).sync(origin, destination)
+    assert tree(destination) == {"a.txt": "a"}
+
+
+def test_paths_only_sync_those(tmp_path):
+    origin, destination = tmp_path / "origin", tmp_path / "destination"
+    write(origin / "a.txt", "a")
+    write(origin / "b.txt", "b")
+    write(destination / "deleted.txt", "d")
+
+    results: list = NativeEngine().sync(origin, destination,
+                                        ["a.txt", "deleted.txt"])
+
+    assert {(result.path, result.action) for result in results} == {
+        ("a.txt", COPIED),
+        ("deleted.txt", DELETED),
+    }
+    assert tree(destination) == {"a.txt": "a"}
+
+
+def test_excluded_files_neither_copied_nor_deleted(tmp_path):
+    origin, destination = tmp_path / "origin", tmp_path / "destination"
+    write(origin / "keep.txt", "k")
+    write(origin / "node_modules" / "lib.js", "js")
+    write(origin / "src" / "main.o", "o")
+    write(destination / "cache.swp", "swap")
+
+    engine = NativeEngine(
+        path_filter=PathFilter(exclude=["node_modules", "*.o", "*.swp"]))
+    engine.sync(origin, destination)
+
+    assert tree(destination) == {"cache.swp": "swap", "keep.txt": "k"}
+    assert engine.sync(origin, destination, ["src/main.o"]) == []
+
+
+def test_rsync_paths_with_spaces(monkeypatch):
+    commands: list = []
+
+    def run(command: str, input: str = None) -> subprocess.CompletedProcess:
+        commands.append(command)
+        return subprocess.CompletedProcess(command, 0, "", "")
+
+    monkeypatch.setattr(sync_engine.RunCommand, "run", run)
+    engine = RsyncEngine(path_filter=PathFilter(exclude=["*.swp"]))
+
+    engine.sync(Path("/home/user/my docs"), Path("/media/MY STICK/docs"))
+    engine.sync(Path("/home/user/my docs"), Path("/media/MY STICK/docs"),
+                ["a.txt"])
+
+    for command in commands:
+        args: list = shlex.split(command)
+        assert "/home/user/my docs/" in args
+        assert "/media/MY STICK/docs/" in args
+        assert "--exclude=*.swp" in args
@@ -0,0 +1,98 @@
+##############################################################################
+# Author: Carlos Lacaci Moya
+
+# Description: Per destination sync workers: merged jobs and backpressure
+
+# Date: dom 18 oct 2026 23:41:06 CEST
+# Dependencies: See requirements.txt
+##############################################################################
+import queue
+import threading
+import time
+
+import pytest
+
+from classes.workers import DestinationWorker, SyncSupervisor
+
+
+class FakeHandler:
+    """ Records its syncs. A held handler blocks the worker until
+    release() """
+
+    def __init__(self, name: str, held: bool = False,
+                 destination: str = "/") -> None:
+        self.name: str = name
+        self.destination: str = destination
+        self.syncs: queue.Queue = queue.Queue()
+        self.started = threading.Event()
+        self._release = threading.Event()
+        if not held:
+            self._release.set()
+
+    def _sync_changes(self, paths: set) -> None:
+        self.started.set()
+        self._release.wait(10)
+        self.syncs.put(paths)
+
+    def release(self) -> None:
+        self._release.set()
+
+
+@pytest.fixture
+def worker():
+    worker = DestinationWorker("test", maxsize=1)
+    yield worker
+    worker.stop(timeout=1)
+
+
+def test_waiting_jobs_of_a_handler_are_merged(worker):
+    busy = FakeHandler("busy", held=True)
+    handler = FakeHandler("handler")
+
+    worker.submit(busy, {"x"})
+    assert busy.started.wait(5)
+    worker.submit(handler, {"a"})
+    worker.submit(handler, {"b"})
+    busy.release()
+
+    assert handler.syncs.get(timeout=5) == {"a", "b"}
+    assert worker.jobs_merged == 1
+    assert worker.jobs_submitted == 3
+
+
+def test_full_queue_blocks_submit(worker):
+    busy = FakeHandler("busy", held=True)
+    worker.submit(busy, {"x"})
+    assert busy.started.wait(5)
+    worker.submit(FakeHandler("queued"), {"a"})
+
+    blocked = threading.Thread(
+        target=worker.submit, args=(FakeHandler("blocked"), {"b"}))
+    blocked.start()
+    time.sleep(0.1)
+    assert blocked.is_alive()
+    assert worker.depth == 1
+
+    busy.release()
+    blocked.join(5)
+    assert not blocked.is_alive()
+
+
+def test_failed_sync_does_not_stop_the_worker(worker):
+    class Failing(FakeHandler):
+        def _sync_changes(self, paths: set) -> None:
+            raise OSError("disk full")
+
+    handler = FakeHandler("handler")
+    worker.submit(Failing("failing"), {"a"})
+    worker.submit(handler, {"b"})
+
+    assert handler.syncs.get(timeout=5) == {"b"}
+
+
+def test_one_worker_per_device(tmp_path):
+    supervisor = SyncSupervisor()
+    first = supervisor.worker_for(tmp_path / "a")
+    # Missing folders belong to the device of their nearest parent
+    assert supervisor.worker_for(tmp_path / "b" / "c") is first
+    supervisor.shutdown()